@@ -0,0 +1,46 @@
+'''
+Memory footprint of a synthetic fund history (daily records of 3 years for 2000 funds) with the dtypes of the CSV
+file against the compact schema of etl.catch_clean.compact_fund_data, and the time of a pivot over each one
+
+Run from the repository root: python benchmarks/fund_memory.py
+'''
+import os
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from etl.catch_clean import compact_fund_data, memory_footprint
+
+
+def fund_history(funds=2000, years=3):
+    '''
+    Fund history with the columns and dtypes of the CSV file read by pandas
+    '''
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range(end='2022-12-30', periods=252 * years)
+    cnpjs = np.array([f'{i:02d}.{i % 1000:03d}.{i // 1000:03d}/0001-{i % 100:02d}' for i in range(funds)])
+    denominations = np.array([f'FUNDO DE INVESTIMENTO {i:04d} MULTIMERCADO' for i in range(funds)])
+    fund = np.repeat(np.arange(funds), len(dates))
+    size = len(fund)
+    return pd.DataFrame({'date': np.tile(dates.values, funds), 'cnpj_fundo': cnpjs[fund],
+                         'denom_social': denominations[fund], 'vl_quota': rng.uniform(1, 10, size),
+                         'vl_patrim_liq': rng.uniform(1e6, 1e9, size), 'captc_dia': rng.uniform(0, 1e6, size),
+                         'resg_dia': rng.uniform(0, 1e6, size), 'nr_cotst': rng.integers(1, 10 ** 5, size),
+                         'vl_total': rng.uniform(1e6, 1e9, size)})
+
+
+def pivot(data):
+    return data.pivot(index='date', columns='cnpj_fundo', values='vl_quota')
+
+
+if __name__ == '__main__':
+    original = fund_history()
+    compact = compact_fund_data(original)
+    assert np.allclose(pivot(original).values, pivot(compact).values, rtol=1e-6)
+    print(f'{len(original)} records')
+    print(f'{"":<12}{"original":>10}{"compact":>10}')
+    print(f'{"memory":<12}{memory_footprint(original):>8.0f}MB{memory_footprint(compact):>8.0f}MB')
+    print(f'{"pivot":<12}{min(timeit.repeat(lambda: pivot(original), number=1, repeat=3)) * 1000:>8.0f}ms'
+          f'{min(timeit.repeat(lambda: pivot(compact), number=1, repeat=3)) * 1000:>8.0f}ms')
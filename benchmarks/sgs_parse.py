@@ -0,0 +1,80 @@
+'''
+Micro-benchmark of the parse of a 10 year daily series of the Central Bank of Brazil API (SGS), comparing the
+record by record loop with CSV output against etl.catch_clean.parse_sgs_json with Parquet output
+
+Run from the repository root: python benchmarks/sgs_parse.py
+'''
+import os
+import sys
+import json
+import timeit
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from etl.catch_clean import parse_sgs_json, read_series, write_series
+
+
+def sgs_content(years=10):
+    '''
+    JSON body with one record per business day, as returned by the SGS API for daily series (e.g. 11, 12)
+    '''
+    dates = pd.bdate_range(end='2022-12-30', periods=252 * years)
+    values = np.random.default_rng(0).uniform(0.01, 0.05, len(dates))
+    return json.dumps([{'data': day.strftime('%d/%m/%Y'), 'valor': f'{value:.6f}'} 
+                       for day, value in zip(dates, values)]).encode()
+
+
+def loop_csv(content, path):
+    '''
+    Previous download path: record by record loop, CSV file and date parse when the file is read
+    '''
+    date = list()
+    value = list()
+    for i in json.loads(content):
+        date.append(i['data'])
+        value.append(i['valor'])
+    pd.DataFrame({'date': date, '%': value}).to_csv(path, index=False)
+    data = pd.read_csv(path)
+    data['date'] = pd.to_datetime(data['date'], format='%d/%m/%Y', dayfirst=True)
+    return data
+
+
+def pandas_decode(content):
+    '''
+    Baseline decode: records loaded into a DataFrame by pandas, dates and values converted to typed columns
+    '''
+    data = pd.DataFrame(json.loads(content))
+    return pd.DataFrame({'date': pd.to_datetime(data['data'], format='%d/%m/%Y'),
+                         '%': pd.to_numeric(data['valor'], errors='coerce')})
+
+
+def vectorized_parquet(content, path):
+    '''
+    Current download path: typed columns decoded at once, Parquet file
+    '''
+    write_series(parse_sgs_json(content), path)
+    return read_series(path)
+
+
+def measure(function, *args, number=20, repeat=5):
+    return min(timeit.repeat(lambda: function(*args), number=number, repeat=repeat)) / number * 1000
+
+
+if __name__ == '__main__':
+    content = sgs_content()
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'serie.csv')
+        parquet_path = os.path.join(directory, 'serie.parquet')
+        expected = loop_csv(content, csv_path)
+        result = vectorized_parquet(content, parquet_path)
+        assert np.allclose(expected['%'].values, result['%'].values)
+        assert (expected['date'].values == result['date'].values).all()
+        assert pandas_decode(content).equals(parse_sgs_json(content))
+        print(f'{len(result)} records, {len(content) / 1024:.0f} KB')
+        print(f'{"parse":<28}{"baseline":>10}{"vectorized":>12}')
+        print(f'{"decode to typed columns":<28}{measure(pandas_decode, content):>8.2f}ms'
+              f'{measure(parse_sgs_json, content):>10.2f}ms')
+        print(f'{"download path (write+read)":<28}{measure(loop_csv, content, csv_path):>8.2f}ms'
+              f'{measure(vectorized_parquet, content, parquet_path):>10.2f}ms')
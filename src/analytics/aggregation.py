@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+
+# Aggregation periods shown in the screens and the calendar field of each one
+AGGREGATION_PERIODS = {'Ano': 'year', 'Trimestre': 'quarter', 'Mês': 'month'}
+# Aggregation functions shown in the screens and the rollup of each one
+AGGREGATION_FUNCTIONS = {'Soma': 'sum', 'Média': 'mean', 'Último': 'last', 'Composto': 'compounded'}
+
+
+def calendar_keys(dates, period: str):
+    '''
+    Calendar field used to group the rows
+
+    Parameters: dates : Array like
+                    Dates of the rows
+
+                period : String
+                    'year', 'quarter' or 'month'
+
+    Returns: NumPy array
+                Year, quarter (1 to 4) or month (1 to 12) of each row
+    '''
+    return getattr(pd.DatetimeIndex(dates), period).to_numpy()
+
+
+def calendar_rollups(data: pd.DataFrame, dates, rates=True):
+    '''
+    Precompute the sum, mean, last value and compounded growth of all the series by year, quarter and month with
+    the native groupby kernels, so changing the period or the function of a chart is only a lookup
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame with only the series, one column per series
+
+                dates : Array like
+                    Dates of the rows
+
+                rates : Boolean
+                    True when the series are rates in % (indicators), compounded as (1 + r / 100). False when the
+                    series are levels (prices, quotas), compounded from the change between consecutive rows.
+
+    Returns: Dictionary
+                (period, function) as key and Pandas DataFrame indexed by the calendar field with one column per
+                series as value
+    '''
+    data = data.astype('float64')
+    returns = data / 100 if rates else data.pct_change()
+    # Compounding is a sum of log returns, so it runs on the same groupby kernel as the other functions
+    log_returns = np.log1p(returns)
+    rollups = dict()
+    for period in AGGREGATION_PERIODS.values():
+        keys = calendar_keys(dates, period)
+        grouped = data.groupby(keys).agg(['sum', 'mean', 'last'])
+        for function in ('sum', 'mean', 'last'):
+            rollups[(period, function)] = grouped.xs(function, axis=1, level=1)
+        compounded = np.expm1(log_returns.groupby(keys).sum(min_count=1)) * 100
+        rollups[(period, 'compounded')] = compounded
+    for rollup in rollups.values():
+        rollup.index.name = None
+    return rollups
@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+from analytics.aggregation import calendar_keys
+from analytics.statistics import periods_per_year
+
+
+# Rebalancing frequencies shown in the screens and the calendar field of each one, None is buy and hold
+REBALANCING_FREQUENCIES = {'Sem rebalanceamento': None, 'Mensal': 'month', 'Trimestral': 'quarter',
+                           'Anual': 'year'}
+# Portfolio weights shown in the screens
+WEIGHTING_SCHEMES = {'Carteira teórica': 'theoretical', 'Pesos iguais': 'equal'}
+# Metrics of backtest_metrics
+BACKTEST_METRICS = ['Retorno total (%)', 'Retorno anualizado (%)', 'Volatilidade anualizada (%)',
+                    'Drawdown máximo (%)', 'Giro médio (%)', 'Tracking error (%)']
+# Elements of the (rebalances x weight sets x tickers) blocks of the turnover
+TURNOVER_BLOCK = 4 * 10 ** 6
+
+
+def growth_matrix(prices: pd.DataFrame):
+    '''
+    Cumulative growth of each ticker since the first date, missing prices inside the period repeat the last one
+
+    Parameters: prices : DataFrame
+                    Pandas DataFrame indexed by date with one column of adjusted close prices per ticker
+
+    Returns: NumPy array
+                Array (dates x tickers) equal to 1 at the first date, NaN for tickers without a price at the first
+                date
+    '''
+    values = prices.ffill().to_numpy(dtype='float64')
+    return values / values[0]
+
+
+def rebalancing_schedule(dates, frequency=None):
+    '''
+    Days when the portfolio is rebalanced to the target weights, at the close price
+
+    Parameters: dates : Array like
+                    Trading days of the backtest
+
+                frequency : String
+                    'month', 'quarter' or 'year' for the first trading day of each period, None for buy and hold
+
+    Returns: NumPy array
+                Boolean array, the first day is always a rebalance (the portfolio is built)
+    '''
+    schedule = np.zeros(len(dates), dtype=bool)
+    if frequency is not None and len(dates) > 1:
+        keys = calendar_keys(dates, frequency)
+        schedule[1:] = keys[1:] != keys[:-1]
+    schedule[:1] = True
+    return schedule
+
+
+def normalize_weights(weights, available: np.ndarray):
+    '''
+    Target weights of the tickers with prices, each weight set sums 1
+
+    Parameters: weights : Array like
+                    One weight set (tickers) or many (weight sets x tickers)
+
+                available : NumPy array
+                    Boolean array of the tickers with a price at the first date
+
+    Returns: NumPy array
+                Array (weight sets x tickers) with zero weight for the tickers without prices
+    '''
+    weights = np.atleast_2d(np.asarray(weights, dtype='float64'))
+    weights = np.where(available, weights, 0)
+    total = weights.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total != 0, weights / total, np.nan)
+
+
+def portfolio_values(growth: np.ndarray, weights: np.ndarray, schedule: np.ndarray):
+    '''
+    Value of many portfolios at once. Between two rebalances each portfolio is buy and hold, so its growth since
+    the last rebalance is the growth of the tickers since that day times the target weights: one matrix product
+    for all the dates and weight sets, chained by a cumulative product over the rebalancing days.
+
+    Parameters: growth : NumPy array
+                    Result of growth_matrix (dates x tickers)
+
+                weights : NumPy array
+                    Result of normalize_weights (weight sets x tickers)
+
+                schedule : NumPy array
+                    Result of rebalancing_schedule
+
+    Returns: values : NumPy array
+                Array (dates x weight sets) of the portfolio values, starting at 1
+             turnover : NumPy array
+                Array (rebalances x weight sets), half of the traded weight at each rebalance after the first day
+    '''
+    growth = np.nan_to_num(growth, nan=1.0)
+    positions = np.arange(len(growth))
+    # Last rebalance before each date, the growth of a date is measured from it
+    last = np.maximum.accumulate(np.where(schedule, positions, 0))
+    base = np.concatenate([[0], last[:-1]])
+    relative = growth / growth[base]
+    segment = relative @ weights.T
+    # Value at the rebalancing days is the product of the growth of the previous segments
+    chained = np.cumprod(np.where(schedule[:, None], segment, 1), axis=0)
+    values = chained[base] * segment
+    values[0] = 1
+    rebalances = np.flatnonzero(schedule[1:]) + 1
+    return values, rebalance_turnover(relative[rebalances], segment[rebalances], weights)
+
+
+def rebalance_turnover(relative: np.ndarray, segment: np.ndarray, weights: np.ndarray):
+    '''
+    Traded weight at each rebalance: the weights drifted to w * g_i / g since the last rebalance go back to w, so
+    the turnover is sum(|w| * |g - g_i|) / (2 * g). Weight sets are processed in blocks to limit the memory.
+
+    Parameters: relative : NumPy array
+                    Growth of the tickers since the last rebalance (rebalances x tickers)
+
+                segment : NumPy array
+                    Growth of the portfolios since the last rebalance (rebalances x weight sets)
+
+                weights : NumPy array
+                    Target weights (weight sets x tickers)
+
+    Returns: NumPy array
+                Array (rebalances x weight sets)
+    '''
+    turnover = np.empty_like(segment)
+    block = max(TURNOVER_BLOCK // max(relative.size, 1), 1)
+    for start in range(0, len(weights), block):
+        stop = start + block
+        gap = np.abs(segment[:, start:stop, None] - relative[:, None, :])
+        turnover[:, start:stop] = np.einsum('rkn,kn->rk', gap, np.abs(weights[start:stop]))
+    return turnover / (2 * segment)
+
+
+def backtest_metrics(values: np.ndarray, turnover: np.ndarray, dates, benchmark=None):
+    '''
+    Performance of the backtested portfolios
+
+    Parameters: values : NumPy array
+                    Portfolio values (dates x weight sets)
+
+                turnover : NumPy array
+                    Turnover at the rebalances (rebalances x weight sets)
+
+                dates : Array like
+                    Dates of the values
+
+                benchmark : NumPy array
+                    Benchmark level at the same dates (IBOVESPA), None to skip the tracking error
+
+    Returns: DataFrame
+                Pandas DataFrame with one row per weight set and the columns of BACKTEST_METRICS
+    '''
+    periods = periods_per_year(dates)
+    returns = values[1:] / values[:-1] - 1
+    years = max(len(returns), 1) / periods
+    total = values[-1] - 1
+    peak = np.maximum.accumulate(values, axis=0)
+    metrics = {'Retorno total (%)': total,
+               'Retorno anualizado (%)': values[-1] ** (1 / years) - 1,
+               'Volatilidade anualizada (%)': returns.std(axis=0, ddof=1) * np.sqrt(periods),
+               'Drawdown máximo (%)': (values / peak - 1).min(axis=0),
+               'Giro médio (%)': turnover.mean(axis=0) if len(turnover) else np.zeros(values.shape[1]),
+               'Tracking error (%)': np.full(values.shape[1], np.nan)}
+    if benchmark is not None:
+        benchmark = pd.Series(benchmark, dtype='float64').ffill().to_numpy()
+        benchmark_returns = benchmark[1:] / benchmark[:-1] - 1
+        active = returns - benchmark_returns[:, None]
+        metrics['Tracking error (%)'] = np.nanstd(active, axis=0, ddof=1) * np.sqrt(periods)
+    return pd.DataFrame(metrics)[BACKTEST_METRICS] * 100
+
+
+def backtest(prices: pd.DataFrame, weights, frequency=None, benchmark=None):
+    '''
+    Backtest of one or many weight sets over a price panel
+
+    Parameters: prices : DataFrame
+                    Pandas DataFrame indexed by date with one column of adjusted close prices per ticker
+
+                weights : Array like
+                    Target weights in the order of the columns, one set (tickers) or many (weight sets x tickers),
+                    tickers without a price at the first date are left out and the weights are rescaled
+
+                frequency : String
+                    Rebalancing frequency of rebalancing_schedule
+
+                benchmark : Pandas Series
+                    Benchmark level indexed by date, None to skip the tracking error
+
+    Returns: values : DataFrame
+                Pandas DataFrame indexed by date with the value of each weight set, starting at 1
+             metrics : DataFrame
+                Result of backtest_metrics
+    '''
+    growth = growth_matrix(prices)
+    weights = normalize_weights(weights, ~np.isnan(growth[0]) if len(growth) else np.ones(prices.shape[1], bool))
+    if len(growth) == 0:
+        return pd.DataFrame(index=prices.index), pd.DataFrame(columns=BACKTEST_METRICS)
+    values, turnover = portfolio_values(growth, weights, rebalancing_schedule(prices.index, frequency))
+    if benchmark is not None:
+        benchmark = benchmark.reindex(prices.index).ffill().bfill().to_numpy()
+    metrics = backtest_metrics(values, turnover, prices.index, benchmark)
+    return pd.DataFrame(values, index=prices.index), metrics
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+
+
+# Correlation methods shown in the screens
+CORRELATION_METHODS = {'Período completo': 'full', 'Janela móvel': 'rolling', 'Exponencial (EWM)': 'ewm'}
+
+
+def to_returns(data: pd.DataFrame, rates=True):
+    '''
+    Returns of the series, correlation of price levels is dominated by the common trend
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame with only the series, one column per series
+
+                rates : Boolean
+                    True when the series already are rates in % (indicators), False when they are levels (prices,
+                    quotas)
+
+    Returns: DataFrame
+                Pandas DataFrame of returns, same index and columns of data
+    '''
+    data = data.astype('float64')
+    if rates:
+        return data
+    returns = data.pct_change()
+    # A level equal to zero gives an infinite return
+    return returns.replace([np.inf, -np.inf], np.nan)
+
+
+def correlation_matrix(returns: pd.DataFrame):
+    '''
+    Pearson correlation of all pairs of series with matrix products over the valid records of each pair, the same
+    result of DataFrame.corr() in one NumPy pass
+
+    Parameters: returns : DataFrame
+                    Pandas DataFrame of returns, one column per series
+
+    Returns: DataFrame
+                Correlation matrix, NaN for pairs with less than 3 common records
+    '''
+    values = returns.to_numpy(dtype='float64')
+    valid = (~np.isnan(values)).astype('float64')
+    values = np.where(valid > 0, values, 0)
+    # Sums over the rows where both series have a value
+    count = valid.T @ valid
+    sum_x = values.T @ valid
+    sum_xx = (values ** 2).T @ valid
+    sum_xy = values.T @ values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sum_xy - sum_x * sum_x.T / count
+        variance_x = sum_xx - sum_x ** 2 / count
+        correlation = covariance / np.sqrt(variance_x * variance_x.T)
+    correlation[count < 3] = np.nan
+    correlation = np.clip(correlation, -1, 1)
+    np.fill_diagonal(correlation, np.where(np.diag(count) >= 3, 1, np.nan))
+    return pd.DataFrame(correlation, index=returns.columns, columns=returns.columns)
+
+
+def cluster_order(correlation: pd.DataFrame):
+    '''
+    Order of the series by hierarchical clustering (average linkage over the distance sqrt((1 - corr) / 2)), so
+    correlated series are side by side in the heatmap
+
+    Parameters: correlation : DataFrame
+                    Correlation matrix
+
+    Returns: List
+                Series in the clustered order
+    '''
+    if len(correlation) < 3:
+        return list(correlation.index)
+    # Pairs without correlation are treated as uncorrelated
+    distance = np.sqrt((1 - correlation.fillna(0).to_numpy()) / 2)
+    np.fill_diagonal(distance, 0)
+    tree = linkage(squareform(distance, checks=False), method='average')
+    return list(correlation.index[leaves_list(tree)])
+
+
+def top_pairs(correlation: pd.DataFrame, k=10):
+    '''
+    Pairs with the strongest correlation, positive or negative
+
+    Parameters: correlation : DataFrame
+                    Correlation matrix
+
+                k : Integer
+                    Number of pairs
+
+    Returns: DataFrame
+                Pandas DataFrame with the columns Série 1, Série 2 and Correlação ordered by absolute correlation
+    '''
+    rows, columns = np.triu_indices(len(correlation), k=1)
+    values = correlation.to_numpy()[rows, columns]
+    keep = ~np.isnan(values)
+    rows, columns, values = rows[keep], columns[keep], values[keep]
+    order = np.argsort(-np.abs(values), kind='stable')[:k]
+    return pd.DataFrame({'Série 1': correlation.index[rows[order]], 'Série 2': correlation.columns[columns[order]],
+                         'Correlação': values[order]})
+
+
+def pair_correlation(returns: pd.DataFrame, pairs: pd.DataFrame, method='rolling', window=12):
+    '''
+    Correlation over time of some pairs, all pairs at once with the column-wise rolling or exponentially weighted
+    kernels of Pandas
+
+    Parameters: returns : DataFrame
+                    Pandas DataFrame of returns, one column per series
+
+                pairs : DataFrame
+                    Result of top_pairs
+
+                method : String
+                    'rolling' for a window of the last records or 'ewm' for exponential weights with span window
+
+                window : Integer
+                    Records of the rolling window or span of the exponential weights
+
+    Returns: DataFrame
+                Pandas DataFrame indexed as returns with one column '<serie 1> x <serie 2>' per pair
+    '''
+    labels = [f'{first} x {second}' for first, second in zip(pairs['Série 1'], pairs['Série 2'])]
+    first = returns[list(pairs['Série 1'])].set_axis(labels, axis=1)
+    second = returns[list(pairs['Série 2'])].set_axis(labels, axis=1)
+    if method == 'ewm':
+        return first.ewm(span=window, min_periods=window).corr(second)
+    return first.rolling(window, min_periods=window).corr(second)
@@ -0,0 +1,143 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.seasonal import STL
+
+
+# Decomposition models and backends shown in the screens
+DECOMPOSITION_MODELS = {'Aditivo': 'additive', 'Multiplicativo': 'multiplicative'}
+DECOMPOSITION_BACKENDS = {'Média móvel': 'moving_average', 'STL': 'stl'}
+
+
+class DecompositionError(ValueError):
+    '''
+    The series can not be decomposed, the message is the reason shown to the user
+    '''
+
+
+def series_fingerprint(series: pd.Series):
+    '''
+    Hash of the dates and values of a series, identifies the input of a decomposition
+
+    Parameters: series : Pandas Series
+                    Series indexed by date
+
+    Returns: String
+                Hexadecimal SHA-1 of the series
+    '''
+    digest = hashlib.sha1(pd.DatetimeIndex(series.index).asi8.tobytes())
+    digest.update(series.to_numpy(dtype='float64').tobytes())
+    return digest.hexdigest()
+
+
+def monthly_mean(series: pd.Series):
+    '''
+    Mean of the records of each month
+
+    Parameters: series : Pandas Series
+                    Daily series indexed by date
+
+    Returns: Pandas Series
+                Monthly series indexed by the last day of the month
+    '''
+    return series.groupby(pd.Grouper(freq='M')).mean()
+
+
+def moving_average_decompose(values: np.ndarray, period: int, model='additive'):
+    '''
+    Classical decomposition (the method of statsmodels seasonal_decompose) in pure NumPy: centered moving average
+    trend and the mean of the detrended values of each position of the cycle as seasonality
+
+    Parameters: values : NumPy array
+                    Values of the series without missing records
+
+                period : Integer
+                    Records of one cycle
+
+                model : String
+                    'additive' or 'multiplicative'
+
+    Returns: Tuple
+                Trend, seasonal and residual NumPy arrays, the trend and residual are NaN in the first and last
+                period / 2 records
+    '''
+    if period % 2 == 0:
+        weights = np.r_[0.5, np.ones(period - 1), 0.5] / period
+    else:
+        weights = np.ones(period) / period
+    trend = np.full(len(values), np.nan)
+    offset = len(weights) // 2
+    trend[offset:len(values) - offset] = np.convolve(values, weights, mode='valid')
+    detrended = values - trend if model == 'additive' else values / trend
+    # One row per cycle, the last cycle padded with NaN
+    cycles = np.full(-(-len(values) // period) * period, np.nan)
+    cycles[:len(values)] = detrended
+    averages = np.nanmean(cycles.reshape(-1, period), axis=0)
+    averages = averages - averages.mean() if model == 'additive' else averages / averages.mean()
+    seasonal = np.resize(averages, len(values))
+    resid = detrended - seasonal if model == 'additive' else detrended / seasonal
+    return trend, seasonal, resid
+
+
+def stl_decompose(values: np.ndarray, period: int, model='additive'):
+    '''
+    Robust STL decomposition of statsmodels, the multiplicative model is the additive model of the logarithm
+
+    Parameters: values : NumPy array
+                    Values of the series without missing records
+
+                period : Integer
+                    Records of one cycle
+
+                model : String
+                    'additive' or 'multiplicative'
+
+    Returns: Tuple
+                Trend, seasonal and residual NumPy arrays
+    '''
+    if model == 'multiplicative':
+        result = STL(np.log(values), period=period, robust=True).fit()
+        return np.exp(result.trend), np.exp(result.seasonal), np.exp(result.resid)
+    result = STL(values, period=period, robust=True).fit()
+    return result.trend, result.seasonal, result.resid
+
+
+def decompose(series: pd.Series, period=12, model='additive', backend='moving_average'):
+    '''
+    Trend, seasonality and residual of a series
+
+    Parameters: series : Pandas Series
+                    Series indexed by date
+
+                period : Integer
+                    Records of one cycle, 12 for monthly series
+
+                model : String
+                    'additive' or 'multiplicative'
+
+                backend : String
+                    'moving_average' (fast, pure NumPy) or 'stl' (statsmodels, robust to outliers)
+
+    Returns: DataFrame
+                Pandas DataFrame indexed by date with the columns trend, seasonal and resid
+
+    Raises: DecompositionError
+                When the series is too short, has missing records or is not positive for the multiplicative model
+    '''
+    # Missing records at the ends only shorten the series
+    valid = series.notna().to_numpy()
+    if valid.any():
+        series = series.iloc[valid.argmax():len(valid) - valid[::-1].argmax()]
+    values = series.to_numpy(dtype='float64')
+    if len(values) < 2 * period:
+        raise DecompositionError(f'São necessários ao menos 2 ciclos completos ({2 * period} registros), a série '
+                                 f'possui {len(values)}!')
+    if np.isnan(values).any():
+        raise DecompositionError(f'A série possui {int(np.isnan(values).sum())} registros faltantes no período!')
+    if model == 'multiplicative' and (values <= 0).any():
+        raise DecompositionError('O modelo multiplicativo exige apenas valores positivos!')
+    if backend == 'stl':
+        trend, seasonal, resid = stl_decompose(values, period, model)
+    else:
+        trend, seasonal, resid = moving_average_decompose(values, period, model)
+    return pd.DataFrame({'trend': trend, 'seasonal': seasonal, 'resid': resid}, index=series.index)
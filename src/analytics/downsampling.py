@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+
+# Points of a time series chart by resolution, shared by all its series, None sends every record
+CHART_RESOLUTIONS = {'Padrão': 1500, 'Baixa': 600, 'Alta': 4000, 'Completa': None}
+# Points of a chart at the default resolution
+CHART_POINTS = CHART_RESOLUTIONS['Padrão']
+# Points by series kept when the chart has many series
+MIN_SERIES_POINTS = 100
+# Periods of the candles of a long window, from the shortest
+OHLC_PERIODS = ['W-FRI', 'M', 'Q']
+
+
+def series_points(chart_points, series: int):
+    '''
+    Points by series of a chart, the points of the chart are split among its series
+
+    Parameters: chart_points : Integer
+                    Points of the chart (CHART_RESOLUTIONS), None for full resolution
+
+                series : Integer
+                    Number of series of the chart
+
+    Returns: Integer
+                Maximum points by series, at least MIN_SERIES_POINTS, None for full resolution
+    '''
+    if chart_points is None:
+        return None
+    return max(chart_points // max(series, 1), MIN_SERIES_POINTS)
+
+
+def minmax_indices(y: np.ndarray, max_points: int):
+    '''
+    Min/max bucketing: the series is split into max_points / 2 buckets of consecutive records and the minimum and
+    maximum of each bucket are kept, so every peak and valley of the series is preserved
+
+    Parameters: y : NumPy array
+                    Values of the series without missing records
+
+                max_points : Integer
+                    Maximum number of points kept
+
+    Returns: NumPy array
+                Sorted positions of the kept records, always including the first and the last
+    '''
+    n = len(y)
+    # Two records by bucket plus the first and the last
+    buckets = max(min((max_points - 2) // 2, n), 1)
+    edges = np.linspace(0, n, buckets + 1).astype('int64')
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    # Inside each bucket the records are ordered by value, the first is the minimum and the last the maximum
+    order = np.lexsort((y, bucket))
+    return np.unique(np.concatenate([order[edges[:-1]], order[edges[1:] - 1], [0, n - 1]]))
+
+
+def downsample(data: pd.DataFrame, max_points=None):
+    '''
+    Reduce the points of each series of a chart with min/max bucketing, series with up to max_points records are
+    kept at full resolution
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame indexed by the x axis (dates) with one column per series
+
+                max_points : Integer
+                    Maximum number of points by series, None to keep all points
+
+    Returns: DataFrame
+                Pandas DataFrame in long format with the columns of the x axis (name of the index), variable (name of
+                the series) and value, ready for px.line(x=..., y='value', color='variable')
+    '''
+    x_name = data.index.name or 'index'
+    traces = list()
+    for column in data.columns:
+        serie = data[column].dropna()
+        if max_points is not None and len(serie) > max_points:
+            serie = serie.iloc[minmax_indices(serie.to_numpy(dtype='float64'), max_points)]
+        traces.append(pd.DataFrame({x_name: serie.index, 'variable': column, 'value': serie.to_numpy()}))
+    if not traces:
+        return pd.DataFrame(columns=[x_name, 'variable', 'value'])
+    return pd.concat(traces, ignore_index=True)
+
+
+def ohlc_bars(prices: pd.DataFrame, max_bars: int):
+    '''
+    Merge daily candles into weekly, monthly or quarterly candles, the shortest period with up to max_bars candles.
+    Open is the first, high the maximum, low the minimum and close the last price of the period, so the candles are
+    exact and not a sample of the days.
+
+    Parameters: prices : DataFrame
+                    Pandas DataFrame indexed by date with Open, High, Low and Close columns
+
+                max_bars : Integer
+                    Maximum number of candles
+
+    Returns: bars : DataFrame
+                Pandas DataFrame with the Open, High, Low and Close columns of the candles, indexed by the last day
+                of the period
+             period : String
+                Pandas frequency of the candles, None when the daily candles are kept
+    '''
+    if len(prices) <= max_bars:
+        return prices, None
+    for period in OHLC_PERIODS:
+        bars = prices.resample(period).agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last'})
+        bars = bars.dropna(how='all')
+        if len(bars) <= max_bars:
+            break
+    return bars, period
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+
+
+# Frequencies of the flow cubes
+FLOW_FREQUENCIES = {'Diária': 'diario', 'Mensal': 'mensal'}
+# Columns of the flow cubes, flows and net worth in R$, fluxo_pl in % of the net worth of the previous record and
+# fluxo_acum the net flow accumulated since the first record of the fund
+CUBE_COLUMNS = ['date', 'cnpj_fundo', 'captc_dia', 'resg_dia', 'fluxo_liq', 'fluxo_pl', 'vl_patrim_liq', 'nr_cotst',
+                'var_cotst', 'fluxo_acum']
+# Columns of FlowCube.ranking
+RANKING_COLUMNS = ['captação líquida', 'captação líquida (% PL)', 'variação de cotistas',
+                   'variação de cotistas (%)', 'patrimônio líquido', 'cotistas', 'início', 'fim']
+# Ranking criteria of the funds screen
+RANKING_METRICS = {'Captação líquida (R$)': 'captação líquida', 'Captação líquida (% PL)': 'captação líquida (% PL)',
+                   'Variação de cotistas (Nº)': 'variação de cotistas',
+                   'Variação de cotistas (%)': 'variação de cotistas (%)'}
+
+
+def flow_table(dates, codes: np.ndarray, inflow, outflow, net_worth, shareholders):
+    '''
+    Flow cube of records sorted by fund and date: net flow, flow as a percentage of the previous net worth, change
+    of shareholders and cumulative net flow
+
+    Parameters: dates : Array like
+                    Date of each record
+
+                codes : NumPy array
+                    Integer code of the fund of each record, sorted
+
+                inflow : Array like
+                    Subscriptions (captc_dia)
+
+                outflow : Array like
+                    Redemptions (resg_dia)
+
+                net_worth : Array like
+                    Net worth at the end of the record (vl_patrim_liq)
+
+                shareholders : Array like
+                    Shareholders at the end of the record (nr_cotst)
+
+    Returns: Dictionary
+                NumPy arrays by column of CUBE_COLUMNS, except cnpj_fundo
+    '''
+    inflow = np.asarray(inflow, dtype='float64')
+    outflow = np.asarray(outflow, dtype='float64')
+    net_worth = np.asarray(net_worth, dtype='float64')
+    shareholders = np.asarray(shareholders, dtype='float64')
+    net_flow = np.nan_to_num(inflow) - np.nan_to_num(outflow)
+    # The previous record of the first record of a fund belongs to another fund
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = codes[1:] != codes[:-1]
+    previous_worth = np.where(first, np.nan, np.roll(net_worth, 1))
+    previous_shareholders = np.where(first, np.nan, np.roll(shareholders, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        flow_pct = np.where(previous_worth > 0, net_flow / previous_worth * 100, np.nan)
+    return {'date': np.asarray(dates),
+            'captc_dia': inflow,
+            'resg_dia': outflow,
+            'fluxo_liq': net_flow,
+            'fluxo_pl': flow_pct,
+            'vl_patrim_liq': net_worth,
+            'nr_cotst': shareholders,
+            'var_cotst': shareholders - previous_shareholders,
+            # Sums of any run of records of a fund are differences of this column, it restarts at each fund to
+            # keep the precision of small windows
+            'fluxo_acum': pd.Series(net_flow).groupby(codes).cumsum().to_numpy()}
+
+
+def flow_cubes(history: pd.DataFrame):
+    '''
+    Daily and monthly flow cubes of all the funds in one vectorized pass over the fund history
+
+    Parameters: history : DataFrame
+                    Fund history in the order of etl.fund_index.index_order (sorted by CNPJ and date, categorical
+                    cnpj_fundo) with the columns captc_dia, resg_dia, vl_patrim_liq and nr_cotst
+
+    Returns: daily : DataFrame
+                Pandas DataFrame with the columns of CUBE_COLUMNS, one record by fund and date
+             monthly : DataFrame
+                Pandas DataFrame with the columns of CUBE_COLUMNS, one record by fund and month dated on the first
+                day of the month: flows are the sums of the month, net worth and shareholders the last of the month
+    '''
+    cnpj = pd.Categorical(history['cnpj_fundo'])
+    codes = cnpj.codes.astype('int64')
+    daily = flow_table(history['date'], codes, history['captc_dia'], history['resg_dia'], history['vl_patrim_liq'],
+                       history['nr_cotst'])
+    daily['cnpj_fundo'] = cnpj
+    months = pd.DatetimeIndex(history['date']).to_period('M').to_timestamp().to_numpy()
+    # Records of a fund and month are contiguous, each group ends where the fund or the month changes
+    ends = np.flatnonzero(np.r_[(codes[1:] != codes[:-1]) | (months[1:] != months[:-1]), True])
+    starts = np.r_[0, ends[:-1] + 1]
+    sums = {column: np.add.reduceat(np.nan_to_num(daily[column]), starts) if len(starts) else np.array([])
+            for column in ['captc_dia', 'resg_dia']}
+    monthly = flow_table(months[starts], codes[starts], sums['captc_dia'], sums['resg_dia'],
+                         daily['vl_patrim_liq'][ends], daily['nr_cotst'][ends])
+    monthly['cnpj_fundo'] = cnpj[starts]
+    return pd.DataFrame(daily)[CUBE_COLUMNS], pd.DataFrame(monthly)[CUBE_COLUMNS]
+
+
+class FlowCube:
+    '''
+    Flow cube sorted by fund and date with a search key, so the records of every fund in a window are found by
+    binary search and the flows of the window are differences of the cumulative net flow: a ranking of all the funds
+    does not scan nor group the history.
+    '''
+    def __init__(self, cube: pd.DataFrame, monthly=False):
+        '''
+        :param cube: Daily or monthly flow cube of flow_cubes
+        :param monthly: True for the monthly cube, the windows are extended to whole months
+        '''
+        cnpj = pd.Categorical(cube['cnpj_fundo'])
+        codes = cnpj.codes.astype('int64')
+        days = np.asarray(cube['date'], dtype='datetime64[D]').astype('int64')
+        self._origin = days.min() if len(days) else 0
+        self._span = (days.max() - self._origin + 2) if len(days) else 1
+        keys = codes * self._span + (days - self._origin)
+        order = None
+        if np.any(keys[1:] < keys[:-1]):
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+        self._keys = keys
+        self._columns = {column: np.asarray(cube[column]) if order is None else np.asarray(cube[column])[order]
+                         for column in CUBE_COLUMNS if column != 'cnpj_fundo'}
+        self._codes = codes if order is None else codes[order]
+        self._cnpjs = cnpj.categories
+        self._monthly = monthly
+
+
+    def window_keys(self, start_date, end_date):
+        '''
+        Search keys of the window of every fund
+        '''
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        if self._monthly:
+            start, end = start.to_period('M').start_time, end.to_period('M').start_time
+        funds = np.arange(len(self._cnpjs), dtype='int64') * self._span
+        start_day = np.clip(start.to_datetime64().astype('datetime64[D]').astype('int64') - self._origin, -1,
+                            self._span - 1)
+        end_day = np.clip(end.to_datetime64().astype('datetime64[D]').astype('int64') - self._origin, -1,
+                          self._span - 1)
+        return funds + max(start_day, 0), funds + end_day
+
+
+    def ranking(self, start_date, end_date, metric='captação líquida', top=20, ascending=False):
+        '''
+        Funds with the highest (inflows) or lowest (outflows) flows in a window
+
+        Parameters: start_date : String or datetime
+                        First date of the window
+
+                    end_date : String or datetime
+                        Last date of the window
+
+                    metric : String
+                        Column of RANKING_COLUMNS used to rank the funds
+
+                    top : Integer
+                        Funds to return
+
+                    ascending : Boolean
+                        False for the highest values, True for the lowest ones
+
+        Returns: DataFrame
+                    Pandas DataFrame indexed by cnpj_fundo with the columns of RANKING_COLUMNS. Percentages are
+                    relative to the record before the window, or to the first record of the window for the funds
+                    that start inside it
+        '''
+        first_key, last_key = self.window_keys(start_date, end_date)
+        first = np.searchsorted(self._keys, first_key, side='left')
+        last = np.searchsorted(self._keys, last_key, side='right') - 1
+        found = last >= first
+        funds, first, last = np.flatnonzero(found), first[found], last[found]
+        columns = self._columns
+        # Record before the window when it belongs to the same fund
+        before = np.maximum(first - 1, 0)
+        has_before = (first > 0) & (self._codes[before] == funds)
+        cumulative = columns['fluxo_acum']
+        net_flow = cumulative[last] - np.where(has_before, cumulative[before], 0)
+        base = np.where(has_before, before, first)
+        base_worth = columns['vl_patrim_liq'][base]
+        base_shareholders = columns['nr_cotst'][base]
+        shareholders = columns['nr_cotst'][last]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ranking = pd.DataFrame({'captação líquida': net_flow,
+                                    'captação líquida (% PL)': np.where(base_worth > 0,
+                                                                        net_flow / base_worth * 100, np.nan),
+                                    'variação de cotistas': shareholders - base_shareholders,
+                                    'variação de cotistas (%)': np.where(base_shareholders > 0,
+                                                                         (shareholders / base_shareholders - 1) * 100,
+                                                                         np.nan),
+                                    'patrimônio líquido': columns['vl_patrim_liq'][last],
+                                    'cotistas': shareholders,
+                                    'início': columns['date'][first],
+                                    'fim': columns['date'][last]},
+                                   index=pd.Index(self._cnpjs[funds], name='cnpj_fundo'))
+        values = ranking[metric].dropna()
+        values = values.nsmallest(top) if ascending else values.nlargest(top)
+        return ranking.loc[values.index, RANKING_COLUMNS]
+
+
+    def select(self, cnpjs: list, start_date=None, end_date=None):
+        '''
+        Records of the cube of the selected funds and period
+
+        Parameters: cnpjs : List of string
+                        Selected CNPJs
+
+                    start_date : String or datetime
+                        First date to keep, None to keep all history
+
+                    end_date : String or datetime
+                        Last date to keep, None to keep all history
+
+        Returns: DataFrame
+                    Pandas DataFrame with the columns of CUBE_COLUMNS ordered by CNPJ and date
+        '''
+        first_key, last_key = self.window_keys(start_date or pd.Timestamp.min.ceil('D'),
+                                               end_date or pd.Timestamp.max.floor('D'))
+        codes = self._cnpjs.get_indexer(cnpjs)
+        codes = codes[codes >= 0]
+        first = np.searchsorted(self._keys, first_key[codes], side='left')
+        last = np.searchsorted(self._keys, last_key[codes], side='right')
+        positions = [np.arange(start, end) for start, end in zip(first, last)]
+        positions = np.concatenate(positions) if positions else np.array([], dtype='int64')
+        data = {column: values[positions] for column, values in self._columns.items()}
+        data['cnpj_fundo'] = self._cnpjs[self._codes[positions]]
+        return pd.DataFrame(data)[CUBE_COLUMNS]
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+
+# Normalization bases shown in the screens and the method of each one
+NORMALIZATION_OPTIONS = {'Primeiro registro': 'first', 'Base 100': 'base100', 'Log-retorno': 'log',
+                         'Data base': 'date'}
+# Value of the normalized series at the base
+BASE_LEVEL = {'first': 1, 'base100': 100, 'log': 0, 'date': 1}
+
+
+def base_rows(block: np.ndarray, start=0):
+    '''
+    Position of the first valid value of each column at or after a row
+
+    Parameters: block : NumPy array
+                    2D array of the series, one column per series
+
+                start : Integer
+                    First row considered
+
+    Returns: Tuple
+                Positions of the base row of each column and mask of the columns without any valid value
+    '''
+    valid = ~np.isnan(block[start:])
+    return valid.argmax(axis=0) + start, ~valid.any(axis=0)
+
+
+def normalize(data: pd.DataFrame, method='first', base_date=None, dates=None):
+    '''
+    Normalize all the series at once dividing the block by its base row with a NumPy broadcast. The base of each
+    series is its first valid value, so series starting with NaN are based on their first record.
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame with only the series to normalize
+
+                method : String
+                    'first' divides by the first record, 'base100' rebases to 100, 'log' gives the log return since
+                    the first record and 'date' divides by the first record at or after base_date
+
+                base_date : String or datetime
+                    Base date of the 'date' method
+
+                dates : Array like
+                    Dates of the rows, the index of data is used when it is None
+
+    Returns: DataFrame
+                Pandas DataFrame with the normalized series, same index and columns of data
+    '''
+    block = data.to_numpy(dtype='float64')
+    if block.size == 0:
+        return data.astype('float64')
+    start = 0
+    if method == 'date' and base_date is not None:
+        dates = pd.DatetimeIndex(data.index if dates is None else dates)
+        start = min(int(dates.searchsorted(pd.Timestamp(base_date))), max(len(dates) - 1, 0))
+    rows, empty = base_rows(block, start)
+    base = block[rows, np.arange(block.shape[1])]
+    base[empty] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = block / base
+        if method == 'base100':
+            normalized *= 100
+        elif method == 'log':
+            normalized = np.log(normalized)
+    return pd.DataFrame(normalized, index=data.index, columns=data.columns)
+
+
+def normalized_growth(normalized: pd.DataFrame, method='first'):
+    '''
+    Growth of each normalized series in the period: last valid value minus the value at the base
+
+    Parameters: normalized : DataFrame
+                    Result of normalize
+
+                method : String
+                    Normalization method used
+
+    Returns: Pandas Series
+                Growth by series, a ratio for 'first' and 'date', percentage points for 'base100' and log return
+                for 'log'
+    '''
+    block = normalized.to_numpy(dtype='float64')
+    if block.size == 0:
+        return pd.Series(np.nan, index=normalized.columns)
+    valid = ~np.isnan(block)
+    last = block.shape[0] - 1 - valid[::-1].argmax(axis=0)
+    growth = block[last, np.arange(block.shape[1])] - BASE_LEVEL[method]
+    growth[~valid.any(axis=0)] = np.nan
+    return pd.Series(growth, index=normalized.columns)
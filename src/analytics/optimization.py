@@ -0,0 +1,386 @@
+import numpy as np
+import pandas as pd
+
+
+# Covariance estimators shown in the screens
+COVARIANCE_METHODS = {'Ledoit-Wolf': 'ledoit_wolf', 'Correlação constante': 'constant_correlation',
+                      'Amostral': 'sample'}
+# Portfolios of the efficient frontier
+FRONTIER_POINTS = 25
+
+
+class OptimizationError(ValueError):
+    '''
+    The portfolio can not be optimized with the selected data
+    '''
+
+
+def sample_covariance(returns: np.ndarray):
+    '''
+    Maximum likelihood covariance (divided by the number of records) and the centered returns
+
+    Parameters: returns : NumPy array
+                    Returns without missing values (records x assets)
+
+    Returns: covariance : NumPy array
+                Covariance matrix
+             centered : NumPy array
+                Returns minus the mean of each asset
+    '''
+    centered = returns - returns.mean(axis=0)
+    return centered.T @ centered / len(returns), centered
+
+
+def ledoit_wolf(returns: np.ndarray):
+    '''
+    Shrinkage of the sample covariance to a scaled identity with the optimal intensity of Ledoit and Wolf (2004)
+
+    Parameters: returns : NumPy array
+                    Returns without missing values (records x assets)
+
+    Returns: NumPy array
+                Shrunk covariance matrix
+    '''
+    covariance, centered = sample_covariance(returns)
+    records, assets = centered.shape
+    target = np.trace(covariance) / assets * np.eye(assets)
+    distance = ((covariance - target) ** 2).sum()
+    squared = centered ** 2
+    error = ((squared.T @ squared).sum() / records - (covariance ** 2).sum()) / records
+    intensity = 0 if distance == 0 else min(error, distance) / distance
+    return intensity * target + (1 - intensity) * covariance
+
+
+def constant_correlation(returns: np.ndarray):
+    '''
+    Shrinkage of the sample covariance to the constant correlation model with the optimal intensity of Ledoit and
+    Wolf (2003), the target keeps the variances and uses the average correlation for all pairs
+
+    Parameters: returns : NumPy array
+                    Returns without missing values (records x assets)
+
+    Returns: NumPy array
+                Shrunk covariance matrix
+    '''
+    covariance, centered = sample_covariance(returns)
+    records, assets = centered.shape
+    variance = np.diag(covariance)
+    deviation = np.sqrt(variance)
+    correlation = covariance / np.outer(deviation, deviation)
+    mean_correlation = (correlation.sum() - assets) / (assets * (assets - 1))
+    target = mean_correlation * np.outer(deviation, deviation)
+    np.fill_diagonal(target, variance)
+    squared = centered ** 2
+    # Asymptotic variances of the sample covariances (pi) and covariances with the target (rho)
+    pi = squared.T @ squared / records - covariance ** 2
+    theta = (centered ** 3).T @ centered / records - variance[:, None] * covariance
+    np.fill_diagonal(theta, 0)
+    rho = np.trace(pi) + mean_correlation * (np.outer(1 / deviation, deviation) * theta).sum()
+    gamma = ((covariance - target) ** 2).sum()
+    intensity = 0 if gamma == 0 else max(0, min(1, (pi.sum() - rho) / gamma / records))
+    return intensity * target + (1 - intensity) * covariance
+
+
+def estimate_covariance(returns: pd.DataFrame, method='ledoit_wolf'):
+    '''
+    Covariance of the returns over the dates where all the assets have a return
+
+    Parameters: returns : DataFrame
+                    Pandas DataFrame of returns, one column per asset
+
+                method : String
+                    'sample', 'ledoit_wolf' or 'constant_correlation'
+
+    Returns: DataFrame
+                Covariance matrix by period of the returns
+
+    Raises: OptimizationError
+                When there are less records than needed to estimate it
+    '''
+    values = returns.dropna().to_numpy(dtype='float64')
+    if len(values) < 3:
+        raise OptimizationError('são necessários pelo menos 3 registros com retorno de todas as ações')
+    estimators = {'sample': lambda data: sample_covariance(data)[0], 'ledoit_wolf': ledoit_wolf,
+                  'constant_correlation': constant_correlation}
+    return pd.DataFrame(estimators[method](values), index=returns.columns, columns=returns.columns)
+
+
+def box_qp(hessian: np.ndarray, linear: np.ndarray, max_weight: float, start: np.ndarray, tolerance=1e-10):
+    '''
+    Minimize w' H w / 2 + c' w with the weights summing 1 and 0 <= w <= max_weight by a primal active set method:
+    the assets at a bound are fixed, the others solve the equality constrained problem (one KKT linear system) and
+    the bounds are added or released one at a time. A feasible start close to the solution (the solution of a
+    nearby problem) needs only a few iterations.
+
+    Parameters: hessian : NumPy array
+                    Positive definite matrix H
+
+                linear : NumPy array
+                    Linear term c
+
+                max_weight : Float
+                    Upper bound of each weight
+
+                start : NumPy array
+                    Feasible initial weights
+
+                tolerance : Float
+                    Tolerance of the steps and of the multipliers
+
+    Returns: NumPy array
+                Optimal weights
+
+    Raises: OptimizationError
+                When the method does not converge
+    '''
+    assets = len(linear)
+    weights = start.astype('float64').copy()
+    # -1 fixed at zero, 1 fixed at the upper bound, 0 free
+    state = np.where(weights <= tolerance, -1, np.where(weights >= max_weight - tolerance, 1, 0))
+    for _ in range(10 * assets + 100):
+        gradient = hessian @ weights + linear
+        free = np.flatnonzero(state == 0)
+        step = np.zeros(assets)
+        if len(free):
+            system = np.zeros((len(free) + 1, len(free) + 1))
+            system[:-1, :-1] = hessian[np.ix_(free, free)]
+            system[:-1, -1] = system[-1, :-1] = 1
+            solution = np.linalg.solve(system, np.append(-gradient[free], 0))
+            step[free], budget = solution[:-1], solution[-1]
+        if np.abs(step).max() > tolerance:
+            # Longest step inside the bounds, the first bound reached is fixed
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = np.where(step < 0, -weights / step,
+                                  np.where(step > 0, (max_weight - weights) / step, np.inf))
+            blocking = int(np.argmin(ratios))
+            length = min(1.0, ratios[blocking])
+            weights += length * step
+            if length < 1:
+                state[blocking] = -1 if step[blocking] < 0 else 1
+                weights[blocking] = 0 if step[blocking] < 0 else max_weight
+            continue
+        lower = np.flatnonzero(state == -1)
+        upper = np.flatnonzero(state == 1)
+        if not len(free):
+            # Every asset at a bound: the budget multiplier is any value between the fixed gradients
+            low = (-gradient[lower]).max() if len(lower) else -np.inf
+            high = (-gradient[upper]).min() if len(upper) else np.inf
+            if low <= high + tolerance:
+                return weights
+            budget = low if len(lower) else high
+        # Multipliers of the bounds: an asset at zero that lowers the objective when bought or an asset at the
+        # upper bound that lowers it when sold is released
+        violation = np.zeros(assets)
+        violation[lower] = -(gradient[lower] + budget)
+        violation[upper] = gradient[upper] + budget
+        worst = int(np.argmax(violation))
+        if violation[worst] <= tolerance * (1 + np.abs(gradient).max()):
+            return weights
+        state[worst] = 0
+    raise OptimizationError('o otimizador não convergiu')
+
+
+def minimum_variance(covariance: np.ndarray, max_weight=1.0):
+    '''
+    Long only portfolio with the lowest variance
+
+    Parameters: covariance : NumPy array
+                    Covariance matrix
+
+                max_weight : Float
+                    Upper bound of each weight
+
+    Returns: NumPy array
+                Weights
+    '''
+    assets = len(covariance)
+    return box_qp(2 * covariance, np.zeros(assets), max_weight, np.full(assets, 1 / assets))
+
+
+def maximum_return(expected: np.ndarray, max_weight=1.0):
+    '''
+    Long only portfolio with the highest expected return: the best assets filled up to the upper bound
+    '''
+    weights = np.zeros(len(expected))
+    remaining = 1.0
+    for asset in np.argsort(-expected):
+        weights[asset] = min(max_weight, remaining)
+        remaining -= weights[asset]
+        if remaining <= 0:
+            break
+    return weights
+
+
+def frontier_path(expected: np.ndarray, covariance: np.ndarray, max_weight=1.0):
+    '''
+    Solver of the efficient portfolios parameterized by the risk aversion: minimize w' S w - a * mu' w, a = 0 is
+    the minimum variance portfolio and a large a the maximum return one. The bounds do not depend on a, so each
+    solve starts from the previous solution.
+
+    Parameters: expected : NumPy array
+                    Expected return of each asset
+
+                covariance : NumPy array
+                    Covariance matrix
+
+                max_weight : Float
+                    Upper bound of each weight
+
+    Returns: solve : Function
+                Weights of the efficient portfolio of an aversion, warm started from the last solve
+             highest : Float
+                Aversion of the maximum return portfolio
+    '''
+    # A small ridge keeps the KKT systems solvable when there are less records than assets
+    hessian = 2 * (covariance + 1e-10 * np.trace(covariance) / len(covariance) * np.eye(len(covariance)))
+    last = [minimum_variance(covariance, max_weight)]
+
+    def solve(aversion: float):
+        last[0] = box_qp(hessian, -aversion * expected, max_weight, last[0])
+        return last[0]
+
+    target = expected @ maximum_return(expected, max_weight)
+    highest = 1.0
+    while expected @ solve(highest) < target - 1e-9 * (1 + abs(target)) and highest < 1e12:
+        highest *= 4
+    solve(0.0)
+    return solve, highest
+
+
+def efficient_frontier(expected: np.ndarray, covariance: np.ndarray, max_weight=1.0, points=FRONTIER_POINTS):
+    '''
+    Efficient portfolios from the minimum variance to the maximum return portfolio, traced with warm started
+    solves of increasing risk aversion
+
+    Parameters: expected : NumPy array
+                    Expected return of each asset
+
+                covariance : NumPy array
+                    Covariance matrix
+
+                max_weight : Float
+                    Upper bound of each weight
+
+                points : Integer
+                    Number of portfolios
+
+    Returns: NumPy array
+                Weights (portfolios x assets)
+    '''
+    solve, highest = frontier_path(expected, covariance, max_weight)
+    # Quadratic spacing, the frontier bends near the minimum variance portfolio
+    return np.array([solve(highest * step ** 2) for step in np.linspace(0, 1, points)])
+
+
+def maximum_sharpe(expected: np.ndarray, covariance: np.ndarray, risk_free=0.0, max_weight=1.0):
+    '''
+    Long only portfolio with the highest Sharpe ratio. It is an efficient portfolio and the Sharpe ratio along
+    the frontier has a single peak, so it is found by a golden section search over the risk aversion with warm
+    started solves.
+
+    Parameters: expected : NumPy array
+                    Expected return of each asset
+
+                covariance : NumPy array
+                    Covariance matrix
+
+                risk_free : Float
+                    Risk-free return in the period of the returns
+
+                max_weight : Float
+                    Upper bound of each weight
+
+    Returns: NumPy array
+                Weights
+
+    Raises: OptimizationError
+                When no asset has a return above the risk-free rate
+    '''
+    if not (expected > risk_free).any():
+        raise OptimizationError('nenhuma ação tem retorno esperado acima do CDI')
+    solve, highest = frontier_path(expected, covariance, max_weight)
+
+    def sharpe(step: float):
+        weights = solve(highest * step ** 2)
+        return (expected @ weights - risk_free) / np.sqrt(weights @ covariance @ weights), weights
+
+    ratio = (np.sqrt(5) - 1) / 2
+    low, high = 0.0, 1.0
+    inner_low, inner_high = high - ratio * (high - low), low + ratio * (high - low)
+    value_low, value_high = sharpe(inner_low)[0], sharpe(inner_high)[0]
+    while high - low > 1e-4:
+        if value_low < value_high:
+            low, inner_low, value_low = inner_low, inner_high, value_high
+            inner_high = low + ratio * (high - low)
+            value_high = sharpe(inner_high)[0]
+        else:
+            high, inner_high, value_high = inner_high, inner_low, value_low
+            inner_low = high - ratio * (high - low)
+            value_low = sharpe(inner_low)[0]
+    candidates = [sharpe(step) for step in (0.0, (low + high) / 2, 1.0)]
+    return max(candidates, key=lambda candidate: candidate[0])[1]
+
+
+def optimize_portfolio(prices: pd.DataFrame, method='ledoit_wolf', risk_free=0.0, max_weight=1.0, periods=252,
+                       points=FRONTIER_POINTS):
+    '''
+    Mean-variance optimization of the assets: minimum variance and maximum Sharpe portfolios and the efficient
+    frontier, all annualized
+
+    Parameters: prices : DataFrame
+                    Pandas DataFrame indexed by date with one column of adjusted close prices per asset
+
+                method : String
+                    Covariance estimator of estimate_covariance
+
+                risk_free : Float
+                    Risk-free return a year, as a fraction
+
+                max_weight : Float
+                    Upper bound of each weight
+
+                periods : Integer
+                    Periods in a year
+
+                points : Integer
+                    Portfolios of the frontier
+
+    Returns: Dictionary
+                'assets': Pandas DataFrame indexed by asset with retorno and volatilidade,
+                'portfolios': Pandas DataFrame indexed by portfolio (Mínima variância, Máximo Sharpe) with retorno,
+                volatilidade, sharpe and the weight of each asset,
+                'frontier': Pandas DataFrame with the same columns, one row per portfolio of the frontier.
+                Returns, volatilities and weights are fractions.
+
+    Raises: OptimizationError
+                When the portfolio can not be optimized
+    '''
+    if prices.shape[1] < 2:
+        raise OptimizationError('selecione pelo menos duas ações')
+    if max_weight * prices.shape[1] < 1 - 1e-9:
+        raise OptimizationError('o peso máximo não permite investir toda a carteira')
+    returns = prices.astype('float64').pct_change().iloc[1:]
+    covariance = estimate_covariance(returns, method).to_numpy() * periods
+    expected = returns.mean().to_numpy() * periods
+    solutions = {'Mínima variância': minimum_variance(covariance, max_weight)}
+    try:
+        solutions['Máximo Sharpe'] = maximum_sharpe(expected, covariance, risk_free, max_weight)
+    except OptimizationError:
+        # Without excess returns the tangency portfolio does not exist
+        pass
+    frontier = efficient_frontier(expected, covariance, max_weight, points)
+
+    def summary(weights: np.ndarray):
+        weights = np.atleast_2d(weights)
+        expected_return = weights @ expected
+        volatility = np.sqrt(np.einsum('pi,ij,pj->p', weights, covariance, weights))
+        table = pd.DataFrame(weights, columns=prices.columns)
+        table.insert(0, 'sharpe', (expected_return - risk_free) / volatility)
+        table.insert(0, 'volatilidade', volatility)
+        table.insert(0, 'retorno', expected_return)
+        return table
+
+    portfolios = summary(np.array(list(solutions.values())))
+    portfolios.index = list(solutions)
+    assets = pd.DataFrame({'retorno': expected, 'volatilidade': np.sqrt(np.diag(covariance))}, index=prices.columns)
+    return {'assets': assets, 'portfolios': portfolios, 'frontier': summary(frontier)}
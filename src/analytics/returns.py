@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+
+# Nominal indices deflated by each inflation index in the real returns
+NOMINAL_INDICES = ['CDI', 'Poupança']
+INFLATION_INDICES = ['IPCA', 'INPC']
+# Months of the trailing window
+TRAILING_WINDOW = 12
+
+
+def accumulated(rates: pd.DataFrame):
+    '''
+    Compounded rate of each series in the period, (1 + r1) * (1 + r2) * ... - 1, records without value do not
+    change the accumulation
+
+    Parameters: rates : DataFrame
+                    Pandas DataFrame with rates in %, one column per series
+
+    Returns: Pandas Series
+                Accumulated rate in % by series
+    '''
+    log_returns = np.log1p(rates.to_numpy(dtype='float64') / 100)
+    return pd.Series(np.expm1(np.nansum(log_returns, axis=0)) * 100, index=rates.columns)
+
+
+def real_rate(nominal, inflation):
+    '''
+    Rate deflated by inflation, (1 + nominal) / (1 + inflation) - 1
+
+    Parameters: nominal : Array like
+                    Nominal rates in %
+
+                inflation : Array like
+                    Inflation rates in % of the same periods
+
+    Returns: Array like
+                Real rates in %
+    '''
+    return ((1 + nominal / 100) / (1 + inflation / 100) - 1) * 100
+
+
+def returns_panel(data: pd.DataFrame, indices: list, window=TRAILING_WINDOW):
+    '''
+    Compounded index factor and trailing accumulated rate of every series, and the same for the real rates of
+    NOMINAL_INDICES against INFLATION_INDICES. All the series are computed at once with cumprod and a rolling
+    sum of log returns.
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame with a date column and the monthly rates in % of the indices
+
+                indices : List of string
+                    Columns of the indices
+
+                window : Integer
+                    Months of the trailing accumulated rate
+
+    Returns: DataFrame
+                Pandas DataFrame with date, the rates, '<serie> fator' (compounded factor since the first record)
+                and '<serie> 12m' (accumulated rate in % of the last window months) columns, where serie is an
+                index or '<nominal> real <inflation>'
+    '''
+    rates = data[indices].astype('float64')
+    for nominal in NOMINAL_INDICES:
+        for inflation in INFLATION_INDICES:
+            if nominal in rates.columns and inflation in rates.columns:
+                rates[f'{nominal} real {inflation}'] = real_rate(rates[nominal], rates[inflation])
+    # Missing records keep the factor, but the trailing rate is only shown with the whole window
+    factors = (1 + rates / 100).fillna(1).cumprod()
+    trailing = np.expm1(np.log1p(rates / 100).rolling(window, min_periods=window).sum()) * 100
+    panel = pd.concat([data[['date']], rates, factors.add_suffix(' fator'),
+                       trailing.add_suffix(f' {window}m')], axis=1)
+    return panel.reset_index(drop=True)
+
+
+def update_returns_panel(panel: pd.DataFrame, data: pd.DataFrame, indices: list, window=TRAILING_WINDOW):
+    '''
+    Update a panel of returns_panel with new or revised months, only the rows from the first changed month are
+    computed again (plus the previous window months needed by the trailing
+    rates and the factors)
+
+    Parameters: panel : DataFrame
+                    Panel computed before, None to compute the whole panel
+
+                data : DataFrame
+                    Pandas DataFrame with a date column and the monthly rates in % of the indices
+
+                indices : List of string
+                    Columns of the indices
+
+                window : Integer
+                    Months of the trailing accumulated rate
+
+    Returns: DataFrame
+                Panel of all rows of data
+    '''
+    data = data.sort_values('date').reset_index(drop=True)
+    if panel is None or panel.empty or not set(indices).issubset(panel.columns):
+        return returns_panel(data, indices, window)
+    stored = panel.set_index('date')[indices].reindex(data['date']).to_numpy(dtype='float64')
+    same = np.isclose(stored, data[indices].to_numpy(dtype='float64'), equal_nan=True).all(axis=1)
+    if same.all() and len(panel) == len(data):
+        return panel
+    first = int(np.argmin(same)) if not same.all() else len(panel)
+    if first == 0 or not panel['date'].iloc[:first].equals(data['date'].iloc[:first]):
+        return returns_panel(data, indices, window)
+    # The rows before first only give the history of the trailing window and the factor to continue from
+    history = max(first - window, 0)
+    new = returns_panel(data.iloc[history:], indices, window)
+    factor_columns = [column for column in new.columns if column.endswith(' fator')]
+    scale = panel[factor_columns].iloc[first - 1] / new[factor_columns].iloc[first - 1 - history]
+    new[factor_columns] = new[factor_columns] * scale
+    return pd.concat([panel.iloc[:first], new.iloc[first - history:]]).reset_index(drop=True)
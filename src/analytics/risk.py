@@ -0,0 +1,165 @@
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+# Confidence of the Value at Risk
+CONFIDENCE = 0.95
+# Trading days of the rolling volatility (3 months)
+VOLATILITY_WINDOW = 63
+# Columns of risk_metrics, volatilities and returns in % a year, VaR and CVaR in % of one day
+RISK_COLUMNS = ['registros', 'início', 'fim', 'volatilidade anual', 'volatilidade 3m', 'VaR histórico',
+                'CVaR histórico', 'VaR paramétrico', 'CVaR paramétrico', 'beta', 'sharpe', 'sortino']
+
+
+def daily_risk_free(dates, cdi: pd.DataFrame):
+    '''
+    Daily risk-free rate from the monthly CDI, the rate of the month is spread over its business days
+
+    Parameters: dates : Array like
+                    Dates of the returns
+
+                cdi : DataFrame
+                    Pandas DataFrame with date (first day of the month) and % columns, as read_series('cdi.csv')
+
+    Returns: NumPy array
+                Daily rate as a fraction for each date, the last published month is used for the newer dates
+    '''
+    dates = pd.DatetimeIndex(dates)
+    months = dates.to_period('M')
+    monthly = pd.Series(cdi['%'].to_numpy() / 100, index=pd.DatetimeIndex(cdi['date']).to_period('M'))
+    monthly = monthly[~monthly.index.duplicated(keep='last')].sort_index()
+    rate = monthly.reindex(months.unique().sort_values().union(monthly.index)).ffill().reindex(months).to_numpy()
+    first = months.to_timestamp().to_numpy().astype('datetime64[D]')
+    following = (months + 1).to_timestamp().to_numpy().astype('datetime64[D]')
+    return (1 + rate) ** (1 / np.busday_count(first, following)) - 1
+
+
+def pairwise_beta(returns: np.ndarray, benchmark: np.ndarray):
+    '''
+    Beta of each column to the benchmark over the dates where both have a return
+
+    Parameters: returns : NumPy array
+                    Returns (dates x series)
+
+                benchmark : NumPy array
+                    Benchmark returns by date
+
+    Returns: NumPy array
+                Beta of each series, NaN with less than 3 common dates
+    '''
+    valid = ~np.isnan(returns) & ~np.isnan(benchmark)[:, None]
+    count = valid.sum(axis=0)
+    x = np.where(valid, benchmark[:, None], 0)
+    y = np.where(valid, returns, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = x.sum(axis=0) / count
+        mean_y = y.sum(axis=0) / count
+        covariance = (x * y).sum(axis=0) / count - mean_x * mean_y
+        variance = (x * x).sum(axis=0) / count - mean_x ** 2
+        beta = covariance / variance
+    return np.where(count >= 3, beta, np.nan)
+
+
+def period_bound(dates: pd.DatetimeIndex, positions: np.ndarray, count: np.ndarray):
+    '''
+    Date of the first or last return of each series, NaT for series without returns
+    '''
+    bound = np.full(len(positions), np.datetime64('NaT'), dtype='datetime64[ns]')
+    bound[count > 0] = dates.to_numpy()[positions[count > 0]]
+    return bound
+
+
+def risk_metrics(levels: pd.DataFrame, benchmark=None, risk_free=None, confidence=CONFIDENCE,
+                 window=VOLATILITY_WINDOW, periods=252):
+    '''
+    Risk and risk-adjusted return of all the series in one vectorized pass over the returns matrix
+
+    Parameters: levels : DataFrame
+                    Pandas DataFrame indexed by date with one column of levels (adjusted prices, quotas) per series
+
+                benchmark : Pandas Series
+                    Benchmark level indexed by date (IBOVESPA), None to skip the beta
+
+                risk_free : NumPy array
+                    Daily risk-free rate of each date (daily_risk_free), None for zero
+
+                confidence : Float
+                    Confidence of the VaR and CVaR
+
+                window : Integer
+                    Records of the rolling volatility
+
+                periods : Integer
+                    Periods in a year
+
+    Returns: DataFrame
+                Pandas DataFrame indexed by series with the columns of RISK_COLUMNS. VaR and CVaR are losses
+                (positive) in % of one period, volatilities in % a year, beta, Sharpe and Sortino (a year) against
+                the risk-free rate
+    '''
+    values = levels.to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Missing days do not break the returns, the return of the gap is assigned to the next record
+        filled = pd.DataFrame(values).ffill().to_numpy()
+        returns = filled[1:] / filled[:-1] - 1
+    returns[np.isnan(values[1:]) | ~np.isfinite(returns)] = np.nan
+    dates = levels.index[1:]
+    excess = returns - (0 if risk_free is None else np.asarray(risk_free)[1:, None])
+    alpha = 1 - confidence
+    valid = ~np.isnan(returns)
+    count = valid.sum(axis=0)
+    positions = np.arange(len(dates))[:, None]
+    first = np.where(valid, positions, len(dates)).min(axis=0)
+    last = np.where(valid, positions, -1).max(axis=0)
+    with warnings.catch_warnings():
+        # Series without returns give NaN metrics
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean = np.nanmean(returns, axis=0)
+        std = np.nanstd(returns, axis=0, ddof=1)
+        quantile = np.nanpercentile(returns, alpha * 100, axis=0)
+        tail = np.nanmean(np.where(returns <= quantile, returns, np.nan), axis=0)
+        rolling = pd.DataFrame(returns).rolling(window, min_periods=window // 2).std().to_numpy()
+        latest = np.where(last >= 0, rolling[np.maximum(last, 0), np.arange(returns.shape[1])], np.nan)
+        excess_mean = np.nanmean(excess, axis=0)
+        downside = np.sqrt(np.nanmean(np.minimum(excess, 0) ** 2, axis=0))
+        z = norm.ppf(alpha)
+        beta = np.full(returns.shape[1], np.nan)
+        if benchmark is not None:
+            index = benchmark.reindex(levels.index).ffill().to_numpy(dtype='float64')
+            beta = pairwise_beta(returns, index[1:] / index[:-1] - 1)
+        metrics = pd.DataFrame({'registros': count,
+                                'início': period_bound(dates, first, count),
+                                'fim': period_bound(dates, last, count),
+                                'volatilidade anual': std * np.sqrt(periods) * 100,
+                                'volatilidade 3m': latest * np.sqrt(periods) * 100,
+                                'VaR histórico': -quantile * 100,
+                                'CVaR histórico': -tail * 100,
+                                'VaR paramétrico': -(mean + z * std) * 100,
+                                'CVaR paramétrico': -(mean - std * norm.pdf(z) / alpha) * 100,
+                                'beta': beta,
+                                'sharpe': excess_mean / np.nanstd(excess, axis=0, ddof=1) * np.sqrt(periods),
+                                'sortino': excess_mean * periods / (downside * np.sqrt(periods))},
+                               index=levels.columns)
+    return metrics[RISK_COLUMNS]
+
+
+def rolling_volatility(levels: pd.DataFrame, window=VOLATILITY_WINDOW, periods=252):
+    '''
+    Annualized volatility of the returns in a rolling window
+
+    Parameters: levels : DataFrame
+                    Pandas DataFrame indexed by date with one column of levels per series
+
+                window : Integer
+                    Records of the window
+
+                periods : Integer
+                    Periods in a year
+
+    Returns: DataFrame
+                Pandas DataFrame indexed as levels with the volatility in % a year
+    '''
+    returns = levels.astype('float64').pct_change()
+    return returns.rolling(window, min_periods=window // 2).std() * np.sqrt(periods) * 100
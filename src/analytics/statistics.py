@@ -0,0 +1,98 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+
+STAT_COLUMNS = ['registros', 'min', 'max', 'range', 'média', 'desvio padrão', 'Q1', 'Q2', 'Q3']
+# Optional statistics shown in the screens and the column of each one
+EXTRA_STATS = {'Assimetria': 'assimetria', 'Curtose': 'curtose', 'Volatilidade anualizada': 'volatilidade anual',
+               'Drawdown máximo': 'drawdown máximo'}
+
+
+def periods_per_year(dates):
+    '''
+    Number of periods in a year from the typical spacing of the dates
+
+    Parameters: dates : Array like
+                    Dates of the series
+
+    Returns: Integer
+                252 for daily, 52 for weekly, 12 for monthly and 1 for yearly series
+    '''
+    dates = pd.DatetimeIndex(dates)
+    if len(dates) < 2:
+        return 252
+    spacing = np.median(np.diff(dates.values).astype('timedelta64[D]').astype('float64'))
+    if spacing <= 4:
+        return 252
+    if spacing <= 8:
+        return 52
+    if spacing <= 32:
+        return 12
+    return 1
+
+
+def max_drawdown(block: np.ndarray):
+    '''
+    Largest fall from a previous peak of each column
+
+    Parameters: block : NumPy array
+                    2D array of levels (prices, quotas), one column per series
+
+    Returns: NumPy array
+                Maximum drawdown of each column as a negative fraction
+    '''
+    # Missing values keep the previous level so they do not break the running peak
+    levels = pd.DataFrame(block).ffill().to_numpy()
+    peaks = np.fmax.accumulate(levels, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nanmin(levels / peaks - 1, axis=0)
+
+
+def describe(data: pd.DataFrame, extras=(), dates=None):
+    '''
+    Central tendency and dispersion statistics of all the series in one vectorized pass
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame with only the series, one column per series
+
+                extras : List of string
+                    Optional statistics, keys or values of EXTRA_STATS
+
+                dates : Array like
+                    Dates of the rows used to annualize the volatility, the index of data is used when it is None
+
+    Returns: DataFrame
+                Pandas DataFrame with one row per series and the columns registros, min, max, range, média,
+                desvio padrão, Q1, Q2, Q3 followed by the selected extras
+    '''
+    block = data.to_numpy(dtype='float64')
+    if block.shape[0] == 0:
+        # A row of NaN gives the statistics of an empty period
+        block = np.full((1, block.shape[1]), np.nan)
+    with warnings.catch_warnings():
+        # Series without any value give NaN statistics
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        quartiles = np.nanpercentile(block, [25, 50, 75], axis=0)
+        minimum = np.nanmin(block, axis=0)
+        maximum = np.nanmax(block, axis=0)
+        stats = pd.DataFrame({'registros': (~np.isnan(block)).sum(axis=0),
+                              'min': minimum,
+                              'max': maximum,
+                              'range': maximum - minimum,
+                              'média': np.nanmean(block, axis=0),
+                              'desvio padrão': np.nanstd(block, axis=0, ddof=1),
+                              'Q1': quartiles[0], 'Q2': quartiles[1], 'Q3': quartiles[2]},
+                             index=data.columns)
+        extras = [EXTRA_STATS.get(extra, extra) for extra in extras]
+        if 'assimetria' in extras:
+            stats['assimetria'] = data.skew().values
+        if 'curtose' in extras:
+            stats['curtose'] = data.kurt().values
+        if 'volatilidade anual' in extras:
+            returns = data.pct_change()
+            dates = data.index if dates is None else dates
+            stats['volatilidade anual'] = returns.std().values * np.sqrt(periods_per_year(dates))
+        if 'drawdown máximo' in extras:
+            stats['drawdown máximo'] = max_drawdown(block)
+    return stats
@@ -1,20 +1,8 @@
 import streamlit as st
-from etl.catch_clean import carteira_ibov
-from etl.catch_clean import BrazilianIndicators
+from etl.data_layer import load_carteira, load_indicators, load_fund_index
 from screens.economic_index import economic_index_screen
 from screens.stock_price import stock_price_screen
 from screens.funds import funds_screen
-from etl.catch_clean import read_fund_data
-
-
-#============================================IBOVESPA Indexers===========================================
-carteira = carteira_ibov('./data/carteira_ibov.csv', cols=['Código']).copy()
-
-#============================================Economy indexers============================================
-data = BrazilianIndicators()
-data.clean_data_bcb()
-data.clean_data_ibge()
-data = data.data_frame_indicators() 
 
 
 def main():
@@ -26,14 +14,14 @@ def main():
     indicator = st.sidebar.selectbox('Indicadores', indicators)
     # Screens options
     # ============================Economics indices visualizations============================
+    # Datasets are loaded once per process and data version by the data layer
     if indicator == 'Índices Econômicos':
-        economic_index_screen(data)
+        economic_index_screen(load_indicators())
     # ============================Stocks prices visualizations============================
     elif indicator == 'Ações IBOVESPA':
-        stock_price_screen(carteira)
+        stock_price_screen(load_carteira())
     elif indicator == 'Fundos':
-        df_funds = read_fund_data('https://bitbucket.org/marcos_rmg/largedata/raw/65a1af3d452651c9775ba8538e49d59ce0c1b38b/fundos.csv')
-        funds_screen(df_funds)
+        funds_screen(load_fund_index())
 
     # Footer
     st.markdown('[GitHub](https://github.com/MarcosRMG/Investments)')
@@ -1,9 +1,14 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from statsmodels.tsa.seasonal import seasonal_decompose
 from data_viz.data_analysis import DataAnalysis
-from etl.catch_clean import data_aggregation
+from etl.data_layer import load_decomposition, load_rollups
+from analytics.aggregation import AGGREGATION_PERIODS
+from analytics.returns import accumulated
+from analytics.statistics import describe, periods_per_year
+from analytics.decomposition import DecompositionError, monthly_mean
+from analytics.downsampling import CHART_POINTS, downsample, series_points
+from data_viz.data_analysis import downsampling_note
 from pandas.io.formats.style import Styler
 
 
@@ -12,7 +17,7 @@ class AnalysisSeries(DataAnalysis):
     Analyzes the time series of the selected indicator(s)
     '''
     def __init__(self, data, start_date, end_date, axis_y, axis_x='date', x_label='', y_label='%',
-                 data_norm=pd.DataFrame()):
+                 data_norm=pd.DataFrame(), dataset=None, rates=True):
         '''
         :param data: DataFrame Pandas of the time series with monthly indicators
         :param start_date: Start date to analysis
@@ -22,15 +27,21 @@ class AnalysisSeries(DataAnalysis):
         :param x_label: Label x of serie
         :param y_label: Label y of serie
         :param data_norm: Pandas DataFrame with normalization format
+        :param dataset: Identification of the data in the rollups cache (name and selection), None to not cache
+        :param rates: True when the series are rates in %, False when they are levels
         '''
         super().__init__(data, start_date, end_date, axis_y, data_norm)
         self._axis_x = axis_x
         self._x_label = x_label
         self._y_label = y_label
+        self._dataset = dataset
+        self._rates = rates
+        # Whole history, used by the decomposition
+        self._history = data
         self._data = data.loc[(data['date'] >= self._start_date) & (data['date'] <= self._end_date)]
 
 
-    def time_series(self, legend_x_position=1.02, legend_y_position=1):
+    def time_series(self, legend_x_position=1.02, legend_y_position=1, chart_points=CHART_POINTS):
         '''
         Visualize the selected indicator
 
@@ -40,15 +51,20 @@ class AnalysisSeries(DataAnalysis):
                     legend_y_position: Float
                         The y position of legend in visualization
 
+                    chart_points : Integer
+                        Points of the chart sent to the browser, shared by the series, None for full resolution
+
         Returns: Plotly Line Chart
                     Line chart for one or many indicators
         ''' 
         # Visualization
         if self._data_norm.empty:
-            data = self._data.copy()
+            data = self._data
         else:
-            data = self._data_norm.copy()
-        fig = px.line(data, x=self._axis_x, y=self._axis_y)
+            data = self._data_norm
+        max_points = series_points(chart_points, len(self._axis_y))
+        data = downsample(data.set_index(self._axis_x)[list(self._axis_y)], max_points=max_points)
+        fig = px.line(data, x=self._axis_x, y='value', color='variable')
         annotations = list()
         annotations.append(dict(xref='paper', yref='paper', x=0.5, y=-0.1,
                               xanchor='center', yanchor='top',
@@ -60,14 +76,31 @@ class AnalysisSeries(DataAnalysis):
         fig.update_layout(xaxis_title=self._x_label,
                         yaxis_title=self._y_label,
                         annotations=annotations,
-                        legend=dict(x=legend_x_position, y=legend_y_position))
+                        legend=dict(x=legend_x_position, y=legend_y_position),
+                        legend_title='')
         st.plotly_chart(fig, use_container_width=True)
+        downsampling_note(self._data, max_points)
+
+
+    def normalize_time_series(self, method='first', base_date=None):
+        '''
+        Transforms the selected series into normalized form, the dates of the rows are taken from axis_x
+
+        Parameters: method : String
+                        Normalization base: 'first', 'base100', 'log' or 'date' (see analytics.normalization)
+
+                    base_date : Datetime
+                        Base date of the 'date' method
+        '''
+        super().normalize_time_series(method=method, base_date=base_date, dates=self._data[self._axis_x])
 
 
-    def descriptive_statistics(self):
+    def descriptive_statistics(self, extras=()):
         '''
-        Central tendency and dispersion statistics information
+        Central tendency and dispersion statistics information of all selected series in one table
 
+        Parameters: extras : List of string
+                        Optional statistics of analytics.statistics.EXTRA_STATS
 
         Returns: Pandas DataFrame
                     DataFrame with following columns: 
@@ -79,20 +112,20 @@ class AnalysisSeries(DataAnalysis):
                         Q2: median 
                         Q3: third quartile 
                         max: maximum                     
+                    followed by the selected extras
         '''
-        if len(self._axis_y) > 1:
-            for ticker in self._axis_y:
-                df_stats = self._data[[ticker]].describe().T.round(2)
-                df_stats.columns = ['registros', 'média', 'desvio padrão', 'min', 'Q1', 'Q2', 'Q3', 'max']
-                df_stats['range'] = df_stats['max'] - df_stats['min']
-                df_stats = df_stats[['registros', 'min', 'max', 'range', 'média', 'desvio padrão', 'Q1', 'Q2', 'Q3']]
-                st.dataframe(df_stats.style.format('{:.2f}'))    
-        else:
-            df_stats = self._data[self._axis_y].describe().T.round(2)
-            df_stats.columns = ['registros', 'média', 'desvio padrão', 'min', 'Q1', 'Q2', 'Q3', 'max']
-            df_stats['range'] = df_stats['max'] - df_stats['min']
-            df_stats = df_stats[['registros', 'min', 'max', 'range', 'média', 'desvio padrão', 'Q1', 'Q2', 'Q3']]
-            st.dataframe(df_stats.style.format('{:.2f}'))
+        df_stats = describe(self._data[list(self._axis_y)], extras=extras, dates=self._data[self._axis_x])
+        st.dataframe(df_stats.style.format('{:.2f}'))
+
+
+    def correlation_data(self):
+        '''
+        Series of the correlation analysis indexed by date
+
+        Returns: Tuple
+                    Pandas DataFrame with the selected series and True when they are rates in %
+        '''
+        return self._data.set_index(self._axis_x)[list(self._axis_y)], self._rates
 
 
     def histogram_view(self):
@@ -123,21 +156,31 @@ class AnalysisSeries(DataAnalysis):
         st.plotly_chart(fig, use_container_width=True)
 
 
-    def barplot_view(self, aggregation: str, function):
+    def barplot_view(self, aggregation: str, function: str):
         '''
         Financial market indicator with Barplot by year
 
+        Parameters: aggregation : String
+                        'Ano', 'Trimestre' or 'Mês'
+
+                    function : String
+                        Rollup of analytics.aggregation.AGGREGATION_FUNCTIONS: 'sum', 'mean', 'last' or 'compounded'
+
         Returns: Plotly Barplot Chart
                     Barplot chart for one or many indicators with options to aggregate by year, quarter or
-                    month, with sum or mean.
+                    month, with sum, mean, last value or compounded growth.
         '''
-        data = self._data.copy()
-        data_agg = data_aggregation(data=data, aggregation=aggregation, function=function)
+        # All the series of the window are aggregated once and served from the cache
+        series = [column for column in self._data.columns if column != self._axis_x]
+        rollups = load_rollups(self._dataset, self._data[series], self._data[self._axis_x], self._start_date, 
+                               self._end_date, rates=self._rates)
+        data_agg = rollups[(AGGREGATION_PERIODS[aggregation], function)][list(self._axis_y)]
+        y_label = '%' if function == 'compounded' else self._y_label
         
-        fig = px.bar(data_agg, x=data_agg.index, y=self._axis_y, barmode='group')
+        fig = px.bar(data_agg, x=data_agg.index, y=list(self._axis_y), barmode='group')
         fig.update_layout(
             xaxis_title=aggregation,
-            yaxis_title=self._y_label,
+            yaxis_title=y_label,
             xaxis=dict(type='category'))
         st.plotly_chart(fig, use_container_width=True)
 
@@ -147,46 +190,43 @@ class AnalysisSeries(DataAnalysis):
         Print the metric referal to accumulated time series
 
         Returns: DataFrame
-                    Pandas DataFrame with the sum of series records
+                    Pandas DataFrame with the compounded rate of the series in the period
         ''' 
-        dic = dict()
-        for indexers in self._axis_y:  
-            dic[f'{indexers} %'] = [round(sum(self._data[indexers]), 2)]
-        df = pd.DataFrame(dic)
+        df = accumulated(self._data[list(self._axis_y)]).round(2).add_suffix(' %').to_frame().T
         st.write('Acumulado no período')
         df = Styler(df, 2)
         st.dataframe(df)
 
 
-    def serie_decomposition(self):
+    def serie_decomposition(self, model='additive', backend='moving_average'):
         '''
-        Seasonality and trend of time series
+        Seasonality and trend of time series. The whole history of the series is decomposed (precomputed by the
+        ETL jobs for the indicators) and the analysis period is shown, daily series are aggregated by month.
+
+        Parameters: model : String
+                        'additive' or 'multiplicative'
+
+                    backend : String
+                        'moving_average' or 'stl'
 
         Returns: Plotly Line Chart
                     Line chart for seasonal and trend of series
         '''  
+        if len(self._axis_y) > 1:
+            st.write('Selecione apenas um índice para essa visualização')
+            return
+        serie = self._axis_y[0]
+        data = self._history.set_index(self._axis_x)[serie]
+        data.index = pd.to_datetime(data.index)
+        daily = periods_per_year(data.index) > 12
+        if daily:
+            data = monthly_mean(data)
+        name = f'{self._dataset[0]}-{serie}' if self._dataset is not None else serie
         try:
-            if len(self._axis_y) > 1:
-                st.write('Selecione apenas um índice para essa visualização')
-            else:
-                # Set date as index
-                data = self._data.set_index('date')
-                data.index = pd.to_datetime(data.index) 
-                # Decompose time serie with statsmodels
-                dec = seasonal_decompose(data[self._axis_y], period=12)
-
-                # Create DataFrame of seasonality and trend
-                df_dec = pd.DataFrame({'date': dec.seasonal.index, self._axis_y[0]: dec.seasonal.values})
-                df_tred = pd.DataFrame({'date': dec.trend.index, self._axis_y[0]: dec.trend.values})
-                
-                # Show seasonal result
-                seasonal_fig = px.line(df_dec, x='date', y=self._axis_y[0], title=f'Sazonalidade {self._axis_y[0]}')
-                seasonal_fig.update_layout(xaxis_title='Data', yaxis_title='')
-                st.plotly_chart(seasonal_fig, use_container_width=True)
-                
-                # Show trend result
-                tred_fig = px.line(df_tred, x='date', y=self._axis_y[0], title=f'Tendênica {self._axis_y[0]}')
-                tred_fig.update_layout(xaxis_title='Data', yaxis_title='')
-                st.plotly_chart(tred_fig, use_container_width=True) 
-        except:
-            st.write('Selecione ao menos 2 anos completos para essa visualização!')
+            decomposition = load_decomposition(name, data, period=12, model=model, backend=backend)
+        except DecompositionError as error:
+            st.write(f'Não foi possível decompor {serie}: {error}')
+            return
+        self.decomposition_view(decomposition, serie)
+        if daily:
+            st.write('Dados agregados por média mês!')
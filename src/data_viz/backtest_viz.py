@@ -0,0 +1,90 @@
+import streamlit as st
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from analytics.backtest import (BACKTEST_METRICS, REBALANCING_FREQUENCIES, WEIGHTING_SCHEMES, growth_matrix,
+                                normalize_weights, portfolio_values, rebalancing_schedule, backtest_metrics)
+
+
+class BacktestViz:
+    '''
+    Backtest of portfolios of IBOVESPA tickers over the wide price panel
+    '''
+    def __init__(self, panel: pd.DataFrame, weights: pd.Series, benchmark: pd.Series, start_date, end_date):
+        '''
+        :param panel: Adjusted close prices indexed by date, one column per ticker
+        :param weights: Weight in % of the theoretical portfolio indexed by ticker
+        :param benchmark: IBOVESPA level indexed by date, None when it is not available
+        :param start_date: Start date to analysis
+        :param end_date: Last date to analysis
+        '''
+        self._panel = panel.loc[(panel.index >= start_date) & (panel.index <= end_date)]
+        self._weights = weights
+        self._benchmark = benchmark
+
+
+    def weight_sets(self, tickers: list):
+        '''
+        Target weights of every scheme of WEIGHTING_SCHEMES for the tickers of the panel
+
+        Parameters: tickers : List of string
+                        Tickers of the portfolio
+
+        Returns: DataFrame
+                    Pandas DataFrame with one row per scheme and one column per ticker
+        '''
+        theoretical = self._weights.reindex(tickers).fillna(0).to_numpy()
+        schemes = {'theoretical': theoretical, 'equal': np.ones(len(tickers))}
+        return pd.DataFrame([schemes[scheme] for scheme in WEIGHTING_SCHEMES.values()],
+                            index=WEIGHTING_SCHEMES.keys(), columns=tickers)
+
+
+    def portfolio_view(self, tickers: list, weighting: str, frequency: str):
+        '''
+        Value of the selected portfolio against the IBOVESPA and the metrics of all the weighting schemes and
+        rebalancing frequencies, every weight set of a frequency is computed in the same matrix product
+
+        Parameters: tickers : List of string
+                        Tickers of the portfolio, the ones out of the panel are ignored
+
+                    weighting : String
+                        Key of WEIGHTING_SCHEMES shown in the chart
+
+                    frequency : String
+                        Key of REBALANCING_FREQUENCIES shown in the chart
+        '''
+        tickers = [ticker for ticker in tickers if ticker in self._panel.columns]
+        if len(self._panel) < 2 or not tickers:
+            st.write('Não há preços das ações selecionadas no período!')
+            return
+        prices = self._panel[tickers]
+        growth = growth_matrix(prices)
+        sets = self.weight_sets(tickers)
+        weights = normalize_weights(sets.to_numpy(), ~np.isnan(growth[0]))
+        benchmark = None
+        if self._benchmark is not None:
+            benchmark = self._benchmark.reindex(prices.index).ffill().bfill().to_numpy()
+        values = dict()
+        metrics = list()
+        for label, rebalancing in REBALANCING_FREQUENCIES.items():
+            value, turnover = portfolio_values(growth, weights, rebalancing_schedule(prices.index, rebalancing))
+            values[label] = value
+            metric = backtest_metrics(value, turnover, prices.index, benchmark)
+            metric.index = pd.MultiIndex.from_product([sets.index, [label]], names=['Pesos', 'Rebalanceamento'])
+            metrics.append(metric)
+        chart = pd.DataFrame({'Carteira': values[frequency][:, list(sets.index).index(weighting)]},
+                             index=prices.index)
+        if benchmark is not None:
+            chart['IBOVESPA'] = benchmark / benchmark[0]
+        fig = px.line(chart.rename_axis('Data'), y=chart.columns)
+        fig.update_layout(
+            xaxis_title='Data',
+            yaxis_title='Valor (início = 1)',
+            legend_title=''
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        if benchmark is None:
+            st.caption('Cotação do IBOVESPA não armazenada, tracking error não calculado.')
+        st.write('Comparação de pesos e frequências de rebalanceamento')
+        st.dataframe(pd.concat(metrics).sort_index(level=0, sort_remaining=False)[BACKTEST_METRICS]
+                     .style.format('{:.2f}'))
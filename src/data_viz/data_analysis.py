@@ -3,6 +3,26 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 from pandas.io.formats.style import Styler
+from analytics.normalization import normalize, normalized_growth
+from analytics.correlation import pair_correlation, top_pairs
+from analytics.risk import VOLATILITY_WINDOW, rolling_volatility
+from analytics.statistics import periods_per_year
+from etl.data_layer import load_correlation
+
+
+def downsampling_note(data: pd.DataFrame, max_points: int):
+    '''
+    Warn that the chart shows a reduced number of points
+
+    Parameters: data : DataFrame
+                    Data of the chart
+
+                max_points : Integer
+                    Maximum points by series of the chart, None for full resolution
+    '''
+    if max_points is not None and len(data) > max_points:
+        st.caption(f'Gráfico reduzido a {max_points} pontos por série preservando máximos e mínimos. Reduza o '
+                   'período ou aumente a resolução do gráfico para ver todos os registros.')
 
 
 class DataAnalysis:
@@ -23,44 +43,114 @@ class DataAnalysis:
         self._end_date = end_date
         self._axis_y = axis_y
         self._data_norm = data_norm
+        self._norm_method = 'first'
+        # Identification of the data in the caches of the data layer, None to not cache
+        self._dataset = None
+
 
 
+    def correlation_data(self):
+        '''
+        Series of the correlation analysis
+
+        Returns: Tuple
+                    Pandas DataFrame indexed by date with the selected series and True when they are rates in %
+        '''
+        return self._data[list(self._axis_y)], True
+
+
+    def risk_view(self, metrics: pd.DataFrame):
+        '''
+        Risk metrics computed by the ETL over the whole history of the selected series and their rolling
+        volatility in the analysis period
+
+        Parameters: metrics : DataFrame
+                        Rows of etl.data_layer.load_risk_metrics indexed by the names of the selected series, None
+                        when the metrics were not computed
+        '''
+        if metrics is None or metrics.empty:
+            st.write('Métricas de risco não calculadas para a seleção, execute a atualização dos dados!')
+        else:
+            numbers = metrics.select_dtypes('float').columns
+            st.dataframe(metrics.style.format('{:.2f}', subset=numbers)
+                         .format('{:%d/%m/%Y}', subset=['início', 'fim'], na_rep='-'))
+            st.caption('VaR e CVaR de 95% em um dia, volatilidade anualizada, beta em relação ao IBOVESPA e '
+                       'Sharpe e Sortino em relação ao CDI, calculados sobre todo o histórico.')
+        levels, rates = self.correlation_data()
+        if rates or len(levels) < 2:
+            return
+        volatility = rolling_volatility(levels, periods=periods_per_year(levels.index))
+        fig = px.line(volatility.rename_axis('Data'), y=volatility.columns)
+        fig.update_layout(
+            xaxis_title='Data',
+            yaxis_title=f'Volatilidade {VOLATILITY_WINDOW} registros (% a.a.)',
+            legend_title=''
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
 
-    def correlation(self):
+    def correlation(self, method='full', window=12, pairs=10):
         '''
-        --> Show the matrix correlation of selected indexes
+        --> Show the matrix correlation of the returns of selected indexes, in hierarchical clustering order, and
+        the most correlated pairs
+
+        Parameters: method : String
+                        'full' for the matrix of the period, 'rolling' or 'ewm' for the correlation over time of the
+                        most correlated pairs
+
+                    window : Integer
+                        Records of the rolling window or span of the exponential weights
+
+                    pairs : Integer
+                        Number of pairs shown
 
         Returns: Plotly Imshow
                     Imshow to show correlation plot
         '''
-        # Correlation calc    
         if len(self._axis_y) <= 1:
             st.write('Selecione ao menos dois índices!')
-        else: 
-            try:
-                df_corr = self._data[self._axis_y].corr().round(1)
-            except:
-                # Stock price with one ticker selected
-                df_corr = self._data['Close'].corr().round(1)  
+            return
+        data, rates = self.correlation_data()
+        returns, df_corr = load_correlation(self._dataset, data, self._start_date, self._end_date, rates=rates)
+        df_pairs = top_pairs(df_corr, k=pairs)
+        if method == 'full':
             # Mask to matrix
             mask = np.zeros_like(df_corr, dtype=bool)
             mask[np.triu_indices_from(mask)] = True
             # Viz
             df_corr_viz = df_corr.mask(mask).dropna(how='all').dropna(axis='columns', how='all')
-            fig = px.imshow(df_corr_viz, text_auto=True)
+            # Values are only readable in small matrices
+            text_auto = '.2f' if len(df_corr_viz) <= 15 else False
+            fig = px.imshow(df_corr_viz, text_auto=text_auto, zmin=-1, zmax=1, color_continuous_scale='RdBu_r')
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            df_time = pair_correlation(returns, df_pairs, method=method, window=window)
+            fig = px.line(df_time, x=df_time.index, y=df_time.columns)
+            fig.update_layout(xaxis_title='', yaxis_title='Correlação', legend_title='')
             st.plotly_chart(fig, use_container_width=True)
+        if len(self._axis_y) > 2:
+            st.write('Pares mais correlacionados')
+            st.dataframe(Styler(df_pairs, 2))
             
 
-    def normalize_time_series(self):
+    def normalize_time_series(self, method='first', base_date=None, dates=None):
         '''
-        Transforms the time series into normalized form by dividing the series by the first record. 
+        Transforms the time series into normalized form by dividing the series by the first record. Only the 
+        selected columns are normalized, all at once.
+
+        Parameters: method : String
+                        Normalization base: 'first', 'base100', 'log' or 'date' (see analytics.normalization)
+
+                    base_date : Datetime
+                        Base date of the 'date' method
+
+                    dates : Array like
+                        Dates of the rows, the index of the data is used when it is None
         '''
-        self._data_norm = self._data.copy()
-        if len(self._axis_y) > 1:
-            for column in self._axis_y:
-                self._data_norm.loc[:, column] = self._data_norm.loc[:, column] / self._data_norm[column].values[0]
-        else:
-            self._data_norm.loc[:, self._axis_y] = self._data_norm.loc[:, self._axis_y] / self._data_norm[self._axis_y].values[0]
+        columns = list(self._axis_y)
+        normalized = normalize(self._data[columns], method=method, base_date=base_date, dates=dates)
+        self._data_norm = pd.concat([self._data.drop(columns=columns), normalized], axis=1)
+        self._norm_method = method
 
 
     def normalized_metric(self):
@@ -70,11 +160,36 @@ class DataAnalysis:
         Returns: Pandas DataFrame
                     DataFrame with calculated metric
         ''' 
-        dic = dict()
-        for column in self._axis_y:  
-            dic[column] = [round((self._data_norm[column].iloc[-1] - self._data_norm[column].iloc[0]), 2)]
-        df = pd.DataFrame(dic).stack()
-        df.rename(index='%', inplace=True)
-        df = Styler(df, 2)
+        growth = normalized_growth(self._data_norm[list(self._axis_y)], self._norm_method)
+        df = growth.round(2).rename('%')
+        df = Styler(df.to_frame(), 2)
         st.write('Crescimento relativo %')
         st.dataframe(df)
+
+
+    def decomposition_view(self, decomposition: pd.DataFrame, serie: str):
+        '''
+        Show the seasonality and trend of a decomposition inside the analysis period
+
+        Parameters: decomposition : DataFrame
+                        Result of analytics.decomposition.decompose
+
+                    serie : String
+                        Name of the series in the titles
+
+        Returns: Plotly Line Chart
+                    Line chart for seasonal and trend of series
+        '''
+        decomposition = decomposition.loc[(decomposition.index >= self._start_date) & 
+                                          (decomposition.index <= self._end_date)]
+        if decomposition.empty:
+            st.write('Não há registros no período selecionado!')
+            return
+        # Show seasonal result
+        seasonal_fig = px.line(x=decomposition.index, y=decomposition['seasonal'], title=f'Sazonalidade {serie}')
+        seasonal_fig.update_layout(xaxis_title='Data', yaxis_title='')
+        st.plotly_chart(seasonal_fig, use_container_width=True)
+        # Show trend result
+        trend_fig = px.line(x=decomposition.index, y=decomposition['trend'], title=f'Tendência {serie}')
+        trend_fig.update_layout(xaxis_title='Data', yaxis_title='')
+        st.plotly_chart(trend_fig, use_container_width=True)
@@ -0,0 +1,77 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from analytics.flows import FlowCube
+
+
+class FlowViz:
+    '''
+    Flows of the investment funds answered by the precomputed flow cubes
+    '''
+    def __init__(self, cube: FlowCube, catalog: pd.DataFrame, start_date, end_date):
+        '''
+        :param cube: Daily or monthly flow cube of etl.data_layer.load_flow_cube, None when it was not computed
+        :param catalog: CNPJ and current social denomination of the funds
+        :param start_date: Start date to analysis
+        :param end_date: Last date to analysis
+        '''
+        self._cube = cube
+        self._denominations = catalog.set_index('cnpj_fundo')['denom_social']
+        self._start_date = start_date
+        self._end_date = end_date
+
+
+    def ranking_view(self, metric: str, top=20, ascending=False):
+        '''
+        Funds with the highest inflows or outflows of the period among all the funds
+
+        Parameters: metric : String
+                        Column of analytics.flows.RANKING_COLUMNS used to rank the funds
+
+                    top : Integer
+                        Funds to show
+
+                    ascending : Boolean
+                        False for the highest inflows, True for the highest outflows
+        '''
+        if self._cube is None:
+            st.write('Fluxos dos fundos não calculados, execute a atualização dos dados!')
+            return
+        ranking = self._cube.ranking(self._start_date, self._end_date, metric=metric, top=top, ascending=ascending)
+        ranking.insert(0, 'denom_social', self._denominations.reindex(ranking.index).to_numpy())
+        numbers = ranking.select_dtypes('float').columns
+        st.dataframe(ranking.style.format('{:,.2f}', subset=numbers)
+                     .format('{:%d/%m/%Y}', subset=['início', 'fim'], na_rep='-'))
+        st.caption('Captação líquida (captação - resgate) em R$ no período. Percentuais em relação ao patrimônio '
+                   'líquido e aos cotistas do registro anterior ao período.')
+
+
+    def funds_view(self, cnpjs: list):
+        '''
+        Net flow and shareholders of the selected funds in the period
+
+        Parameters: cnpjs : List of string
+                        Selected CNPJs
+        '''
+        if self._cube is None:
+            return
+        data = self._cube.select(cnpjs, self._start_date, self._end_date)
+        if data.empty:
+            st.write('Não há registros dos fundos selecionados no período!')
+            return
+        data['denom_social'] = self._denominations.reindex(data['cnpj_fundo']).to_numpy()
+        fig = px.bar(data.rename(columns={'date': 'Data'}), x='Data', y='fluxo_liq', color='denom_social',
+                     barmode='group')
+        fig.update_layout(
+            xaxis_title='Data',
+            yaxis_title='Captação líquida (R$)',
+            legend_title=''
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        fig = px.line(data.rename(columns={'date': 'Data'}), x='Data', y='nr_cotst', color='denom_social')
+        fig.update_layout(
+            xaxis_title='Data',
+            yaxis_title='Cotistas (Nº)',
+            legend_title=''
+        )
+        st.plotly_chart(fig, use_container_width=True)
@@ -1,65 +1,184 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-from data_viz.data_analysis import DataAnalysis
+from plotly.subplots import make_subplots
+from data_viz.data_analysis import DataAnalysis, downsampling_note
 import plotly.express as px
 from pandas.io.formats.style import Styler
-from statsmodels.tsa.seasonal import seasonal_decompose
-from etl.catch_clean import data_aggregation
+from etl.data_layer import (CACHE_TTL, load_decomposition, load_indicators, load_optimization, load_risk_metrics,
+                            load_rollups, ticker_series)
+from etl.price_store import PriceStore
+from analytics.aggregation import AGGREGATION_PERIODS
+from analytics.normalization import normalize, normalized_growth
+from analytics.statistics import describe
+from analytics.decomposition import DecompositionError
+from analytics.downsampling import CHART_POINTS, downsample, ohlc_bars, series_points
+from analytics.optimization import OptimizationError
+from analytics.risk import daily_risk_free
+from analytics.statistics import periods_per_year
+
+
+# Candles of all tickers in the figure, Plotly has no WebGL candlestick and becomes slow above it. Longer periods
+# are shown as weekly, monthly or quarterly candles.
+MAX_CANDLES = 5000
+# Description of the candles of analytics.downsampling.OHLC_PERIODS
+CANDLE_PERIODS = {'W-FRI': 'semanais', 'M': 'mensais', 'Q': 'trimestrais'}
+
+
+# The prices are not hashed, the figure is identified by the tickers, the period and the last date with prices
+@st.cache(ttl=CACHE_TTL, max_entries=16, allow_output_mutation=True, show_spinner=False,
+          hash_funcs={pd.DataFrame: lambda _: None})
+def candlestick_figure(tickers: tuple, start_date, end_date, last_date: str, data: pd.DataFrame):
+    '''
+    Subplot grid with the candlestick of each ticker, shared x-axes and a single figure for all tickers
+
+    Parameters: tickers : Tuple of string
+                    Company tickers
+
+                start_date : Datetime
+                    First date of the period
+
+                end_date : Datetime
+                    Last date of the period
+
+                last_date : String
+                    Last date with prices, a new trading day gives a new figure
+
+                data : DataFrame
+                    Prices in the format of request_data
+
+    Returns: fig : Plotly Figure
+                Figure with one row per ticker
+             period : String
+                Period of the candles (analytics.downsampling.OHLC_PERIODS) when the daily candles of all tickers
+                are more than MAX_CANDLES, None for daily candles
+    '''
+    rows = len(tickers)
+    fig = make_subplots(rows=rows, cols=1, shared_xaxes=True, vertical_spacing=min(0.05, 0.3 / rows),
+                        subplot_titles=tickers)
+    period = None
+    for row, ticker in enumerate(tickers, start=1):
+        prices = data.xs(ticker, axis=1, level=1) if rows > 1 else data
+        prices, period = ohlc_bars(prices, MAX_CANDLES // rows)
+        fig.add_trace(go.Candlestick(x=prices.index, open=prices['Open'], high=prices['High'], low=prices['Low'],
+                                     close=prices['Close'], name=ticker), row=row, col=1)
+        fig.update_yaxes(title_text='R$', row=row, col=1)
+    fig.update_xaxes(rangeslider_visible=False)
+    fig.update_layout(height=max(550, 300 * rows), showlegend=False)
+    return fig, period
 
 
 class StockPriceViz(DataAnalysis):
     '''
     Data visualization of Yahoo Finance historical data
     '''
-    def __init__(self, data, start_date, end_date, axis_y, data_norm=pd.DataFrame()):
+    def __init__(self, data, start_date, end_date, axis_y, data_norm=pd.DataFrame(), dataset=None):
         '''
         :param data: Requested data
         :param start_date: Start date to analysis
         :param end_date: Last date to analysis
         :param axiy_y: Selected company tickers of downloaded data
         :param data_norm: Data in normalized format
+        :param dataset: Identification of the data in the rollups cache (name and selection), None to not cache
         '''
         super().__init__(data, start_date, end_date, axis_y, data_norm)
         self._data_norm = data_norm
+        self._dataset = dataset
         self._data = self._data.loc[(self._data.index >= self._start_date) & 
                                     (self._data.index <= self._end_date)]
 
     
     def candlestick(self):
         '''
-        Download information from Yahoo Finance and show candlestick of last 30 days
+        Candlestick of the selected tickers in one figure, one row per ticker with shared x-axes. The figure is
+        cached by tickers and period.
 
         Returns: Plotly Candlestick Charts
                     Candlestick for one or many tickers
         '''
+        last_date = str(self._data.index.max())
+        fig, period = candlestick_figure(tuple(self._axis_y), self._start_date, self._end_date, last_date,
+                                         self._data)
+        st.plotly_chart(fig, use_container_width=True)
+        if period is not None:
+            st.caption(f'Período longo: candles {CANDLE_PERIODS[period]} (abertura, máxima, mínima e fechamento do '
+                       f'período). Reduza o intervalo de datas para ver os candles diários.')
+
+
+    def correlation_data(self):
+        '''
+        Adjusted close prices of the selected tickers, dividends and splits do not change the returns
+
+        Returns: Tuple
+                    Pandas DataFrame with one column per ticker and False, prices are levels
+        '''
         if len(self._axis_y) == 1:
-            fig = go.Figure(data=[go.Candlestick(x=self._data.index,
-                                                open=self._data['Open'],
-                                                high=self._data['High'],
-                                                low=self._data['Low'],
-                                                close=self._data['Close'])])
-            fig.update_layout(title=f'{self._axis_y[0]}',
-                            yaxis_title='R$',
-                            height=550)
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            for ticker in self._axis_y:
-                fig = go.Figure(data=[go.Candlestick(x=self._data.index,
-                                                    open=self._data['Open'][ticker],
-                                                    high=self._data['High'][ticker],
-                                                    low=self._data['Low'][ticker],
-                                                    close=self._data['Close'][ticker])])
-                fig.update_layout(title=f'{ticker}',
-                                yaxis_title='R$',
-                                height=550)
-                st.plotly_chart(fig, use_container_width=True)
-
-
-    def descriptive_statistics(self):
+            return self._data[['Adj Close']].rename(columns={'Adj Close': self._axis_y[0]}), False
+        return self._data['Adj Close'][self._axis_y], False
+
+
+    def risk_metrics(self):
         '''
-        Central tendency and dispersion statistics information
+        Risk metrics of the selected tickers and rolling volatility of the adjusted close prices in the period
+        '''
+        self.risk_view(load_risk_metrics('acoes', list(self._axis_y)))
+
 
+    def optimization_view(self, method='ledoit_wolf', max_weight=1.0):
+        '''
+        Efficient frontier of the selected tickers with the minimum variance and maximum Sharpe portfolios, the
+        expected returns and the covariance are estimated from the daily returns of the period and the risk-free
+        rate is the CDI of the period
+
+        Parameters: method : String
+                        Covariance estimator of analytics.optimization.COVARIANCE_METHODS
+
+                    max_weight : Float
+                        Upper bound of each weight, as a fraction
+        '''
+        prices, _ = self.correlation_data()
+        cdi = load_indicators()[['date', 'CDI']].rename(columns={'CDI': '%'})
+        risk_free = daily_risk_free(prices.index, cdi).mean() * periods_per_year(prices.index) if len(prices) else 0
+        try:
+            result = load_optimization(prices, self._start_date, self._end_date, method=method,
+                                       risk_free=risk_free, max_weight=max_weight)
+        except OptimizationError as error:
+            st.write(f'Não foi possível otimizar a carteira: {error}')
+            return
+        frontier, portfolios, assets = result['frontier'], result['portfolios'], result['assets']
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=frontier['volatilidade'] * 100, y=frontier['retorno'] * 100, mode='lines',
+                                 name='Fronteira eficiente'))
+        fig.add_trace(go.Scatter(x=assets['volatilidade'] * 100, y=assets['retorno'] * 100, mode='markers+text',
+                                 text=assets.index, textposition='top center', name='Ações'))
+        fig.add_trace(go.Scatter(x=portfolios['volatilidade'] * 100, y=portfolios['retorno'] * 100,
+                                 mode='markers', marker=dict(size=14, symbol='star'), text=portfolios.index,
+                                 name='Carteiras'))
+        fig.update_layout(
+            xaxis_title='Volatilidade (% a.a.)',
+            yaxis_title='Retorno esperado (% a.a.)',
+            legend_title=''
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        table = portfolios.T * 100
+        table.loc['sharpe'] /= 100
+        # Only the tickers held by some portfolio
+        held = table.iloc[3:].max(axis=1) >= 0.01
+        st.dataframe(pd.concat([table.iloc[:3], table.iloc[3:][held]]).style.format('{:.2f}'))
+        st.caption(f'Retorno, volatilidade e pesos em %. Sharpe em relação ao CDI do período '
+                   f'({risk_free * 100:.2f}% a.a.).')
+        if 'Máximo Sharpe' not in portfolios.index:
+            st.write('Nenhuma ação teve retorno esperado acima do CDI no período, a carteira de máximo Sharpe não '
+                     'foi calculada.')
+
+
+    def descriptive_statistics(self, extras=()):
+        '''
+        Central tendency and dispersion statistics information of the close price of all selected tickers in one 
+        table
+
+        Parameters: extras : List of string
+                        Optional statistics of analytics.statistics.EXTRA_STATS
 
         Returns: Pandas DataFrame
                     DataFrame with following columns: 
@@ -71,53 +190,44 @@ class StockPriceViz(DataAnalysis):
                         Q2: median 
                         Q3: third quartile 
                         max: maximum    
+                    followed by the selected extras
         '''
         if len(self._axis_y) > 1:
-            for ticker in self._axis_y:
-                df_stats = self._data['Close'][[ticker]].describe().T.round()
-                df_stats.columns = ['registros', 'média', 'desvio padrão', 'min', 'Q1', 'Q2', 'Q3', 'max']
-                df_stats['range'] = df_stats['max'] - df_stats['min']
-                df_stats = df_stats[['registros', 'min', 'max', 'range', 'média', 'desvio padrão', 'Q1', 'Q2', 'Q3']]
-                st.dataframe(df_stats.style.format('{:.0f}'))    
+            close = self._data['Close'][self._axis_y]
         else:
-            df_stats = self._data[['Close']].describe().T.round()
-            df_stats.columns = ['registros', 'média', 'desvio padrão', 'min', 'Q1', 'Q2', 'Q3', 'max']
-            df_stats['range'] = df_stats['max'] - df_stats['min']
-            df_stats = df_stats[['registros', 'min', 'max', 'range', 'média', 'desvio padrão', 'Q1', 'Q2', 'Q3']]
-            st.dataframe(df_stats.style.format('{:.0f}'))
+            close = self._data[['Close']].rename(columns={'Close': self._axis_y[0]})
+        df_stats = describe(close, extras=extras)
+        st.dataframe(df_stats.style.format('{:.2f}'))
 
 
-    def time_series(self):
+    def time_series(self, chart_points=CHART_POINTS):
         '''
         Visualize the selected indicator
 
-        Parameters: legend_x_position : Float 
-                        The x position of legend in visualization
-    
-                    legend_y_position: Float
-                        The y position of legend in visualization
+        Parameters: chart_points : Integer
+                        Points of the chart sent to the browser, shared by the tickers, None for full resolution
 
         Returns: Plotly Line Chart
                     Line chart for one or many indicators
         '''
         if self._data_norm.empty:
-            data = self._data.copy()
+            data = self._data
         else:
-            data = self._data_norm.copy()
+            data = self._data_norm
         if len(self._axis_y) > 1:
-            fig = px.line(data['Close'], x=data.index, y=self._axis_y)
-            fig.update_layout(
-                xaxis_title='Data',
-                yaxis_title='R$'
-            )
-            st.plotly_chart(fig, use_container_width=True)    
+            close = data['Close'][self._axis_y]
         else:
-            fig = px.line(data, x=data.index, y='Close')
-            fig.update_layout(
-                xaxis_title='Data',
-                yaxis_title='R$'
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            close = data[['Close']].rename(columns={'Close': self._axis_y[0]})
+        max_points = series_points(chart_points, len(self._axis_y))
+        close = downsample(close.rename_axis('Data'), max_points=max_points)
+        fig = px.line(close, x='Data', y='value', color='variable')
+        fig.update_layout(
+            xaxis_title='Data',
+            yaxis_title='R$',
+            legend_title=''
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        downsampling_note(self._data, max_points)
 
 
     def histogram_view(self):
@@ -162,46 +272,62 @@ class StockPriceViz(DataAnalysis):
             st.plotly_chart(fig, use_container_width=True)
 
 
-    def barplot_view(self, aggregation: str, function: object):
+    def barplot_view(self, aggregation: str, function: str):
         '''
         Financial market indicator with Barplot by year
 
+        Parameters: aggregation : String
+                        'Ano', 'Trimestre' or 'Mês'
+
+                    function : String
+                        Rollup of analytics.aggregation.AGGREGATION_FUNCTIONS: 'sum', 'mean', 'last' or 'compounded'
+
         Returns: Plotly Barplot Chart
                     Barplot chart for one or many indicators with options to aggregate by year, quarter or
-                    month, with sum or mean.
+                    month, with sum, mean, last price or compounded return.
         '''
-        data = self._data.copy()
-        # Reset index to be used by data_aggregation function
-        data.reset_index(inplace=True)
-        data.rename(columns={'Date': 'date'}, inplace=True)
-        data_agg = data_aggregation(data=data, aggregation=aggregation, function=function)
+        if len(self._axis_y) > 1:
+            close = self._data['Close'][self._axis_y]
+        else:
+            close = self._data[['Close']].rename(columns={'Close': self._axis_y[0]})
+        # Close prices of the window are aggregated once and served from the cache
+        rollups = load_rollups(self._dataset, close, close.index, self._start_date, self._end_date, rates=False)
+        data_agg = rollups[(AGGREGATION_PERIODS[aggregation], function)]
+        y_label = '%' if function == 'compounded' else 'R$'
 
         if len(self._axis_y) > 1:
-            fig = px.bar(data_agg['Close'], x=data_agg.index, y=self._axis_y, barmode='group')
+            fig = px.bar(data_agg, x=data_agg.index, y=self._axis_y, barmode='group')
             fig.update_layout(
                 xaxis_title='',
-                yaxis_title='R$',
+                yaxis_title=y_label,
                 xaxis=dict(type='category'))
             st.plotly_chart(fig)
         else:
-            fig = px.bar(data_agg, x=data_agg.index, y='Close')
+            fig = px.bar(data_agg, x=data_agg.index, y=self._axis_y[0])
             fig.update_layout(
                 xaxis_title=self._axis_y[0],
-                yaxis_title='R$',
+                yaxis_title=y_label,
                 xaxis=dict(type='category'))
             st.plotly_chart(fig, use_container_width=True)
 
 
-    def normalize_time_series(self):
+    def normalize_time_series(self, method='first', base_date=None):
         '''
-        Transforms the time series into normalized form by dividing the series by the first record.
+        Transforms the time series into normalized form by dividing the series by the first record. Only the close 
+        prices of the selected tickers are normalized, all at once.
+
+        Parameters: method : String
+                        Normalization base: 'first', 'base100', 'log' or 'date' (see analytics.normalization)
+
+                    base_date : Datetime
+                        Base date of the 'date' method
         '''
-        self._data_norm = self._data.copy()
         if len(self._axis_y) > 1:
-            for column in self._axis_y:
-                self._data_norm.loc[:, ('Close', column)] = self._data_norm['Close'][column] / self._data_norm['Close'][column][0]
+            normalized = normalize(self._data['Close'][self._axis_y], method=method, base_date=base_date)
+            self._data_norm = pd.concat({'Close': normalized}, axis=1)
         else:
-            self._data_norm['Close'] = self._data_norm['Close'] / self._data_norm['Close'].iloc[0]
+            self._data_norm = normalize(self._data[['Close']], method=method, base_date=base_date)
+        self._norm_method = method
 
 
     def normalized_metric(self):
@@ -211,47 +337,38 @@ class StockPriceViz(DataAnalysis):
         Returns: Pandas DataFrame
                     DataFrame with calculated metric
         ''' 
-        if len(self._axis_y) > 1:
-            dic = dict()
-            for column in self._axis_y:  
-                dic[column] = [round((self._data_norm['Close'][column].iloc[-1] - self._data_norm['Close'][column].iloc[0]), 2)]
-            df = pd.DataFrame(dic)
-            df = Styler(df, 2)
-            st.write('Valorização no período')
-            st.dataframe(df)
-        else:
-            dic = dict()
-            dic['Close'] = [round((self._data_norm['Close'].iloc[-1] - self._data_norm['Close'].iloc[0]), 2)]
-            df = pd.DataFrame(dic)
-            df = Styler(df, 2)
-            st.write('Valorização no período')
-            st.dataframe(df)
+        growth = normalized_growth(self._data_norm['Close'] if len(self._axis_y) > 1 else self._data_norm, 
+                                   self._norm_method)
+        df = growth.round(2).to_frame().T
+        df = Styler(df, 2)
+        st.write('Valorização no período')
+        st.dataframe(df)
 
 
-    def serie_decomposition(self):
+    def serie_decomposition(self, model='additive', backend='moving_average'):
         '''
-        Seasonality and trend of time series
+        Seasonality and trend of the monthly mean close price. The whole stored history of the ticker is 
+        decomposed (precomputed by etl/update_prices.py) and the analysis period is shown.
+
+        Parameters: model : String
+                        'additive' or 'multiplicative'
+
+                    backend : String
+                        'moving_average' or 'stl'
         '''  
+        if len(self._axis_y) > 1:
+            st.write('Selecione apenas um índice para essa visualização')
+            return
+        ticker = self._axis_y[0]
+        series = ticker_series(PriceStore(), [ticker])
+        if not series:
+            st.write(f'Não há preços armazenados de {ticker}!')
+            return
+        name, data = series.popitem()
         try:
-            if len(self._axis_y) > 1:
-                st.write('Selecione apenas um índice para essa visualização')
-            else: 
-                # Agregate data by mean/ month 
-                data_month = self._data[['Close']].groupby(pd.Grouper(freq="M")).mean()
-                # Decompose time serie with statsmodels
-                dec = seasonal_decompose(data_month, period=12)
-                # Create DataFrame of seasonality and trend
-                df_dec = pd.DataFrame({'date': dec.seasonal.index, self._axis_y[0]: dec.seasonal.values})
-                df_tred = pd.DataFrame({'date': dec.trend.index, self._axis_y[0]: dec.trend.values})
-                # Show seasonal result
-                seasonal_fig = px.line(df_dec, x='date', y=self._axis_y[0], title=f'Sazonalidade {self._axis_y[0]}')
-                seasonal_fig.update_layout(xaxis_title='Data', yaxis_title='')
-                st.plotly_chart(seasonal_fig, use_container_width=True)
-                
-                # Show trend result
-                tred_fig = px.line(df_tred, x='date', y=self._axis_y[0], title=f'Tendênica {self._axis_y[0]}')
-                tred_fig.update_layout(xaxis_title='Data', yaxis_title='')
-                st.plotly_chart(tred_fig, use_container_width=True) 
-                st.write('Dados agregados por média mês!')
-        except:
-            st.write('Selecione ao menos 2 anos completos para essa visualização!')
+            decomposition = load_decomposition(name, data, period=12, model=model, backend=backend)
+        except DecompositionError as error:
+            st.write(f'Não foi possível decompor {ticker}: {error}')
+            return
+        self.decomposition_view(decomposition, ticker)
+        st.write('Dados agregados por média mês!')
@@ -1,17 +1,31 @@
 import streamlit as st
 # Data manipulation
 import pandas as pd
-from datetime import date
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import date, timedelta
 
 # Yahoo finance
-import yfinance as yf
+from etl.price_store import PriceStore
 
 # API Requests 
+import os
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import urllib3
 import ssl
 import requests
 import json
 
+from etl.fund_store import is_fund_store, read_fund_store
+
+
+logger = logging.getLogger(__name__)
+
 
 class CustomHttpAdapter (requests.adapters.HTTPAdapter):
     '''
@@ -30,19 +44,166 @@ class CustomHttpAdapter (requests.adapters.HTTPAdapter):
             block=block, ssl_context=self.ssl_context)
 
 #----------------------------
-def get_legacy_session():
+def get_legacy_session(pool_size=10, retries=3, backoff_factor=0.5):
     '''
     Solving problem: unsafe legacy renegotiation disabled (_ssl.c:997)
 
     Source: https://py4u.org/questions/71603314/
+
+    Parameters: pool_size : Integer
+                    Connections kept open by host, should be at least the number of concurrent requests
+
+                retries : Integer
+                    Retries of failed connections and 429/5xx responses
+
+                backoff_factor : Float
+                    Exponential backoff between retries: backoff_factor * 2 ** (retry - 1) seconds
+
+    Returns: requests.Session
+                Session with connection pool shared by all requests
     '''
     ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
     ctx.options |= 0x4  # OP_LEGACY_SERVER_CONNECT
+    retry = urllib3.util.retry.Retry(total=retries, backoff_factor=backoff_factor, 
+                                     status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = CustomHttpAdapter(ctx, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
     session = requests.session()
-    session.mount('https://', CustomHttpAdapter(ctx))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
     return session
 
 
+# Positions of the characters of 'dd/mm/yyyy' rearranged as 'yyyy/mm/dd', the separators are then set to '-'
+SGS_DATE_TO_ISO = [6, 7, 8, 9, 2, 3, 4, 5, 0, 1]
+
+
+def parse_sgs_json(content: bytes):
+    '''
+    Decode the JSON of the Central Bank of Brazil API into typed columns. Each record is decoded into a tuple, 
+    the dates are rearranged as ISO bytes and parsed at once by NumPy and the values are converted to float in bulk
+
+    Parameters: content : Bytes
+                    Body of the response, a list of {"data": "dd/mm/yyyy", "valor": "x.xx"} records
+
+    Returns: DataFrame
+                Pandas DataFrame with date (datetime64) and % (float64) columns
+    '''
+    records = json.loads(content, object_hook=lambda record: (record['data'], record['valor']))
+    if not records:
+        return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), '%': pd.Series(dtype='float64')})
+    dates, values = zip(*records)
+    chars = np.array(dates, dtype='S10').view(np.uint8).reshape(-1, 10)[:, SGS_DATE_TO_ISO]
+    chars[:, [4, 7]] = ord('-')
+    dates = np.ascontiguousarray(chars).view('S10').ravel().astype('datetime64[D]').astype('datetime64[ns]')
+    try:
+        values = np.array(values, dtype='S').astype('float64')
+    except ValueError:
+        # Missing values are sent as empty strings
+        values = pd.to_numeric(pd.Series(values), errors='coerce').values
+    return pd.DataFrame({'date': dates, '%': values})
+
+
+def parse_ibge_json(content: bytes):
+    '''
+    Decode the JSON of the IBGE aggregates API into typed columns
+
+    Parameters: content : Bytes
+                    Body of the response
+
+    Returns: DataFrame
+                Pandas DataFrame with date (datetime64, first day of month) and % (float64) columns
+    '''
+    serie = json.loads(content)[0]['resultados'][0]['series'][0]['serie']
+    return pd.DataFrame({'date': pd.to_datetime(list(serie.keys()), format='%Y%m'), 
+                         # Periods not released yet are sent as "..." or "-"
+                         '%': pd.to_numeric(pd.Series(list(serie.values()), dtype=object), errors='coerce').values})
+
+
+def series_path(path: str):
+    '''
+    Path of the binary file of a series
+
+    Parameters: path : String
+                    Path of the series file, with .csv or .parquet extension
+
+    Returns: String
+                Path with .parquet extension
+    '''
+    return os.path.splitext(path)[0] + '.parquet'
+
+
+def series_source(path: str):
+    '''
+    File read for a series: the Parquet file when it exists, otherwise the legacy CSV file
+
+    Parameters: path : String
+                    Path of the series file, with .csv or .parquet extension
+
+    Returns: String
+                Path of the existing file, None when the series was never downloaded
+    '''
+    for source in (series_path(path), os.path.splitext(path)[0] + '.csv'):
+        if os.path.exists(source):
+            return source
+    return None
+
+
+def read_series(path: str):
+    '''
+    Read a series downloaded by DownloadFilesBrGov, the Parquet file is read when it exists, otherwise the legacy
+    CSV file (dates as dd/mm/yyyy for BCB or yyyymm for IBGE)
+
+    Parameters: path : String
+                    Path of the series file, with .csv or .parquet extension
+
+    Returns: DataFrame
+                Pandas DataFrame with date (datetime64) and % (float64) columns sorted by date, None when the series
+                was never downloaded
+    '''
+    path = series_source(path)
+    if path is None:
+        return None
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    data = pd.read_csv(path, dtype={'date': str})
+    data.columns = ['date', '%']
+    date_format = '%d/%m/%Y' if data['date'].str.contains('/').any() else '%Y%m'
+    data['date'] = pd.to_datetime(data['date'], format=date_format)
+    data['%'] = data['%'].astype('float64')
+    return data.sort_values('date').reset_index(drop=True)
+
+
+def write_series(data: pd.DataFrame, path: str):
+    '''
+    Write a series as Parquet file replacing the previous one atomically
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame with date and % columns
+
+                path : String
+                    Path of the series file, with .csv or .parquet extension
+    '''
+    path = series_path(path)
+    temp_file = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+    data.to_parquet(temp_file, index=False)
+    os.replace(temp_file, path)
+
+
+def validator_endpoint(url: str):
+    '''
+    Query of a series URL without the parts that change with the date of the download: the final date of the
+    Central Bank API and the number of periods of the IBGE API
+
+    Parameters: url : String
+                    URL of the series
+
+    Returns: String
+                URL identifying the query of the validators
+    '''
+    url = re.sub(r'&dataFinal=[^&]*', '', url)
+    return re.sub(r'/periodos/-\d+/', '/periodos/', url)
+
+
 class DownloadFilesBrGov:
     '''
     Download files from the Brazilian Government Services
@@ -52,7 +213,9 @@ class DownloadFilesBrGov:
                 indicators_ibge=['https://servicodados.ibge.gov.br/api/v3/agregados/1736/periodos/-77/variaveis/44?localidades=N1[all]',
                                 'https://servicodados.ibge.gov.br/api/v3/agregados/1737/periodos/-77/variaveis/63?localidades=N1[all]'], 
                 description_indicators_ibge=['inpc', 'ipca'], code_series_bcb=['196', '4391', '4390'], 
-                description_indicators_bcb=['savings', 'cdi', 'selic']):
+                description_indicators_bcb=['savings', 'cdi', 'selic'], max_workers=4, timeout=(10, 60), 
+                retries=3, validators_file='./data/.download_validators.json', incremental=False, 
+                revision_periods=3, data_dir='./data'):
         '''
         :param initial_date: Initial date to downloads files
         :param final_date: The last day of file downloads
@@ -61,6 +224,15 @@ class DownloadFilesBrGov:
         :param code_series_bcb: Code of series to download files from Central Bank of Brazil Time Series Managment System 
         :param description_indicators_bcb: Descriptions of series that will be downloaded from Central Bank of Brazil Time Sereies 
         Managment System 
+        :param max_workers: Maximum number of concurrent requests
+        :param timeout: Connect and read timeout in seconds of each request
+        :param retries: Retries with exponential backoff of each request
+        :param validators_file: JSON file with ETag/Last-Modified of previous responses used in conditional requests,
+        None disables conditional requests
+        :param incremental: Request only the periods after the last stored date and append them to the stored files,
+        files that do not exist yet are downloaded from initial_date
+        :param revision_periods: Number of last stored periods requested again in incremental mode to detect revisions
+        :param data_dir: Directory of the series files
         '''
         self._initial_date = initial_date
         self._final_date = final_date
@@ -68,52 +240,287 @@ class DownloadFilesBrGov:
         self._description_indicators_ibge = description_indicators_ibge
         self._code_series_bcb = code_series_bcb
         self._description_indicators_bcb = description_indicators_bcb
+        self._max_workers = max_workers
+        self._timeout = timeout
+        self._retries = retries
+        self._validators_file = validators_file
+        self._validators = dict()
+        if validators_file is not None and os.path.exists(validators_file):
+            with open(validators_file) as file:
+                self._validators = json.load(file)
+        self._validators_lock = threading.Lock()
+        self._session = None
+        self._incremental = incremental
+        self._revision_periods = revision_periods
+        self._data_dir = data_dir
+
+
+    def session(self):
+        '''
+        Legacy SSL session shared by all requests of this downloader, created on first use
+
+        Returns: requests.Session
+                    Pooled session with retries
+        '''
+        if self._session is None:
+            self._session = get_legacy_session(pool_size=self._max_workers, retries=self._retries)
+        return self._session
 
 
-    def catch_json(self, url):
+    def catch_content(self, url, description=None):
         '''
-        Catch the information from URL in JSON format
+        Catch the body of the response from URL
 
         Parameters: param url : URL of API service
 
-        Returns: Dictionary
-                    Dictionary of json content
+                    description : String
+                        Series of the request, the validators of the previous response are kept by series because
+                        the dates of the URL change every day. None to key them by URL.
+
+        Returns: Bytes
+                    Body of the response, None when the server answers that the content was not modified since the
+                    previous download
+        '''
+        key = description or url
+        endpoint = validator_endpoint(url)
+        headers = dict()
+        validator = self._validators.get(key, dict())
+        # Validators of another query of the series (changed initial date or series code) are not sent
+        if validator.get('endpoint') == endpoint:
+            if 'etag' in validator:
+                headers['If-None-Match'] = validator['etag']
+            if 'last_modified' in validator:
+                headers['If-Modified-Since'] = validator['last_modified']
+        start = time.perf_counter()
+        data_json = self.session().get(url, headers=headers, timeout=self._timeout)
+        logger.info('%s %s %.2fs %d bytes', data_json.status_code, url, time.perf_counter() - start, 
+                    len(data_json.content))
+        if data_json.status_code == 304:
+            return None
+        data_json.raise_for_status()
+        validator = dict()
+        if 'ETag' in data_json.headers:
+            validator['etag'] = data_json.headers['ETag']
+        if 'Last-Modified' in data_json.headers:
+            validator['last_modified'] = data_json.headers['Last-Modified']
+        with self._validators_lock:
+            if validator:
+                self._validators[key] = {'endpoint': endpoint, **validator}
+            else:
+                self._validators.pop(key, None)
+        return data_json.content
+
+
+    def save_validators(self):
+        '''
+        Persist the ETag/Last-Modified of the downloaded series for the next conditional requests, the entries of
+        series no longer downloaded (or keyed by URL by older versions) are dropped
+        '''
+        if self._validators_file is not None:
+            series = set(self._description_indicators_bcb) | set(self._description_indicators_ibge)
+            with self._validators_lock:
+                self._validators = {key: value for key, value in self._validators.items() if key in series}
+            with open(self._validators_file + '.tmp', 'w') as file:
+                json.dump(self._validators, file, indent=2, sort_keys=True)
+            os.replace(self._validators_file + '.tmp', self._validators_file)
+
+
+    def file_path(self, description):
+        '''
+        Path of the file of a series
+
+        Parameters: description : String
+                        Description of the series
+
+        Returns: String
+                    Path of the series Parquet file
+        '''
+        return os.path.join(self._data_dir, f'{description}.parquet')
+
+
+    def delta_start(self, description):
+        '''
+        First period to request in incremental mode, the last revision_periods stored are requested again
+
+        Parameters: description : String
+                        Description of the series
+
+        Returns: Pandas Timestamp
+                    First date to request, None when the whole series must be downloaded
+        '''
+        if not self._incremental:
+            return None
+        stored = read_series(self.file_path(description))
+        if stored is None or stored.empty:
+            return None
+        return stored['date'].iloc[max(len(stored) - self._revision_periods, 0)]
+
+
+    def url_central_bank(self, index):
+        '''
+        URL of the Central Bank of Brazil API
+
+        Parameters: index : Integer
+                        Position of the series in code_series_bcb
+
+        Returns: String
+                    URL of the series from initial_date, or from the last stored periods in incremental mode, 
+                    to final_date
+        '''
+        initial_date = self._initial_date
+        start = self.delta_start(self._description_indicators_bcb[index])
+        if start is not None:
+            initial_date = start.strftime('%d/%m/%Y')
+        return ('http://api.bcb.gov.br/dados/serie/bcdata.sgs.' + self._code_series_bcb[index] + 
+                '/dados?formato=json&dataInicial=' + initial_date + '&dataFinal=' + self._final_date)
+
+
+    def url_ibge(self, index):
+        '''
+        URL of the IBGE API
+
+        Parameters: index : Integer
+                        Position of the series in indicators_ibge
+
+        Returns: String
+                    URL of the series, in incremental mode the number of periods is reduced to the months after
+                    the last stored periods
+        '''
+        url = self._indicators_ibge[index]
+        start = self.delta_start(self._description_indicators_ibge[index])
+        if start is not None:
+            today = date.today()
+            periods = (today.year - start.year) * 12 + today.month - start.month + 1
+            url = re.sub(r'/periodos/-\d+/', f'/periodos/-{periods}/', url)
+        return url
+
+
+    def store(self, data, description):
+        '''
+        Write a downloaded series. In incremental mode the rows are merged with the stored file, downloaded rows 
+        replace the stored ones of the same date and revised values are logged. The file is replaced atomically.
+
+        Parameters: data : DataFrame
+                        Pandas DataFrame with date and % columns
+
+                    description : String
+                        Description of the series
+        '''
+        path = self.file_path(description)
+        stored = read_series(path) if self._incremental else None
+        if stored is not None:
+            overlap = stored.merge(data, on='date', suffixes=('_stored', ''))
+            revised = overlap[~np.isclose(overlap['%_stored'], overlap['%'], equal_nan=True)]
+            for _, row in revised.iterrows():
+                logger.warning('%s revised on %s: %s -> %s', description, row['date'].date(), row['%_stored'], 
+                               row['%'])
+            data = pd.concat([stored[~stored['date'].isin(data['date'])], data], ignore_index=True)
+            logger.info('%s: %d new rows, %d revised', description, len(data) - len(stored), len(revised))
+            data = data.sort_values('date').reset_index(drop=True)
+        write_series(data, path)
+
+
+    def save_central_bank(self, content, index):
+        '''
+        Save the response of the Central Bank of Brazil API
+
+        Parameters: content : Bytes
+                        JSON records of the series
+
+                    index : Integer
+                        Position of the series in code_series_bcb
+        '''
+        self.store(parse_sgs_json(content), self._description_indicators_bcb[index])
+
+
+    def save_ibge(self, content, index):
+        '''
+        Save the response of the IBGE API
+
+        Parameters: content : Bytes
+                        JSON content of the aggregate
+
+                    index : Integer
+                        Position of the series in indicators_ibge
+        '''
+        self.store(parse_ibge_json(content), self._description_indicators_ibge[index])
+
+
+    def download(self, tasks):
         '''
-        data_json = get_legacy_session().get(url)
-        data_dic = json.loads(data_json.content)
-        return data_dic
+        Download the series concurrently with at most max_workers requests at the same time, a failed series 
+        does not stop the others
+
+        Parameters: tasks : List of tuples
+                        (description, url, save function, index) of each series
+
+        Returns: List
+                    Descriptions of the series that could not be downloaded
+        '''
+        failed = list()
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {executor.submit(self.catch_content, url, description): (description, save, index) 
+                       for description, url, save, index in tasks}
+            for future in as_completed(futures):
+                description, save, index = futures[future]
+                try:
+                    content = future.result()
+                except Exception:
+                    logger.exception('Download of %s failed', description)
+                    failed.append(description)
+                    continue
+                if content is None:
+                    logger.info('%s not modified', description)
+                else:
+                    save(content, index)
+        self.save_validators()
+        return failed
+
+
+    def tasks_central_bank(self):
+        '''
+        Download tasks of the Central Bank of Brazil series
+        '''
+        return [(self._description_indicators_bcb[index], self.url_central_bank(index), self.save_central_bank, index) 
+                for index in range(len(self._code_series_bcb))]
+
+
+    def tasks_ibge(self):
+        '''
+        Download tasks of the IBGE series
+        '''
+        return [(self._description_indicators_ibge[index], self.url_ibge(index), self.save_ibge, index) 
+                for index in range(len(self._indicators_ibge))]
 
 
     def series_central_bank(self):
         '''
         Download the series via the Central Bank of Brazil API
+
+        Returns: List
+                    Descriptions of the series that could not be downloaded
         '''
-        for index in range(len(self._code_series_bcb)):
-            api_bcb = 'http://api.bcb.gov.br/dados/serie/bcdata.sgs.' + self._code_series_bcb[index] + '/dados?formato=json&dataInicial=' + self._initial_date + '&dataFinal=' + self._final_date
-            data_dic = self.catch_json(api_bcb)
-            date = list()
-            value = list()
-            for i in data_dic:
-                date.append(i['data'])
-                value.append(i['valor'])
-            date_df = pd.DataFrame({'date': date, '%': value})
-            date_df.to_csv(f'./data/{self._description_indicators_bcb[index]}.csv', index=False)
+        return self.download(self.tasks_central_bank())
 
 
     def series_ibge(self):
         '''
         Download the series through the API of the Brazilian Institute of Geography and Statistics
+
+        Returns: List
+                    Descriptions of the series that could not be downloaded
+        '''
+        return self.download(self.tasks_ibge())
+
+
+    def series_all(self):
+        '''
+        Download the Central Bank of Brazil and IBGE series concurrently
+
+        Returns: List
+                    Descriptions of the series that could not be downloaded
         '''
-        for index in range(len(self._indicators_ibge)):
-            data = self.catch_json(self._indicators_ibge[index])
-            data = data[0]['resultados'][0]['series'][0]['serie']
-            date = list()
-            rate = list()
-            for key, value in data.items():
-                date.append(key)
-                rate.append(value)
-            data_df = pd.DataFrame({'date': date, '%': rate})
-            data_df.to_csv(f'./data/{self._description_indicators_ibge[index]}.csv', index=False)
+        return self.download(self.tasks_central_bank() + self.tasks_ibge())
 
 
 class BrazilianIndicators:
@@ -121,10 +528,11 @@ class BrazilianIndicators:
     Takes and cleans information about investments and indexes and group it into a DataFrame Pandas
     '''
     def __init__(self, indicators_bcb=['Poupança', 'CDI', 'Selic'], indicators_ibge=['INPC', 'IPCA'],
-                data_frame_central_bank=pd.DataFrame(), 
+                data_frame_central_bank=None, 
                 files_central_bank=['./data/savings.csv', './data/cdi.csv', './data/selic.csv'], 
-                data_frame_ibge=pd.DataFrame(), 
-                files_ibge=['./data/inpc.csv', './data/ipca.csv']):
+                data_frame_ibge=None, 
+                files_ibge=['./data/inpc.csv', './data/ipca.csv'], how='inner', fill=None, 
+                cache_file='./data/.indicators_panel.parquet'):
         '''
         :param indicators_bcb: Indicators that was downloaded on Central Bank of Brazil API (BCB)
         :param indicators_ibge: Indicators that was downloaded from Brazilian Institute of Geography and Statistics API (IBGE)
@@ -132,58 +540,104 @@ class BrazilianIndicators:
         :param files_central_bank: Files that was downloaded from BCB API
         :param data_frame_ibge: DataFrame Pandas from the files that were downloaded from IBGE API 
         :param files_ibge: Files that were downloaded from IBGE API
+        :param how: Join of the series dates, 'inner' keeps only the dates present in all series and 'outer' keeps 
+        every date
+        :param fill: Fill policy of the missing values after an outer join: None, 'ffill', 'bfill' or a number
+        :param cache_file: Parquet file with the assembled indicators, reused while the input files do not change.
+        None disables the cache
         '''
         self._indicators_bcb = indicators_bcb
         self._indicators_ibge = indicators_ibge
-        self._data_frame_central_bank = data_frame_central_bank
+        self._data_frame_central_bank = pd.DataFrame() if data_frame_central_bank is None else data_frame_central_bank
         self._files_central_bank = files_central_bank
-        self._data_frame_ibge = data_frame_ibge
+        self._data_frame_ibge = pd.DataFrame() if data_frame_ibge is None else data_frame_ibge
         self._files_ibge = files_ibge
-        
+        self._how = how
+        self._fill = fill
+        self._cache_file = cache_file
+
+
+    def join_series(self, files, indicators):
+        '''
+        Read the series and align them on a shared DatetimeIndex with a single concat
+
+        Parameters: files : List of string
+                        Files of the series
+
+                    indicators : List of string
+                        Name of each series
+
+        Returns: DataFrame
+                    Pandas DataFrame with date column and one column per indicator
+        '''
+        series = [read_series(file).set_index('date')['%'].rename(indicator) 
+                  for file, indicator in zip(files, indicators)]
+        data = pd.concat(series, axis=1, join=self._how).sort_index()
+        if self._fill == 'ffill':
+            data = data.ffill()
+        elif self._fill == 'bfill':
+            data = data.bfill()
+        elif self._fill is not None:
+            data = data.fillna(self._fill)
+        data.index.name = 'date'
+        return data.reset_index()
+
+
+    def cache_key(self):
+        '''
+        Key of the assembled indicators: files read with their modification time and size, indicators and join
+        options
+
+        Returns: String
+                    JSON of the key
+        '''
+        files = list()
+        for file in self._files_central_bank + self._files_ibge:
+            source = series_source(file)
+            stat = os.stat(source)
+            files.append([source, stat.st_mtime_ns, stat.st_size])
+        return json.dumps([files, self._indicators_bcb, self._indicators_ibge, self._how, str(self._fill)])
+
 
     def clean_data_bcb(self):
         '''
         Read and process the data downloaded in the Bank's Time Series Management System Central, the data is monthly.
         '''
-        for index in range(len(self._files_central_bank)):
-            data = pd.read_csv(self._files_central_bank[index])
-            data.columns = ['date', self._indicators_bcb[index]]
-            data['date'] = pd.to_datetime(data['date'], format='%d/%m/%Y', dayfirst=True)
-            if self._data_frame_central_bank.empty:
-                self._data_frame_central_bank = pd.concat([self._data_frame_central_bank, data], axis=1)
-            else:
-                self._data_frame_central_bank = self._data_frame_central_bank.merge(data, on='date')
+        self._data_frame_central_bank = self.join_series(self._files_central_bank, self._indicators_bcb)
     
 
     def clean_data_ibge(self):
         '''
         Read and process the data made available by the IBGE, the data are monthly
         '''
-        for index in range(len(self._files_ibge)):
-            data = pd.read_csv(self._files_ibge[index])
-            data.columns = ['date', self._indicators_ibge[index]]
-            data['date'] = data['date'].astype('str')
-            data['year'] = data['date'].str[:4]
-            data['month'] = data['date'].str[4:]
-            data['date'] = '01' + '/' + data['month'] + '/' + data['year']
-            data.drop(['month', 'year'], axis=1, inplace=True)
-            data['date'] = pd.to_datetime(data['date'], format='%d/%m/%Y', dayfirst=True)
-            if self._data_frame_ibge.empty:
-                self._data_frame_ibge = pd.concat([self._data_frame_ibge, data], axis=1)
-            else:
-                self._data_frame_ibge = self._data_frame_ibge.merge(data, on='date')
+        self._data_frame_ibge = self.join_series(self._files_ibge, self._indicators_ibge)
 
 
     def data_frame_indicators(self):
         '''
-        Gather all files into a DataFrame Pandas
+        Gather all files into a DataFrame Pandas. The series are joined in one pass and the result is cached in
+        cache_file, keyed by the modification time of the input files
 
         Returns: DataFrame
                     Pandas DataFrame of merged indicators form Central Bank and IBGE
         '''
-        data_frame = pd.merge(self._data_frame_central_bank, self._data_frame_ibge, on='date')
+        key = self.cache_key()
+        if self._cache_file is not None and os.path.exists(self._cache_file):
+            table = pq.read_table(self._cache_file)
+            if (table.schema.metadata or dict()).get(b'indicators_key') == key.encode():
+                return table.to_pandas()
+        data_frame = self.join_series(self._files_central_bank + self._files_ibge, 
+                                      self._indicators_bcb + self._indicators_ibge)
+        if self._cache_file is not None:
+            table = pa.Table.from_pandas(data_frame, preserve_index=False)
+            table = table.replace_schema_metadata({**table.schema.metadata, b'indicators_key': key.encode()})
+            temp_file = os.path.join(os.path.dirname(self._cache_file), 
+                                     '.' + os.path.basename(self._cache_file) + '.tmp')
+            pq.write_table(table, temp_file)
+            os.replace(temp_file, self._cache_file)
         return data_frame
 
+
 def carteira_ibov(tickers_file_path: str, cols: list):
     '''
     Read csv file related of IBOV theoretical portfolio
@@ -205,13 +659,119 @@ def carteira_ibov(tickers_file_path: str, cols: list):
     return carteira
 
 
-@st.cache
-def read_fund_data(path: str):
+def carteira_weights(tickers_file_path: str):
+    '''
+    Weights of the IBOV theoretical portfolio
+
+    Parameters: tickers_file_path : String
+                    Directory of CSV file
+
+    Returns: Pandas Series
+                Weight in % (Part. (%)) indexed by ticker with the Yahoo Finance suffix
+    '''
+    # The lines end with a separator, without index_col=False the columns are shifted
+    carteira = pd.read_csv(tickers_file_path, encoding='ISO-8859-1', sep=';', skiprows=1, skipfooter=2,
+                           usecols=['Código', 'Part. (%)'], index_col=False, decimal=',', thousands='.', 
+                           engine='python')
+    return pd.Series(carteira['Part. (%)'].to_numpy(), index=(carteira['Código'] + '.SA').to_numpy(), 
+                     name='part. (%)')
+
+
+def read_price_panel(path: str):
+    '''
+    Read the wide panel of adjusted close prices written by etl/update_prices.py (or by catch_clean_r.R)
+
+    Parameters: path : String
+                    CSV file with a date column and one column per ticker
+
+    Returns: Pandas DataFrame
+                DataFrame indexed by date with one column per ticker
+    '''
+    panel = pd.read_csv(path)
+    # The R file has row names, the date is a column in both formats
+    panel = panel.set_index(pd.to_datetime(panel.pop('date')))
+    panel.columns = panel.columns.str.strip()
+    return panel.sort_index()
+
+
+# Compact dtypes of the fund history: codes for the identifiers and 32 bits for the values, the 7 significant
+# digits of float32 are enough for quotas, net worth and flows in the charts and statistics
+FUND_DTYPES = {'cnpj_fundo': 'category', 'denom_social': 'category', 'vl_quota': 'float32', 
+               'vl_patrim_liq': 'float32', 'captc_dia': 'float32', 'resg_dia': 'float32', 'nr_cotst': 'int32',
+               'vl_total': 'float32'}
+FUND_KEY = ['date', 'cnpj_fundo']
+
+
+def memory_footprint(data: pd.DataFrame):
+    '''
+    Memory used by a DataFrame, including the strings of object columns
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame
+
+    Returns: Float
+                Memory in MB
+    '''
+    return data.memory_usage(deep=True).sum() / 2 ** 20
+
+
+def compact_fund_data(data: pd.DataFrame):
+    '''
+    Convert the fund history to the FUND_DTYPES schema and keep one record by (date, cnpj_fundo), logging the
+    memory before and after
+
+    Parameters: data : DataFrame
+                    Fund history with any subset of the columns of read_fund_data
+
+    Returns: DataFrame
+                Pandas DataFrame with compact dtypes, the last record of each repeated key is kept
+    '''
+    before = memory_footprint(data)
+    if set(FUND_KEY).issubset(data.columns):
+        data = data.drop_duplicates(FUND_KEY, keep='last')
+    dtypes = {column: dtype for column, dtype in FUND_DTYPES.items() if column in data.columns}
+    # Shareholders are integers only when no day is missing
+    if 'nr_cotst' in dtypes and (data['nr_cotst'].isna().any() or data['nr_cotst'].max() > np.iinfo('int32').max):
+        dtypes['nr_cotst'] = 'float32'
+    data = data.astype(dtypes).reset_index(drop=True)
+    logger.info('Fund history: %d rows, %.1f MB -> %.1f MB', len(data), before, memory_footprint(data))
+    return data
+
+
+@st.cache(allow_output_mutation=True)
+def read_fund_csv(path: str):
+    '''
+    Read historical investment fund data from the monolithic CSV file
+
+    Parameters: path : String 
+                    The file path or URL
+
+    Returns: DataFrame
+                Pandas DataFrame with all the fund historical data in the compact schema of compact_fund_data
+    '''
+    df = pd.read_csv(path, parse_dates=['date'])
+    return compact_fund_data(df)
+
+
+def read_fund_data(path: str, columns=None, cnpjs=None, start_date=None, end_date=None):
     '''
     Read historical investment fund data 
 
     Parameters: path : String 
-                    The file path
+                    The file path, a directory written by etl.fund_store.write_fund_store is read with column 
+                    projection and CNPJ/date predicates pushed down, any other path is read as CSV
+
+                columns : List of string
+                    Columns to read, None to read all columns
+
+                cnpjs : List of string
+                    Selected CNPJs, None to keep all funds
+
+                start_date : String or datetime
+                    First date to keep, None to keep all history
+
+                end_date : String or datetime
+                    Last date to keep, None to keep all history
 
     Returns: DataFrame
                 Pandas DataFrame with fund historical data containing with the following columns: 
@@ -223,18 +783,28 @@ def read_fund_data(path: str):
                     captc_dia: Fundraising carried out on the day
                     resg_dia: Redemptions paid on the day 
                     nr_cotst: Number of shareholders
+                with the compact dtypes of FUND_DTYPES
     '''
-    df = pd.read_csv(path)
-    df['date'] = pd.to_datetime(df['date'])
-    df.drop_duplicates(inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    return df
-
-
-@st.cache    
-def request_data(selected_tickers: list, start_date: str):
+    if is_fund_store(path):
+        return compact_fund_data(read_fund_store(path, columns=columns, cnpjs=cnpjs, start_date=start_date,
+                                                 end_date=end_date))
+    df = read_fund_csv(path)
+    mask = pd.Series(True, index=df.index)
+    if cnpjs is not None:
+        mask &= df['cnpj_fundo'].isin(cnpjs)
+    if start_date is not None:
+        mask &= df['date'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= df['date'] <= pd.Timestamp(end_date)
+    if columns is None:
+        columns = df.columns
+    return df.loc[mask, list(columns)].reset_index(drop=True)
+
+
+def request_data(selected_tickers: list, start_date: str, store=None):
     '''
-    Download historical financial data from Yahoo Finance about ticker negatiation 
+    Historical financial data from Yahoo Finance about ticker negatiation, read from the local price store and
+    downloading only the missing tickers and periods
 
     Parameters: selected_tickers : List of string 
                     Company tickers selected to download
@@ -242,24 +812,16 @@ def request_data(selected_tickers: list, start_date: str):
                 start_date: String
                     Initial date to download historical data
 
+                store: PriceStore
+                    Local price store, None uses ./data/precos with Yahoo Finance as downloader
+
     Returns: DataFrame
                 Pandas DataFrame with Open, High, Low, Close, Adj Close and Volume columns about selected tickers 
                 market negatiation
     '''
-    today = date.today()
-    df = yf.download(tickers=selected_tickers, start=start_date, end=today)
-    #df.reset_index(inplace=True)
+    if store is None:
+        store = PriceStore()
+    # The current day is not complete, prices until yesterday as yf.download(end=today)
+    yesterday = date.today() - timedelta(days=1)
+    df = store.get(selected_tickers, start_date, yesterday)
     return df
-
-
-def data_aggregation(data: pd.DataFrame, aggregation: str, function: object):
-    if aggregation == 'Ano':
-        data[aggregation] = data['date'].dt.year
-    elif aggregation == 'Trimestre':
-        data[aggregation] = data['date'].dt.quarter
-    elif aggregation == 'Mês':
-        data[aggregation] = data['date'].dt.month
-
-    data_agg = data.groupby(aggregation, as_index=True).apply(function).copy()
-
-    return data_agg
\ No newline at end of file
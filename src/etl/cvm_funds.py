@@ -0,0 +1,253 @@
+import os
+import re
+import glob
+import json
+import hashlib
+import logging
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from etl.fund_store import remove_fund_partition, write_fund_partition
+
+
+logger = logging.getLogger(__name__)
+
+# Columns of the CVM daily report (inf_diario_fi_YYYYMM.csv) kept in the fund history
+CVM_COLUMNS = ['CNPJ_FUNDO', 'DT_COMPTC', 'VL_TOTAL', 'VL_QUOTA', 'VL_PATRIM_LIQ', 'CAPTC_DIA', 'RESG_DIA', 'NR_COTST']
+FUND_COLUMNS = ['date', 'cnpj_fundo', 'denom_social', 'vl_quota', 'vl_patrim_liq', 'captc_dia', 'resg_dia',
+                'nr_cotst', 'vl_total']
+CVM_ENCODING = 'ISO-8859-1'
+CHUNK_SIZE = 200000
+# Files starting with underscore are ignored when the store is read as a dataset
+MANIFEST_FILE = '_manifest.json'
+
+# Set once per worker process by init_worker, avoiding to send them with every month
+_worker_cnpjs = None
+_worker_denominations = None
+
+
+def file_hash(path: str, block_size=1 << 20):
+    '''
+    SHA-256 of a file read in blocks
+
+    Parameters: path : String
+                    File path
+
+                block_size : Integer
+                    Bytes read at each step
+
+    Returns: String
+                Hexadecimal digest of the file content
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_period(path: str):
+    '''
+    Year and month of a CVM daily report from its file name
+
+    Parameters: path : String
+                    Path of inf_diario_fi_YYYYMM.csv file
+
+    Returns: Tuple
+                (year, month) of the report
+    '''
+    period = re.search(r'(\d{4})(\d{2})\.csv$', os.path.basename(path))
+    return int(period.group(1)), int(period.group(2))
+
+
+def valid_cnpjs(reference_file: str, min_shareholders=1000):
+    '''
+    CNPJs of the funds with at least min_shareholders on average in the reference month, the file is read
+    in chunks
+
+    Parameters: reference_file : String
+                    CVM daily report used as reference
+
+                min_shareholders : Integer
+                    Minimum average number of shareholders
+
+    Returns: List
+                Sorted list of valid CNPJs
+    '''
+    total = pd.Series(dtype='float64')
+    count = pd.Series(dtype='float64')
+    for chunk in pd.read_csv(reference_file, encoding=CVM_ENCODING, sep=';', usecols=['CNPJ_FUNDO', 'NR_COTST'],
+                             chunksize=CHUNK_SIZE):
+        group = chunk.groupby('CNPJ_FUNDO')['NR_COTST']
+        total = total.add(group.sum(), fill_value=0)
+        count = count.add(group.count(), fill_value=0)
+    mean = total / count
+    return sorted(mean[mean >= min_shareholders].index)
+
+
+def fund_denominations(cadastro_file: str):
+    '''
+    Social denomination of each fund from the CVM register
+
+    Parameters: cadastro_file : String
+                    Path of cad_fi.csv
+
+    Returns: Dictionary
+                CNPJ as key and social denomination as value
+    '''
+    cadastro = pd.read_csv(cadastro_file, encoding=CVM_ENCODING, sep=';', usecols=['CNPJ_FUNDO', 'DENOM_SOCIAL'])
+    cadastro = cadastro.dropna().drop_duplicates('CNPJ_FUNDO', keep='last')
+    return dict(zip(cadastro['CNPJ_FUNDO'], cadastro['DENOM_SOCIAL']))
+
+
+def init_worker(cnpjs, denominations):
+    '''
+    Keep the valid CNPJs and the denominations in the worker process
+    '''
+    global _worker_cnpjs, _worker_denominations
+    _worker_cnpjs = set(cnpjs)
+    _worker_denominations = denominations
+
+
+def read_monthly_file(path: str, cnpjs, denominations):
+    '''
+    Read a CVM daily report in chunks keeping only the valid funds
+
+    Parameters: path : String
+                    Path of inf_diario_fi_YYYYMM.csv file
+
+                cnpjs : Set of string
+                    Valid CNPJs
+
+                denominations : Dictionary
+                    CNPJ as key and social denomination as value
+
+    Returns: DataFrame
+                Pandas DataFrame with the columns of the fund history, empty when no valid fund is in the file
+    '''
+    chunks = list()
+    for chunk in pd.read_csv(path, encoding=CVM_ENCODING, sep=';', usecols=lambda column: column in CVM_COLUMNS,
+                             chunksize=CHUNK_SIZE):
+        chunk = chunk[chunk['CNPJ_FUNDO'].isin(cnpjs)]
+        if not chunk.empty:
+            chunks.append(chunk)
+    if not chunks:
+        # No valid fund in the month
+        return pd.DataFrame(columns=FUND_COLUMNS)
+    data = pd.concat(chunks, ignore_index=True)
+    data['DENOM_SOCIAL'] = data['CNPJ_FUNDO'].map(denominations)
+    # Funds without social denomination are not in the register
+    data = data[data['DENOM_SOCIAL'].notna()].copy()
+    data.columns = data.columns.str.lower()
+    data.rename(columns={'dt_comptc': 'date'}, inplace=True)
+    data['date'] = pd.to_datetime(data['date'], format='%Y-%m-%d')
+    data.drop_duplicates(['date', 'cnpj_fundo'], keep='last', inplace=True)
+    return data.reindex(columns=FUND_COLUMNS)
+
+
+def ingest_month(path: str, store_root: str):
+    '''
+    Read one CVM daily report and write it as a partition of the fund history store, runs in a worker process
+
+    Parameters: path : String
+                    Path of inf_diario_fi_YYYYMM.csv file
+
+                store_root : String
+                    Root directory of the fund history store
+
+    Returns: Tuple
+                Path and number of rows written
+    '''
+    year, month = file_period(path)
+    data = read_monthly_file(path, _worker_cnpjs, _worker_denominations)
+    if data.empty:
+        # A partition without columns types would break the schema of the store, the previous one is removed
+        remove_fund_partition(store_root, year, month)
+    else:
+        write_fund_partition(data, store_root, year, month)
+    return path, len(data)
+
+
+def read_manifest(store_root: str):
+    '''
+    Manifest of the files already ingested in the store
+
+    Parameters: store_root : String
+                    Root directory of the fund history store
+
+    Returns: Dictionary
+                Manifest content, empty when the store was never built
+    '''
+    path = os.path.join(store_root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(manifest: dict, store_root: str):
+    '''
+    Write the manifest atomically so an interrupted run keeps the previous state
+    '''
+    os.makedirs(store_root, exist_ok=True)
+    path = os.path.join(store_root, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def ingest_cvm_history(inf_diario_dir: str, cadastro_file: str, reference_file: str, store_root: str,
+                       min_shareholders=1000, workers=None):
+    '''
+    Build or update the fund history store from the CVM daily reports. Monthly files are read in a process pool
+    and only new or changed files (by SHA-256) are ingested, a change of the valid funds or of their
+    denominations rebuilds every month
+
+    Parameters: inf_diario_dir : String
+                    Directory with the inf_diario_fi_YYYYMM.csv files, subdirectories are searched too
+
+                cadastro_file : String
+                    Path of cad_fi.csv
+
+                reference_file : String
+                    CVM daily report used to select the funds by number of shareholders
+
+                store_root : String
+                    Root directory of the fund history store
+
+                min_shareholders : Integer
+                    Minimum average number of shareholders in the reference month
+
+                workers : Integer
+                    Number of worker processes, None uses the number of CPUs
+
+    Returns: List
+                Files ingested in this run
+    '''
+    cnpjs = valid_cnpjs(reference_file, min_shareholders)
+    # Only the denominations of the valid funds, the register changes with every release of the CVM
+    register = fund_denominations(cadastro_file)
+    denominations = {cnpj: register[cnpj] for cnpj in cnpjs if cnpj in register}
+    selection_hash = hashlib.sha256(json.dumps([cnpjs, sorted(denominations.items())]).encode()).hexdigest()
+
+    manifest = read_manifest(store_root)
+    if manifest.get('selection') != selection_hash:
+        manifest = {'selection': selection_hash, 'files': {}}
+    files = sorted(glob.glob(os.path.join(inf_diario_dir, '**', 'inf_diario_fi_*.csv'), recursive=True))
+    hashes = {os.path.basename(path): file_hash(path) for path in files}
+    pending = [path for path in files if manifest['files'].get(os.path.basename(path)) != hashes[os.path.basename(path)]]
+
+    ingested = list()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(cnpjs, denominations)) as executor:
+            futures = [executor.submit(ingest_month, path, store_root) for path in pending]
+            for future in as_completed(futures):
+                path, rows = future.result()
+                # The manifest is saved after each month, a failed run resumes from where it stopped
+                manifest['files'][os.path.basename(path)] = hashes[os.path.basename(path)]
+                write_manifest(manifest, store_root)
+                ingested.append(path)
+                logger.info('%s: %d registros', os.path.basename(path), rows)
+    write_manifest(manifest, store_root)
+    return ingested
@@ -0,0 +1,618 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from etl.catch_clean import (BrazilianIndicators, carteira_ibov, carteira_weights, read_fund_data, read_price_panel,
+                             read_series, write_series)
+from etl.fund_index import FundIndex
+from etl.fund_store import is_fund_store
+from analytics.aggregation import calendar_rollups
+from analytics.returns import update_returns_panel
+from analytics.correlation import cluster_order, correlation_matrix, to_returns
+from analytics.decomposition import monthly_mean, series_fingerprint
+from analytics.flows import FlowCube
+from analytics.optimization import optimize_portfolio
+from analytics.statistics import periods_per_year
+from etl.decomposition_store import DecompositionStore
+from etl.flow_store import FlowStore
+from etl.snapshot_store import SnapshotStore
+from etl.price_store import PriceStore
+from etl.risk_store import RiskStore
+
+
+# Written by the ETL jobs (etl/update_data.py, etl/update_funds.py) when new data is available
+VERSION_FILE = './data/.version'
+# Cached datasets are reloaded at least every 6 hours even without a new version
+CACHE_TTL = 6 * 60 * 60
+FUNDS_STORE = './data/fundos_historico'
+# Memory-mapped datasets published by the ETL jobs, shared by the Streamlit processes of the node
+SNAPSHOTS = './data/snapshots'
+# Compounded factors and trailing rates of the economic indices, see index_returns
+INDEX_RETURNS_FILE = './data/.index_returns.parquet'
+# Wide panel of adjusted close prices of the IBOVESPA tickers written by etl/update_prices.py
+IBOV_PANEL = './data/ibov.csv'
+# IBOVESPA index, benchmark of the portfolio views
+BENCHMARK = '^BVSP'
+# Risk metrics of every ticker and fund written by etl/update_prices.py and etl/update_funds.py
+RISK_DIR = './data/risco'
+# Flow cubes of the funds written by etl/update_funds.py
+FLOWS_DIR = './data/fluxos'
+FUNDS_CSV = 'https://bitbucket.org/marcos_rmg/largedata/raw/65a1af3d452651c9775ba8538e49d59ce0c1b38b/fundos.csv'
+
+
+def data_version(version_file=VERSION_FILE):
+    '''
+    Current version of the local datasets, part of the key of every cached loader
+
+    Parameters: version_file : String
+                    File written by publish_version
+
+    Returns: String
+                Version published by the last ETL run, empty string when no version was published
+    '''
+    try:
+        with open(version_file) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return ''
+
+
+def publish_version(version_file=VERSION_FILE):
+    '''
+    Publish a new version of the local datasets, invalidating the cached loaders of every Streamlit process
+
+    Parameters: version_file : String
+                    File read by data_version
+
+    Returns: String
+                Published version
+    '''
+    version = str(time.time_ns())
+    temp_file = version_file + '.tmp'
+    with open(temp_file, 'w') as file:
+        file.write(version)
+    os.replace(temp_file, version_file)
+    return version
+
+
+def lock_columns(data: pd.DataFrame):
+    '''
+    Make the NumPy arrays of the columns of a DataFrame and the arrays they are views of read-only
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame to be shared
+
+    Returns: Boolean
+                True when a new view of every NumPy column is read-only, False when the frame stores them in arrays
+                that are not reachable from the columns (views of other arrays)
+    '''
+    positions = [position for position, dtype in enumerate(data.dtypes) if isinstance(dtype, np.dtype)]
+    for position in positions:
+        values = data.iloc[:, position].to_numpy()
+        values.flags.writeable = False
+        if isinstance(values.base, np.ndarray):
+            values.base.flags.writeable = False
+    return not any(data.iloc[:, position].to_numpy().flags.writeable for position in positions)
+
+
+def freeze(data: pd.DataFrame):
+    '''
+    Make the NumPy arrays of a cached DataFrame read-only, the same object is shared by every session so any
+    in place change raises an error instead of leaking to other users
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame to be shared
+
+    Returns: DataFrame
+                The same DataFrame, or a read-only copy when its columns are views of arrays that can not be locked
+    '''
+    if not lock_columns(data):
+        data = data.copy()
+        lock_columns(data)
+    return data
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=2, allow_output_mutation=True, show_spinner=False)
+def cached_indicators(version: str):
+    '''
+    Economic indicators of BCB and IBGE shared by all sessions, mapped from the snapshot of etl/update_data.py
+    when it was published
+    '''
+    indicators = SnapshotStore(SNAPSHOTS).read('indicadores')
+    if indicators is None:
+        indicators = BrazilianIndicators().data_frame_indicators()
+    return freeze(indicators)
+
+
+def index_returns(indicators: pd.DataFrame, path=INDEX_RETURNS_FILE):
+    '''
+    Returns panel (see analytics.returns.returns_panel) of the economic indices. The panel stored in path by
+    etl/update_data.py is continued in memory, only new or revised months are computed, the file is not written.
+
+    Parameters: indicators : DataFrame
+                    Pandas DataFrame of merged indicators from Central Bank and IBGE
+
+                path : String
+                    Parquet file of the panel
+
+    Returns: DataFrame
+                Pandas DataFrame with the rates, factors and trailing 12 months rates of all indices
+    '''
+    indices = [column for column in indicators.columns if column != 'date']
+    return update_returns_panel(read_series(path), indicators, indices)
+
+
+def write_index_returns(indicators: pd.DataFrame, path=INDEX_RETURNS_FILE):
+    '''
+    Update the returns panel of the economic indices stored in path, written only when it changes. Called by the
+    ETL job, the app processes only read the panel.
+
+    Parameters: indicators : DataFrame
+                    Pandas DataFrame of merged indicators from Central Bank and IBGE
+
+                path : String
+                    Parquet file of the panel
+
+    Returns: DataFrame
+                Pandas DataFrame with the rates, factors and trailing 12 months rates of all indices
+    '''
+    indices = [column for column in indicators.columns if column != 'date']
+    stored = read_series(path)
+    panel = update_returns_panel(stored, indicators, indices)
+    if panel is not stored:
+        write_series(panel, path)
+    return panel
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=2, allow_output_mutation=True, show_spinner=False)
+def cached_index_returns(version: str):
+    '''
+    Returns panel of the economic indices shared by all sessions
+    '''
+    return freeze(index_returns(cached_indicators(version)))
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=2, allow_output_mutation=True, show_spinner=False)
+def cached_carteira(version: str):
+    '''
+    IBOVESPA theoretical portfolio shared by all sessions, mapped from the snapshot of etl/update_prices.py when it
+    was published
+    '''
+    carteira = SnapshotStore(SNAPSHOTS).read('carteira')
+    if carteira is None:
+        carteira = carteira_ibov('./data/carteira_ibov.csv', cols=['Código'])
+    return freeze(carteira)
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=2, allow_output_mutation=True, show_spinner=False)
+def cached_backtest_data(version: str):
+    '''
+    Price panel, theoretical weights and IBOVESPA level of the portfolio backtest shared by all sessions
+    '''
+    panel = freeze(read_price_panel(IBOV_PANEL))
+    weights = carteira_weights('./data/carteira_ibov.csv')
+    return panel, weights, benchmark_levels()
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=4, allow_output_mutation=True, show_spinner=False)
+def cached_risk_metrics(universe: str, version: str):
+    '''
+    Risk metrics of a universe shared by all sessions
+    '''
+    metrics = RiskStore(RISK_DIR).read(universe)
+    return None if metrics is None else freeze(metrics)
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=4, allow_output_mutation=True, show_spinner=False)
+def cached_flow_cube(frequency: str, version: str):
+    '''
+    Searchable flow cube of a frequency shared by all sessions
+    '''
+    cube = FlowStore(FLOWS_DIR).read(frequency)
+    return None if cube is None else FlowCube(cube, monthly=frequency == 'mensal')
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=2, allow_output_mutation=True, show_spinner=False)
+def cached_fund_index(path: str, version: str):
+    '''
+    Lookup index of the whole fund history shared by all sessions, built once per data version over the snapshot
+    of etl/update_funds.py when the store is used
+    '''
+    data = SnapshotStore(SNAPSHOTS).read('fundos') if is_fund_store(path) else None
+    if data is None:
+        data = read_fund_data(path)
+    index = FundIndex(data)
+    freeze(index.catalog)
+    return index
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=64, allow_output_mutation=True, show_spinner=False)
+def cached_fund_pivot(path: str, column: str, cnpjs: tuple, start_date, end_date, version: str):
+    '''
+    Wide table of one indicator of the selected funds shared by all sessions
+    '''
+    return freeze(cached_fund_index(path, version).pivot(column, list(cnpjs), start_date, end_date))
+
+
+# The series are not hashed, the rollups are identified by the dataset, the date window, the last date with data
+# (prices topped up by request_data do not change the data version) and the data version
+@st.cache(ttl=CACHE_TTL, max_entries=32, allow_output_mutation=True, show_spinner=False,
+          hash_funcs={pd.DataFrame: lambda _: None})
+def cached_rollups(dataset: tuple, start_date, end_date, last_date: str, rates: bool, version: str,
+                   series: pd.DataFrame):
+    '''
+    Calendar rollups of a dataset window shared by all sessions
+    '''
+    rollups = calendar_rollups(series, series.index, rates=rates)
+    return {key: freeze(rollup) for key, rollup in rollups.items()}
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=32, allow_output_mutation=True, show_spinner=False,
+          hash_funcs={pd.DataFrame: lambda _: None})
+def cached_correlation(dataset: tuple, columns: tuple, start_date, end_date, last_date: str, rates: bool,
+                       version: str, series: pd.DataFrame):
+    '''
+    Returns and clustered correlation matrix of a dataset window shared by all sessions
+    '''
+    returns = to_returns(series, rates=rates)
+    correlation = correlation_matrix(returns)
+    order = cluster_order(correlation)
+    return freeze(returns), freeze(correlation.loc[order, order])
+
+
+@st.cache(ttl=CACHE_TTL, max_entries=64, allow_output_mutation=True, show_spinner=False,
+          hash_funcs={pd.Series: lambda _: None})
+def cached_decomposition(name: str, fingerprint: str, period: int, model: str, backend: str, series: pd.Series):
+    '''
+    Decomposition of a series shared by all sessions, identified by the fingerprint of the series
+    '''
+    return freeze(DecompositionStore().get(name, series, period=period, model=model, backend=backend))
+
+
+# The prices are not hashed, the solution is identified by the tickers, the window and the last date with prices
+@st.cache(ttl=CACHE_TTL, max_entries=32, allow_output_mutation=True, show_spinner=False,
+          hash_funcs={pd.DataFrame: lambda _: None})
+def cached_optimization(tickers: tuple, start_date, end_date, last_date: str, method: str, risk_free: float,
+                        max_weight: float, prices: pd.DataFrame):
+    '''
+    Mean-variance optimization of the selected tickers shared by all sessions
+    '''
+    return optimize_portfolio(prices, method=method, risk_free=risk_free, max_weight=max_weight,
+                              periods=periods_per_year(prices.index))
+
+
+def indicator_series(indicators: pd.DataFrame):
+    '''
+    Monthly series of each economic indicator, named as in the decomposition store
+
+    Parameters: indicators : DataFrame
+                    Pandas DataFrame of merged indicators from Central Bank and IBGE
+
+    Returns: Dictionary
+                'indicadores-<indicator>' as key and Pandas Series indexed by date as value
+    '''
+    data = indicators.set_index('date')
+    return {f'indicadores-{column}': data[column] for column in data.columns}
+
+
+def ticker_series(store, tickers: list):
+    '''
+    Monthly mean of the close price of each ticker in the price store, named as in the decomposition store
+
+    Parameters: store : PriceStore
+                    Local price store
+
+                tickers : List of string
+                    Company tickers
+
+    Returns: Dictionary
+                'precos-<ticker>' as key and Pandas Series indexed by the last day of the month as value
+    '''
+    series = dict()
+    for ticker in tickers:
+        data, _ = store.read(ticker)
+        if data is not None and not data.empty:
+            series[f'precos-{ticker}'] = monthly_mean(data['Close'])
+    return series
+
+
+def load_indicators():
+    '''
+    Economic indicators of the current data version
+
+    Returns: DataFrame
+                Read-only Pandas DataFrame of merged indicators from Central Bank and IBGE
+    '''
+    return cached_indicators(data_version())
+
+
+def load_index_returns():
+    '''
+    Returns panel of the economic indices of the current data version
+
+    Returns: DataFrame
+                Read-only Pandas DataFrame with date, the monthly rates, '<serie> fator' and '<serie> 12m' columns,
+                series are the indices and the real rates '<nominal> real <inflation>'
+    '''
+    return cached_index_returns(data_version())
+
+
+def load_carteira():
+    '''
+    IBOVESPA theoretical portfolio of the current data version
+
+    Returns: DataFrame
+                Read-only Pandas DataFrame with index (ticker) and código columns
+    '''
+    return cached_carteira(data_version())
+
+
+def load_backtest_data():
+    '''
+    Inputs of the portfolio backtest of the current data version
+
+    Returns: panel : DataFrame
+                Read-only Pandas DataFrame of adjusted close prices indexed by date, one column per ticker
+             weights : Pandas Series
+                Weight in % of the theoretical portfolio indexed by ticker
+             benchmark : Pandas Series
+                Adjusted close of the IBOVESPA indexed by date, None when it is not stored
+    '''
+    return cached_backtest_data(data_version())
+
+
+def load_risk_metrics(universe: str, names: list):
+    '''
+    Risk metrics of some series of the current data version, computed by the ETL over the whole stored history
+
+    Parameters: universe : String
+                    'acoes' or 'fundos'
+
+                names : List of string
+                    Tickers or CNPJs
+
+    Returns: DataFrame
+                Pandas DataFrame indexed by série with the columns of analytics.risk.RISK_COLUMNS, only the series
+                found, None when the metrics were not computed
+    '''
+    metrics = cached_risk_metrics(universe, data_version())
+    if metrics is None:
+        return None
+    return metrics.reindex([name for name in names if name in metrics.index])
+
+
+def load_flow_cube(frequency='diario'):
+    '''
+    Flow cube of the funds of the current data version, computed by the ETL over the whole fund history
+
+    Parameters: frequency : String
+                    'diario' or 'mensal'
+
+    Returns: FlowCube
+                Rankings and records of the cube, None when the cubes were not computed
+    '''
+    return cached_flow_cube(frequency, data_version())
+
+
+def benchmark_levels(store=None):
+    '''
+    Adjusted close of the IBOVESPA stored by etl/update_prices.py
+
+    Parameters: store : PriceStore
+                    Local price store, the default one when it is None
+
+    Returns: Pandas Series
+                Level indexed by date, None when it is not stored
+    '''
+    data, _ = (store or PriceStore()).read(BENCHMARK)
+    return None if data is None or data.empty else data['Adj Close']
+
+
+def funds_path():
+    '''
+    Source of the fund history: the local store written by etl/update_funds.py or the remote CSV while it is not
+    available
+
+    Returns: String
+                Path of the fund history
+    '''
+    return FUNDS_STORE if is_fund_store(FUNDS_STORE) else FUNDS_CSV
+
+
+def load_fund_index():
+    '''
+    Lookup index of the fund history of the current data version
+
+    Returns: FundIndex
+                Index with the catalog of funds, the CNPJs of each denomination and the rows of each fund
+    '''
+    return cached_fund_index(funds_path(), data_version())
+
+
+def load_fund_catalog():
+    '''
+    Funds available in the fund history of the current data version
+
+    Returns: DataFrame
+                Read-only Pandas DataFrame with one row per fund and the columns cnpj_fundo and denom_social,
+                ordered by denomination
+    '''
+    return load_fund_index().catalog
+
+
+def load_fund_data(columns: list, cnpjs: list, start_date=None, end_date=None):
+    '''
+    Slice of the fund history of the current data version, the rows of each fund are read from the index
+
+    Parameters: columns : List of string
+                    Columns to read
+
+                cnpjs : List of string
+                    Selected CNPJs
+
+                start_date : String or datetime
+                    First date to keep
+
+                end_date : String or datetime
+                    Last date to keep
+
+    Returns: DataFrame
+                Pandas DataFrame with the selected funds, columns and period
+    '''
+    return load_fund_index().select(columns=columns, cnpjs=cnpjs, start_date=start_date, end_date=end_date)
+
+
+def load_fund_pivot(column: str, cnpjs: list, start_date=None, end_date=None):
+    '''
+    Wide table of one indicator of the selected funds of the current data version
+
+    Parameters: column : String
+                    Indicator of the fund history
+
+                cnpjs : List of string
+                    Selected CNPJs
+
+                start_date : String or datetime
+                    First date to keep
+
+                end_date : String or datetime
+                    Last date to keep
+
+    Returns: DataFrame
+                Read-only Pandas DataFrame with a date column and one column per fund
+    '''
+    return cached_fund_pivot(funds_path(), column, tuple(cnpjs), start_date, end_date, data_version())
+
+
+def load_rollups(dataset: tuple, data: pd.DataFrame, dates, start_date, end_date, rates=True):
+    '''
+    Calendar rollups (see analytics.aggregation.calendar_rollups) of the current data version, computed once per
+    dataset and date window
+
+    Parameters: dataset : Tuple
+                    Identification of the data: name and the selection used to build it (tickers, CNPJs, 
+                    indicator), None to compute without the cache
+
+                data : DataFrame
+                    Pandas DataFrame with only the series, one column per series
+
+                dates : Array like
+                    Dates of the rows
+
+                start_date : String or datetime
+                    First date of the window
+
+                end_date : String or datetime
+                    Last date of the window
+
+                rates : Boolean
+                    True when the series are rates in %, False when they are levels
+
+    Returns: Dictionary
+                (period, function) as key and read-only Pandas DataFrame as value
+    '''
+    series = data.set_axis(pd.DatetimeIndex(dates), axis=0)
+    if dataset is None:
+        return calendar_rollups(series, series.index, rates=rates)
+    last_date = str(series.index.max()) if len(series) else ''
+    return cached_rollups(tuple(dataset), start_date, end_date, last_date, rates, data_version(), series)
+
+
+def load_decomposition(name: str, series: pd.Series, period=12, model='additive', backend='moving_average'):
+    '''
+    Decomposition of a series (see analytics.decomposition.decompose), read from the store when precomputed by
+    the ETL jobs and computed only once per series, period, model and backend
+
+    Parameters: name : String
+                    Identification of the series, as '<dataset>-<column>'
+
+                series : Pandas Series
+                    Series indexed by date
+
+                period : Integer
+                    Records of one cycle
+
+                model : String
+                    'additive' or 'multiplicative'
+
+                backend : String
+                    'moving_average' or 'stl'
+
+    Returns: DataFrame
+                Read-only Pandas DataFrame indexed by date with the columns trend, seasonal and resid
+
+    Raises: DecompositionError
+                When the series can not be decomposed
+    '''
+    return cached_decomposition(name, series_fingerprint(series), period, model, backend, series)
+
+
+def load_optimization(prices: pd.DataFrame, start_date, end_date, method='ledoit_wolf', risk_free=0.0,
+                      max_weight=1.0):
+    '''
+    Minimum variance and maximum Sharpe portfolios and efficient frontier of the tickers, computed once per
+    (tickers, window, options)
+
+    Parameters: prices : DataFrame
+                    Adjusted close prices indexed by date, one column per ticker
+
+                start_date : Datetime
+                    First date of the window
+
+                end_date : Datetime
+                    Last date of the window
+
+                method : String
+                    Covariance estimator of analytics.optimization.COVARIANCE_METHODS
+
+                risk_free : Float
+                    Risk-free return a year, as a fraction
+
+                max_weight : Float
+                    Upper bound of each weight
+
+    Returns: Dictionary
+                Result of analytics.optimization.optimize_portfolio
+
+    Raises: OptimizationError
+                When the portfolio can not be optimized
+    '''
+    last_date = str(prices.index.max()) if len(prices) else ''
+    return cached_optimization(tuple(prices.columns), start_date, end_date, last_date, method, float(risk_free),
+                               float(max_weight), prices)
+
+
+def load_correlation(dataset: tuple, data: pd.DataFrame, start_date, end_date, rates=True):
+    '''
+    Returns (see analytics.correlation.to_returns) and correlation matrix in hierarchical clustering order of the
+    current data version, computed once per dataset, series and date window
+
+    Parameters: dataset : Tuple
+                    Identification of the data: name and the selection used to build it, None to compute without
+                    the cache
+
+                data : DataFrame
+                    Pandas DataFrame indexed by date with only the series, one column per series
+
+                start_date : String or datetime
+                    First date of the window
+
+                end_date : String or datetime
+                    Last date of the window
+
+                rates : Boolean
+                    True when the series are rates in %, False when they are levels
+
+    Returns: Tuple
+                Read-only Pandas DataFrames of the returns and of the correlation matrix
+    '''
+    if dataset is None:
+        returns = to_returns(data, rates=rates)
+        correlation = correlation_matrix(returns)
+        order = cluster_order(correlation)
+        return returns, correlation.loc[order, order]
+    # Prices topped up by request_data do not change the data version
+    last_date = str(data.index.max()) if len(data) else ''
+    return cached_correlation(tuple(dataset), tuple(data.columns), start_date, end_date, last_date, rates,
+                              data_version(), data)
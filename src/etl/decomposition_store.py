@@ -0,0 +1,140 @@
+import os
+import re
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from analytics.decomposition import (DECOMPOSITION_BACKENDS, DECOMPOSITION_MODELS, DecompositionError, decompose,
+                                     series_fingerprint)
+
+
+logger = logging.getLogger(__name__)
+
+
+class DecompositionStore:
+    '''
+    Decompositions precomputed by the ETL jobs, one Parquet file per (series, period, model, backend) keyed by the
+    fingerprint of the decomposed series
+    '''
+    def __init__(self, root='./data/decomposicoes'):
+        '''
+        :param root: Directory of the Parquet files
+        '''
+        self._root = root
+
+
+    def path(self, name: str, period: int, model: str, backend: str):
+        '''
+        Parquet file of a decomposition, characters not allowed in file names (CNPJ, ^BVSP) are replaced
+        '''
+        file_name = re.sub(r'[^\w.-]', '_', f'{name}-{period}-{model}-{backend}')
+        return os.path.join(self._root, f'{file_name}.parquet')
+
+
+    def read(self, name: str, series: pd.Series, period=12, model='additive', backend='moving_average'):
+        '''
+        Stored decomposition of a series
+
+        Parameters: name : String
+                        Identification of the series, as '<dataset>-<column>'
+
+                    series : Pandas Series
+                        Series indexed by date
+
+                    period : Integer
+                        Records of one cycle
+
+                    model : String
+                        'additive' or 'multiplicative'
+
+                    backend : String
+                        'moving_average' or 'stl'
+
+        Returns: DataFrame
+                    Pandas DataFrame of analytics.decomposition.decompose, None when it was not precomputed for
+                    this series
+        '''
+        path = self.path(name, period, model, backend)
+        if not os.path.exists(path):
+            return None
+        table = pq.read_table(path)
+        if (table.schema.metadata or dict()).get(b'fingerprint') != series_fingerprint(series).encode():
+            return None
+        return table.to_pandas()
+
+
+    def get(self, name: str, series: pd.Series, period=12, model='additive', backend='moving_average'):
+        '''
+        Decomposition of a series, read from the store when it was precomputed for the same series, otherwise
+        computed
+
+        Parameters: name : String
+                        Identification of the series, as '<dataset>-<column>'
+
+                    series : Pandas Series
+                        Series indexed by date
+
+                    period : Integer
+                        Records of one cycle
+
+                    model : String
+                        'additive' or 'multiplicative'
+
+                    backend : String
+                        'moving_average' or 'stl'
+
+        Returns: DataFrame
+                    Pandas DataFrame indexed by date with the columns trend, seasonal and resid
+
+        Raises: DecompositionError
+                    When the series can not be decomposed
+        '''
+        stored = self.read(name, series, period, model, backend)
+        if stored is not None:
+            return stored
+        return decompose(series, period=period, model=model, backend=backend)
+
+
+    def write(self, name: str, series: pd.Series, decomposition: pd.DataFrame, period: int, model: str,
+              backend: str):
+        '''
+        Write a decomposition replacing the stored file atomically
+        '''
+        os.makedirs(self._root, exist_ok=True)
+        table = pa.Table.from_pandas(decomposition)
+        table = table.replace_schema_metadata({**table.schema.metadata,
+                                               b'fingerprint': series_fingerprint(series).encode()})
+        path = self.path(name, period, model, backend)
+        temp_file = os.path.join(self._root, '.' + os.path.basename(path) + '.tmp')
+        pq.write_table(table, temp_file)
+        os.replace(temp_file, path)
+
+
+    def precompute(self, series: dict, period=12):
+        '''
+        Decompose the series with every model and backend, only the series changed since the last run are
+        computed again
+
+        Parameters: series : Dictionary
+                        Name as key and Pandas Series indexed by date as value
+
+                    period : Integer
+                        Records of one cycle
+
+        Returns: Integer
+                    Number of decompositions computed
+        '''
+        computed = 0
+        for name, values in series.items():
+            for model in DECOMPOSITION_MODELS.values():
+                for backend in DECOMPOSITION_BACKENDS.values():
+                    if self.read(name, values, period, model, backend) is not None:
+                        continue
+                    try:
+                        decomposition = decompose(values, period=period, model=model, backend=backend)
+                    except DecompositionError as error:
+                        logger.info('%s (%s, %s) not decomposed: %s', name, model, backend, error)
+                        continue
+                    self.write(name, values, decomposition, period, model, backend)
+                    computed += 1
+        return computed
@@ -0,0 +1,64 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from analytics.flows import FLOW_FREQUENCIES, flow_cubes
+from etl.fund_index import index_order
+
+
+class FlowStore:
+    '''
+    Daily and monthly flow cubes of every fund (net flow, flow in % of the net worth and change of shareholders)
+    computed by etl/update_funds.py over the whole fund history, one Parquet table per frequency ('diario',
+    'mensal') queried by the funds screen
+    '''
+    def __init__(self, root='./data/fluxos'):
+        '''
+        :param root: Directory of the Parquet files
+        '''
+        self._root = root
+
+
+    def path(self, frequency: str):
+        '''
+        Parquet file of a frequency
+        '''
+        return os.path.join(self._root, f'{frequency}.parquet')
+
+
+    def write(self, history: pd.DataFrame):
+        '''
+        Compute the cubes of the fund history and replace the stored tables atomically
+
+        Parameters: history : DataFrame
+                        Fund history with the columns of catch_clean.read_fund_data
+
+        Returns: Dictionary
+                    Pandas DataFrames of the cubes by frequency
+        '''
+        cubes = dict(zip(FLOW_FREQUENCIES.values(), flow_cubes(index_order(history))))
+        os.makedirs(self._root, exist_ok=True)
+        for frequency, cube in cubes.items():
+            path = self.path(frequency)
+            temp_file = os.path.join(self._root, '.' + os.path.basename(path) + '.tmp')
+            table = cube.assign(cnpj_fundo=cube['cnpj_fundo'].astype(str))
+            pq.write_table(pa.Table.from_pandas(table, preserve_index=False), temp_file)
+            os.replace(temp_file, path)
+        return cubes
+
+
+    def read(self, frequency: str):
+        '''
+        Stored cube of a frequency
+
+        Parameters: frequency : String
+                        'diario' or 'mensal'
+
+        Returns: DataFrame
+                    Pandas DataFrame with the columns of analytics.flows.CUBE_COLUMNS ordered by CNPJ and date,
+                    None when the cubes were not computed
+        '''
+        path = self.path(frequency)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
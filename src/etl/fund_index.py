@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+from etl.fund_search import FundSearch
+
+
+def index_order(data: pd.DataFrame):
+    '''
+    Fund history in the order of FundIndex: one record by (date, cnpj_fundo) sorted by CNPJ and date, with
+    categorical CNPJ. Data already in this order (the snapshot published by etl/update_funds.py) is not copied.
+
+    Parameters: data : DataFrame
+                    Fund history with the columns of catch_clean.read_fund_data, repeated (date, cnpj_fundo)
+                    records keep the last one
+
+    Returns: DataFrame
+                Pandas DataFrame in the order of the index
+    '''
+    duplicated = data.duplicated(['cnpj_fundo', 'date'], keep='last')
+    if duplicated.any():
+        data = data[~duplicated]
+    cnpj = pd.Categorical(data['cnpj_fundo']).remove_unused_categories()
+    codes = cnpj.codes
+    dates = data['date'].to_numpy()
+    if not np.all((codes[1:] > codes[:-1]) | ((codes[1:] == codes[:-1]) & (dates[1:] > dates[:-1]))):
+        order = np.lexsort((dates, codes))
+        data = data.iloc[order].reset_index(drop=True)
+        cnpj = cnpj[order]
+    if not isinstance(data['cnpj_fundo'].dtype, pd.CategoricalDtype):
+        data = data.assign(cnpj_fundo=cnpj)
+    return data
+
+
+class FundIndex:
+    '''
+    Lookup index of the fund history: rows sorted by fund and date with categorical CNPJ and denomination, so the
+    rows of a fund are a slice given by its offsets instead of a scan of the whole history. Columns are kept as
+    separate arrays, the ones of a memory-mapped snapshot are not copied.
+    '''
+    def __init__(self, data: pd.DataFrame):
+        '''
+        :param data: Fund history with the columns of catch_clean.read_fund_data, repeated (date, cnpj_fundo)
+        records keep the last one
+        '''
+        data = index_order(data)
+        cnpj = data['cnpj_fundo'].values.remove_unused_categories()
+        # NumPy arrays and Categoricals by column
+        self._columns = {column: data[column].values for column in data.columns}
+        self._columns['cnpj_fundo'] = cnpj
+        self._columns['denom_social'] = pd.Categorical(data['denom_social'])
+        funds = np.arange(len(cnpj.categories))
+        self._dates = self._columns['date']
+        # Rows of the fund with code i are starts[i]:ends[i]
+        self._starts = np.searchsorted(cnpj.codes, funds, side='left')
+        self._ends = np.searchsorted(cnpj.codes, funds, side='right')
+        self._codes = {fund: code for code, fund in enumerate(cnpj.categories)}
+        # Current denomination of each fund, the one of its last record
+        catalog = pd.DataFrame({'cnpj_fundo': cnpj.categories,
+                                'denom_social': np.asarray(self._columns['denom_social'][self._ends - 1])})
+        self._catalog = catalog.sort_values('denom_social').reset_index(drop=True)
+        self._denominations = dict(zip(catalog['cnpj_fundo'], catalog['denom_social']))
+        self._cnpjs = catalog.groupby('denom_social')['cnpj_fundo'].apply(list).to_dict()
+        self._denomination_options = self._catalog['denom_social'].unique()
+        self._search = FundSearch(self._catalog)
+
+
+    @property
+    def catalog(self):
+        '''
+        Pandas DataFrame with one row per fund and the columns cnpj_fundo and denom_social, ordered by denomination
+        '''
+        return self._catalog
+
+
+    @property
+    def denominations(self):
+        '''
+        Distinct denominations in alphabetical order, options of the denomination filter
+        '''
+        return self._denomination_options
+
+
+    def search(self, query: str, limit=20):
+        '''
+        Funds matching a part of the denomination or of the CNPJ, see etl.fund_search.FundSearch
+
+        Parameters: query : String
+                        Text typed by the user
+
+                    limit : Integer
+                        Maximum number of funds returned
+
+        Returns: DataFrame
+                    Rows of the catalog ranked by similarity
+        '''
+        return self._search.search(query, limit=limit)
+
+
+    def cnpjs(self, denominations: list):
+        '''
+        CNPJs of the funds with the denominations
+
+        Parameters: denominations : List of string
+                        Social denominations
+
+        Returns: List of string
+                    CNPJs in the order of the denominations
+        '''
+        return [cnpj for denomination in denominations for cnpj in self._cnpjs.get(denomination, [])]
+
+
+    def rows(self, cnpj: str, start_date=None, end_date=None):
+        '''
+        Positions of the records of a fund in the period
+
+        Parameters: cnpj : String
+                        CNPJ of the fund
+
+                    start_date : String or datetime
+                        First date to keep, None to keep all history
+
+                    end_date : String or datetime
+                        Last date to keep, None to keep all history
+
+        Returns: Tuple
+                    First and last (exclusive) positions, an empty range for unknown funds
+        '''
+        code = self._codes.get(cnpj)
+        if code is None:
+            return 0, 0
+        start, end = self._starts[code], self._ends[code]
+        # Dates are sorted inside the rows of the fund
+        dates = self._dates[start:end]
+        if start_date is not None:
+            start += np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+        if end_date is not None:
+            end = self._starts[code] + np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date)), side='right')
+        return start, max(start, end)
+
+
+    def select(self, columns=None, cnpjs=None, start_date=None, end_date=None):
+        '''
+        Records of the selected funds and period
+
+        Parameters: columns : List of string
+                        Columns to return, None to return all columns
+
+                    cnpjs : List of string
+                        Selected CNPJs, None to keep all funds
+
+                    start_date : String or datetime
+                        First date to keep, None to keep all history
+
+                    end_date : String or datetime
+                        Last date to keep, None to keep all history
+
+        Returns: DataFrame
+                    Pandas DataFrame ordered by CNPJ and date
+        '''
+        if columns is None:
+            columns = self._columns.keys()
+        if cnpjs is None:
+            cnpjs = self._codes.keys()
+        positions = [np.arange(*self.rows(cnpj, start_date, end_date)) for cnpj in cnpjs]
+        positions = np.concatenate(positions) if positions else np.array([], dtype='int64')
+        return pd.DataFrame({column: self._columns[column][positions] for column in columns})
+
+
+    def pivot(self, column: str, cnpjs: list, start_date=None, end_date=None):
+        '''
+        Wide table of one indicator of the selected funds, built from the slices of each fund
+
+        Parameters: column : String
+                        Indicator of the fund history
+
+                    cnpjs : List of string
+                        Selected CNPJs
+
+                    start_date : String or datetime
+                        First date to keep, None to keep all history
+
+                    end_date : String or datetime
+                        Last date to keep, None to keep all history
+
+        Returns: DataFrame
+                    Pandas DataFrame with a date column and one column per fund named by its denomination (followed
+                    by the CNPJ when two selected funds have the same denomination)
+        '''
+        values = np.asarray(self._columns[column])
+        labels = [self._denominations.get(cnpj, cnpj) for cnpj in cnpjs]
+        series = dict()
+        for cnpj, label in zip(cnpjs, labels):
+            if labels.count(label) > 1:
+                label = f'{label} ({cnpj})'
+            start, end = self.rows(cnpj, start_date, end_date)
+            series[label] = pd.Series(values[start:end], index=self._dates[start:end])
+        pivot = pd.DataFrame(series) if series else pd.DataFrame(index=pd.DatetimeIndex([]))
+        pivot.index.name = 'date'
+        pivot.columns.name = 'denom_social'
+        return pivot.sort_index().reset_index()
+
+
+    def blocks(self, column: str, size=2000):
+        '''
+        Wide tables of one indicator of all the funds, a block of funds at a time. The rows of a block of funds are
+        contiguous in the index, so each table is filled with one scatter of the values.
+
+        Parameters: column : String
+                        Indicator of the fund history
+
+                    size : Integer
+                        Funds by block
+
+        Returns: Generator of DataFrame
+                    Pandas DataFrames indexed by the dates of the block with one column per CNPJ
+        '''
+        values = np.asarray(self._columns[column], dtype='float64')
+        codes = self._columns['cnpj_fundo'].codes
+        cnpjs = self._columns['cnpj_fundo'].categories
+        for first in range(0, len(cnpjs), size):
+            last = min(first + size, len(cnpjs))
+            start, end = self._starts[first], self._ends[last - 1]
+            dates, rows = np.unique(self._dates[start:end], return_inverse=True)
+            table = np.full((len(dates), last - first), np.nan)
+            table[rows, codes[start:end] - first] = values[start:end]
+            yield pd.DataFrame(table, index=pd.DatetimeIndex(dates, name='date'), columns=cnpjs[first:last])
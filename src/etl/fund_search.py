@@ -0,0 +1,86 @@
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+
+
+def normalize_text(text: str):
+    '''
+    Text compared by the search: without accents and punctuation, in upper case and with single spaces, so
+    'Ação' matches 'ACAO' and '00.000.000/0001-00' matches '00000000000100'
+
+    Parameters: text : String
+                    Fund denomination, CNPJ or query
+
+    Returns: String
+                Normalized text
+    '''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).upper()
+    # Punctuation inside numbers (CNPJ) is removed, other punctuation separates words
+    text = re.sub(r'(?<=\d)[./-](?=\d)', '', text)
+    return ' '.join(re.sub(r'[^A-Z0-9]+', ' ', text).split())
+
+
+def trigrams(text: str):
+    '''
+    Distinct sequences of 3 characters of a normalized text, words are padded so short words and word starts also
+    give trigrams
+
+    Parameters: text : String
+                    Normalized text
+
+    Returns: Set of string
+                Trigrams of the text
+    '''
+    padded = f'  {text} '
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+
+class FundSearch:
+    '''
+    Fuzzy search of funds by denomination or CNPJ with a trigram inverted index
+    '''
+    def __init__(self, catalog: pd.DataFrame):
+        '''
+        :param catalog: Funds with the columns cnpj_fundo and denom_social, the rows are the results of the search
+        '''
+        self._catalog = catalog.reset_index(drop=True)
+        postings = dict()
+        sizes = list()
+        documents = (normalize_text(f'{denomination} {cnpj}') for cnpj, denomination in
+                     zip(self._catalog['cnpj_fundo'], self._catalog['denom_social']))
+        for position, document in enumerate(documents):
+            document_trigrams = trigrams(document)
+            sizes.append(len(document_trigrams))
+            for trigram in document_trigrams:
+                postings.setdefault(trigram, list()).append(position)
+        # Funds with each trigram
+        self._postings = {trigram: np.array(funds, dtype='int32') for trigram, funds in postings.items()}
+        self._sizes = np.array(sizes, dtype='float64')
+
+
+    def search(self, query: str, limit=20):
+        '''
+        Funds ranked by the share of the trigrams of the query found in the fund, ties broken by the similarity of
+        the whole text (Jaccard index), so short and exact names come first
+
+        Parameters: query : String
+                        Part of the denomination or of the CNPJ, with typos
+
+                    limit : Integer
+                        Maximum number of funds returned
+
+        Returns: DataFrame
+                    Rows of the catalog of the best matches, empty when no trigram matches
+        '''
+        query_trigrams = trigrams(normalize_text(query))
+        hits = [self._postings[trigram] for trigram in query_trigrams if trigram in self._postings]
+        if not hits:
+            return self._catalog.iloc[:0]
+        counts = np.bincount(np.concatenate(hits), minlength=len(self._catalog)).astype('float64')
+        candidates = np.flatnonzero(counts)
+        coverage = counts[candidates] / len(query_trigrams)
+        jaccard = counts[candidates] / (len(query_trigrams) + self._sizes[candidates] - counts[candidates])
+        best = candidates[np.lexsort((-jaccard, -coverage))[:limit]]
+        return self._catalog.iloc[best]
@@ -0,0 +1,177 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+# Rows per Parquet row group, small enough to let the CNPJ statistics prune most of a month
+ROW_GROUP_SIZE = 20000
+
+
+def partition_path(root: str, year: int, month: int):
+    '''
+    Directory of one month of the fund history store
+
+    Parameters: root : String
+                    Root directory of the store
+
+                year : Integer
+                    Year of the partition
+
+                month : Integer
+                    Month of the partition
+
+    Returns: String
+                Hive style directory (root/year=YYYY/month=M)
+    '''
+    return os.path.join(root, f'year={year}', f'month={month}')
+
+
+def write_fund_partition(data: pd.DataFrame, root: str, year: int, month: int):
+    '''
+    Write one month of fund history into the store, replacing the previous version of the month atomically
+
+    Parameters: data : Pandas DataFrame
+                    Fund history of the month with the same columns of read_fund_data
+
+                root : String
+                    Root directory of the store
+
+                year : Integer
+                    Year of the partition
+
+                month : Integer
+                    Month of the partition
+    '''
+    directory = partition_path(root, year, month)
+    os.makedirs(directory, exist_ok=True)
+    # Categories of the compact history are stored as strings, Parquet already encodes them with a dictionary per
+    # row group and the schema stays the same in every partition
+    categories = [column for column in data.columns if pd.api.types.is_categorical_dtype(data[column])]
+    data = data.astype({column: 'object' for column in categories})
+    # Sorting by fund keeps each CNPJ inside few row groups
+    data = data.sort_values(['cnpj_fundo', 'date']).reset_index(drop=True)
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    # Hidden temporary file, ignored by readers until it is renamed
+    temp_file = os.path.join(directory, '.part-0.parquet.tmp')
+    pq.write_table(table, temp_file, row_group_size=ROW_GROUP_SIZE)
+    os.replace(temp_file, os.path.join(directory, 'part-0.parquet'))
+
+
+def remove_fund_partition(root: str, year: int, month: int):
+    '''
+    Remove one month of fund history from the store, if it exists
+
+    Parameters: root : String
+                    Root directory of the store
+
+                year : Integer
+                    Year of the partition
+
+                month : Integer
+                    Month of the partition
+    '''
+    path = os.path.join(partition_path(root, year, month), 'part-0.parquet')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def write_fund_store(data: pd.DataFrame, root: str):
+    '''
+    Write the fund history into a Parquet store partitioned by year and month and sorted by CNPJ
+
+    Parameters: data : Pandas DataFrame
+                    Fund history with the same columns of read_fund_data
+
+                root : String
+                    Root directory of the store
+    '''
+    data = data.copy()
+    data['date'] = pd.to_datetime(data['date'])
+    for (year, month), data_month in data.groupby([data['date'].dt.year, data['date'].dt.month]):
+        write_fund_partition(data_month, root, year, month)
+
+
+def is_fund_store(path: str):
+    '''
+    Check if the path is a local fund history store
+
+    Parameters: path : String
+                    Path or URL of fund history
+
+    Returns: Boolean
+                True when the path is a directory written by write_fund_store
+    '''
+    return os.path.isdir(path)
+
+
+def fund_filter(cnpjs=None, start_date=None, end_date=None):
+    '''
+    Build the predicate pushed down to the store
+
+    Parameters: cnpjs : List of string
+                    Selected CNPJs, None to keep all funds
+
+                start_date : String or datetime
+                    First date to keep, None to keep all history
+
+                end_date : String or datetime
+                    Last date to keep, None to keep all history
+
+    Returns: PyArrow Expression
+                Filter over partition keys, CNPJ and date, None when there is no predicate
+    '''
+    expressions = list()
+    if cnpjs is not None:
+        expressions.append(ds.field('cnpj_fundo').isin(list(cnpjs)))
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+        # Partition keys first to skip whole months, then the exact date
+        expressions.append((ds.field('year') > start_date.year) |
+                           ((ds.field('year') == start_date.year) & (ds.field('month') >= start_date.month)))
+        expressions.append(ds.field('date') >= pa.scalar(start_date.to_pydatetime(), pa.timestamp('ns')))
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date)
+        expressions.append((ds.field('year') < end_date.year) |
+                           ((ds.field('year') == end_date.year) & (ds.field('month') <= end_date.month)))
+        expressions.append(ds.field('date') <= pa.scalar(end_date.to_pydatetime(), pa.timestamp('ns')))
+    if not expressions:
+        return None
+    predicate = expressions[0]
+    for expression in expressions[1:]:
+        predicate = predicate & expression
+    return predicate
+
+
+def read_fund_store(root: str, columns=None, cnpjs=None, start_date=None, end_date=None):
+    '''
+    Read the fund history store reading only the columns and row groups needed
+
+    Parameters: root : String
+                    Root directory of the store
+
+                columns : List of string
+                    Columns to read, None to read all columns
+
+                cnpjs : List of string
+                    Selected CNPJs, None to keep all funds
+
+                start_date : String or datetime
+                    First date to keep, None to keep all history
+
+                end_date : String or datetime
+                    Last date to keep, None to keep all history
+
+    Returns: DataFrame
+                Pandas DataFrame with fund historical data ordered by CNPJ and date
+    '''
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name not in ('year', 'month')]
+    table = dataset.to_table(columns=list(columns), filter=fund_filter(cnpjs, start_date, end_date))
+    df = table.to_pandas()
+    if {'cnpj_fundo', 'date'}.issubset(df.columns):
+        df.sort_values(['cnpj_fundo', 'date'], inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import timedelta
+
+# Yahoo finance
+import yfinance as yf
+
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ['Adj Close', 'Close', 'High', 'Low', 'Open', 'Volume']
+# Seconds a period without prices in a successful download is not requested again (holidays, delisted tickers)
+EMPTY_TTL = 15 * 60
+# Errors reported by yfinance that are failures of the request, not the absence of prices
+DOWNLOAD_FAILURES = ('Rate limit', 'Too Many Requests', 'Timeout', 'ConnectionError', 'ProxyError', 'SSLError')
+# (root, ticker, start, end) -> time of the last download without prices, shared by the sessions of the process
+_empty_downloads = dict()
+
+
+class PriceDownloadError(Exception):
+    '''
+    Download that failed, its periods are requested again by the next call
+    '''
+
+
+class FailureCollector(logging.Handler):
+    '''
+    Collect the failures that yfinance logs instead of raising
+    '''
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.failures = list()
+
+
+    def emit(self, record):
+        '''
+        Keep the message of the failures
+        '''
+        message = record.getMessage()
+        if any(failure in message for failure in DOWNLOAD_FAILURES):
+            self.failures.append(message.strip())
+
+
+def yahoo_downloader(tickers: list, start, end):
+    '''
+    Download historical prices from Yahoo Finance
+
+    Parameters: tickers : List of string
+                    Company tickers
+
+                start : Date
+                    First day to download
+
+                end : Date
+                    Day after the last day to download (exclusive, as yf.download)
+
+    Returns: DataFrame
+                Pandas DataFrame in the format of yf.download
+
+    Raises: PriceDownloadError
+                When yfinance reports a rate limit or a connection failure, it returns empty frames in this case
+    '''
+    collector = FailureCollector()
+    yf_logger = logging.getLogger('yfinance')
+    yf_logger.addHandler(collector)
+    try:
+        data = yf.download(tickers=tickers, start=start, end=end, auto_adjust=False, progress=False)
+    finally:
+        yf_logger.removeHandler(collector)
+    if collector.failures:
+        raise PriceDownloadError('; '.join(collector.failures))
+    return data
+
+
+def split_download(data: pd.DataFrame, tickers: list):
+    '''
+    Split the result of a download into one DataFrame per ticker
+
+    Parameters: data : DataFrame
+                    Result of yf.download, columns (field, ticker) or only field for one ticker
+
+                tickers : List of string
+                    Downloaded tickers
+
+    Returns: Dictionary
+                Ticker as key and DataFrame with PRICE_COLUMNS as value, days without any price are removed
+    '''
+    prices = dict()
+    for ticker in tickers:
+        if isinstance(data.columns, pd.MultiIndex):
+            if ticker not in data.columns.get_level_values(1):
+                continue
+            ticker_data = data.xs(ticker, axis=1, level=1)
+        else:
+            ticker_data = data
+        ticker_data = ticker_data.reindex(columns=PRICE_COLUMNS).dropna(how='all')
+        ticker_data.index = pd.to_datetime(ticker_data.index).tz_localize(None)
+        ticker_data.index.name = 'Date'
+        prices[ticker] = ticker_data
+    return prices
+
+
+def empty_prices():
+    '''
+    Prices of a ticker without any trading day in the period
+    '''
+    return pd.DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], name='Date'), dtype='float64')
+
+
+class PriceStore:
+    '''
+    Local store of OHLCV prices with one Parquet file per ticker, topped up from Yahoo Finance only for the
+    missing periods
+    '''
+    def __init__(self, root='./data/precos', downloader=yahoo_downloader):
+        '''
+        :param root: Directory of the Parquet files
+        :param downloader: Function (tickers, start, end) returning prices in the format of yf.download, a local
+        stub can replace Yahoo Finance in tests
+        '''
+        self._root = root
+        self._downloader = downloader
+
+
+    def path(self, ticker: str):
+        '''
+        Parquet file of a ticker
+        '''
+        return os.path.join(self._root, f'{ticker}.parquet')
+
+
+    def read(self, ticker: str):
+        '''
+        Stored prices of a ticker
+
+        Parameters: ticker : String
+                        Company ticker
+
+        Returns: Tuple
+                    DataFrame with the prices and (first, last) covered days, (None, None) when the ticker was
+                    never downloaded
+        '''
+        if not os.path.exists(self.path(ticker)):
+            return None, None
+        table = pq.read_table(self.path(ticker))
+        coverage = json.loads(table.schema.metadata[b'coverage'])
+        data = table.to_pandas()
+        return data, (pd.Timestamp(coverage[0]), pd.Timestamp(coverage[1]))
+
+
+    def write(self, ticker: str, data: pd.DataFrame, coverage: tuple):
+        '''
+        Write the prices of a ticker replacing the stored file atomically
+
+        Parameters: ticker : String
+                        Company ticker
+
+                    data : DataFrame
+                        Prices of the ticker indexed by date
+
+                    coverage : Tuple
+                        First and last days already requested, days without prices inside it are not requested again
+        '''
+        os.makedirs(self._root, exist_ok=True)
+        table = pa.Table.from_pandas(data)
+        metadata = {**table.schema.metadata,
+                    b'coverage': json.dumps([str(coverage[0].date()), str(coverage[1].date())]).encode()}
+        table = table.replace_schema_metadata(metadata)
+        # Unique temporary file, sessions and processes may write the same ticker at the same time
+        with tempfile.NamedTemporaryFile(dir=self._root, prefix=f'.{ticker}.', suffix='.parquet.tmp',
+                                         delete=False) as temp:
+            temp_file = temp.name
+        try:
+            pq.write_table(table, temp_file)
+            os.replace(temp_file, self.path(ticker))
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+
+    def missing_ranges(self, coverage, start, end):
+        '''
+        Periods not covered by the store
+
+        Parameters: coverage : Tuple
+                        First and last covered days, None when the ticker was never downloaded
+
+                    start : Timestamp
+                        First day requested
+
+                    end : Timestamp
+                        Last day requested
+
+        Returns: List of tuples
+                    (start, end) of each missing period, both inclusive
+        '''
+        if coverage is None:
+            return [(start, end)]
+        ranges = list()
+        if start < coverage[0]:
+            ranges.append((start, min(end, coverage[0] - timedelta(days=1))))
+        if end > coverage[1]:
+            ranges.append((max(start, coverage[1] + timedelta(days=1)), end))
+        return ranges
+
+
+    def top_up(self, tickers: list, start, end):
+        '''
+        Download only the missing periods of the tickers and merge them into the store. Tickers missing the same
+        period are downloaded in one request. Periods without business days are covered without a download. A
+        failed download leaves its period missing, the next call requests it again. Yahoo Finance may also report
+        failures as empty frames, so the coverage is not extended for the tickers without prices in a successful
+        download, their period is not requested again for EMPTY_TTL seconds.
+
+        Parameters: tickers : List of string
+                        Company tickers
+
+                    start : Timestamp
+                        First day requested
+
+                    end : Timestamp
+                        Last day requested, inclusive
+        '''
+        if start > end:
+            return
+        stored = {ticker: self.read(ticker) for ticker in tickers}
+        pending = dict()
+        now = time.monotonic()
+        for ticker in tickers:
+            for missing in self.missing_ranges(stored[ticker][1], start, end):
+                if np.busday_count(missing[0].date(), (missing[1] + timedelta(days=1)).date()) <= 0:
+                    self.extend(ticker, stored, None, missing)
+                elif now - _empty_downloads.get((self._root, ticker) + missing, -EMPTY_TTL) >= EMPTY_TTL:
+                    pending.setdefault(missing, list()).append(ticker)
+        for (missing_start, missing_end), missing_tickers in pending.items():
+            try:
+                downloaded = self._downloader(missing_tickers, missing_start.date(),
+                                              (missing_end + timedelta(days=1)).date())
+            except Exception as error:
+                logger.warning('Download of %s from %s to %s failed, the period will be requested again: %s',
+                               ', '.join(missing_tickers), missing_start.date(), missing_end.date(), error)
+                continue
+            prices = split_download(downloaded, missing_tickers) if not downloaded.empty else dict()
+            empty = [ticker for ticker in missing_tickers if prices.get(ticker) is None or prices[ticker].empty]
+            if empty:
+                logger.warning('No prices downloaded for %s from %s to %s, the period will be requested again '
+                               'after %d minutes', ', '.join(empty), missing_start.date(), missing_end.date(),
+                               EMPTY_TTL // 60)
+            for ticker in missing_tickers:
+                if ticker in empty:
+                    _empty_downloads[(self._root, ticker, missing_start, missing_end)] = time.monotonic()
+                else:
+                    self.extend(ticker, stored, prices[ticker], (missing_start, missing_end))
+
+
+    def extend(self, ticker: str, stored: dict, new, missing: tuple):
+        '''
+        Merge the prices of a period into the stored ones of a ticker and extend its coverage
+
+        Parameters: ticker : String
+                        Company ticker
+
+                    stored : Dictionary
+                        (prices, coverage) by ticker, updated with the merged prices
+
+                    new : DataFrame
+                        Prices of the period, None for a period without trading days
+
+                    missing : Tuple
+                        First and last days of the period
+        '''
+        data, coverage = stored[ticker]
+        if data is None:
+            data = empty_prices() if new is None else new
+        elif new is not None:
+            data = pd.concat([data[~data.index.isin(new.index)], new]).sort_index()
+        if coverage is None:
+            coverage = missing
+        else:
+            coverage = (min(coverage[0], missing[0]), max(coverage[1], missing[1]))
+        stored[ticker] = (data, coverage)
+        self.write(ticker, data, coverage)
+
+
+    def get(self, tickers: list, start, end):
+        '''
+        Prices of the tickers, downloading only what is missing in the store
+
+        Parameters: tickers : List of string
+                        Company tickers
+
+                    start : String or datetime
+                        First day
+
+                    end : String or datetime
+                        Last day, inclusive
+
+        Returns: DataFrame
+                    Pandas DataFrame in the format of yf.download: columns (field, ticker) for many tickers or only
+                    the fields for one ticker
+        '''
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        self.top_up(tickers, start, end)
+        prices = dict()
+        for ticker in tickers:
+            data, _ = self.read(ticker)
+            if data is None:
+                # Never downloaded with success
+                data = empty_prices()
+            prices[ticker] = data.loc[(data.index >= start) & (data.index <= end)]
+        if len(tickers) == 1:
+            return prices[tickers[0]]
+        data = pd.concat(prices, axis=1).swaplevel(axis=1).sort_index(axis=1)
+        data.index.name = 'Date'
+        return data
+
+
+def prewarm(store: PriceStore, tickers: list, start, end, chunk_size=20, min_interval=2.0):
+    '''
+    Download and store the prices of many tickers in chunks, each chunk is one yf.download call (the tickers of a
+    chunk are downloaded concurrently by yfinance) and the chunks are spaced by min_interval seconds to respect
+    the Yahoo Finance rate limit
+
+    Parameters: store : PriceStore
+                    Local price store
+
+                tickers : List of string
+                    Company tickers
+
+                start : String or datetime
+                    First day
+
+                end : String or datetime
+                    Last day, inclusive
+
+                chunk_size : Integer
+                    Tickers by request
+
+                min_interval : Float
+                    Minimum seconds between the start of two requests
+
+    Returns: DataFrame
+                Pandas DataFrame with rows, first and last day stored of each ticker
+    '''
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    progress = list()
+    last_request = 0
+    for position in range(0, len(tickers), chunk_size):
+        chunk = tickers[position:position + chunk_size]
+        wait = min_interval - (time.monotonic() - last_request)
+        if wait > 0:
+            time.sleep(wait)
+        last_request = time.monotonic()
+        try:
+            store.top_up(chunk, start, end)
+        except Exception:
+            logger.exception('Download of %s failed', ', '.join(chunk))
+        for offset, ticker in enumerate(chunk):
+            data, _ = store.read(ticker)
+            rows = 0 if data is None else len(data)
+            first = None if not rows else data.index.min().date()
+            last = None if not rows else data.index.max().date()
+            logger.info('[%d/%d] %s: %d rows %s - %s', position + offset + 1, len(tickers), ticker, rows, 
+                        first, last)
+            progress.append({'ticker': ticker, 'rows': rows, 'first': first, 'last': last})
+    return pd.DataFrame(progress)
+
+
+def wide_panel(store: PriceStore, tickers: list, start, end, field='Adj Close'):
+    '''
+    Wide panel of one price field, one column per ticker, from the stored prices
+
+    Parameters: store : PriceStore
+                    Local price store
+
+                tickers : List of string
+                    Company tickers
+
+                start : String or datetime
+                    First day
+
+                end : String or datetime
+                    Last day, inclusive
+
+                field : String
+                    Price field of the panel
+
+    Returns: DataFrame
+                Pandas DataFrame indexed by date with one column per ticker stored
+    '''
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    columns = dict()
+    for ticker in tickers:
+        data, _ = store.read(ticker)
+        if data is not None and not data.empty:
+            columns[ticker] = data.loc[(data.index >= start) & (data.index <= end), field]
+    panel = pd.DataFrame(columns).sort_index()
+    panel.index.name = 'date'
+    return panel
@@ -0,0 +1,77 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from analytics.risk import RISK_COLUMNS, daily_risk_free, risk_metrics
+
+
+class RiskStore:
+    '''
+    Risk metrics of every ticker and fund computed by the ETL jobs over the whole stored history, one Parquet
+    table per universe ('acoes', 'fundos') queried by the screens
+    '''
+    def __init__(self, root='./data/risco'):
+        '''
+        :param root: Directory of the Parquet files
+        '''
+        self._root = root
+
+
+    def path(self, universe: str):
+        '''
+        Parquet file of a universe
+        '''
+        return os.path.join(self._root, f'{universe}.parquet')
+
+
+    def write(self, universe: str, blocks, benchmark=None, cdi=None):
+        '''
+        Compute the metrics of all the series of a universe, block by block, and replace the stored table
+        atomically
+
+        Parameters: universe : String
+                        'acoes' or 'fundos'
+
+                    blocks : Iterable of DataFrame
+                        Pandas DataFrames indexed by date with one column of levels per series, as the wide panel
+                        of adjusted close prices or FundIndex.blocks
+
+                    benchmark : Pandas Series
+                        IBOVESPA level indexed by date, None to skip the beta
+
+                    cdi : DataFrame
+                        Monthly CDI of read_series, None for a zero risk-free rate
+
+        Returns: DataFrame
+                    Pandas DataFrame with the column série followed by the columns of RISK_COLUMNS
+        '''
+        tables = list()
+        for levels in blocks:
+            risk_free = None if cdi is None else daily_risk_free(levels.index, cdi)
+            tables.append(risk_metrics(levels, benchmark=benchmark, risk_free=risk_free))
+        metrics = pd.concat(tables) if tables else pd.DataFrame(columns=RISK_COLUMNS)
+        metrics = metrics.rename_axis('série').reset_index()
+        metrics['série'] = metrics['série'].astype(str)
+        os.makedirs(self._root, exist_ok=True)
+        path = self.path(universe)
+        temp_file = os.path.join(self._root, '.' + os.path.basename(path) + '.tmp')
+        pq.write_table(pa.Table.from_pandas(metrics, preserve_index=False), temp_file)
+        os.replace(temp_file, path)
+        return metrics
+
+
+    def read(self, universe: str):
+        '''
+        Stored metrics of a universe
+
+        Parameters: universe : String
+                        'acoes' or 'fundos'
+
+        Returns: DataFrame
+                    Pandas DataFrame indexed by série (ticker or CNPJ) with the columns of RISK_COLUMNS, None when
+                    the metrics were not computed
+        '''
+        path = self.path(universe)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path).set_index('série')
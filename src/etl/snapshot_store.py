@@ -0,0 +1,109 @@
+import os
+import time
+import logging
+import pandas as pd
+import pyarrow as pa
+
+
+logger = logging.getLogger(__name__)
+
+
+def arrow_table(data: pd.DataFrame):
+    '''
+    Arrow table of a DataFrame read back without copies: NaN of float columns are kept as values instead of nulls,
+    columns with nulls are converted to NumPy with a copy
+
+    Parameters: data : DataFrame
+                    Pandas DataFrame with a default index
+
+    Returns: PyArrow Table
+                Table with the same columns, categories become dictionary arrays
+    '''
+    arrays = [pa.array(data[column].to_numpy(), from_pandas=False) if data[column].dtype.kind == 'f'
+              else pa.Array.from_pandas(data[column]) for column in data.columns]
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in data.columns])
+
+
+class SnapshotStore:
+    '''
+    Immutable datasets published by the ETL jobs as uncompressed Arrow IPC files, opened with memory maps so all the
+    Streamlit processes of a node share the pages of one copy in the page cache. Each write is a new file
+    '<root>/<name>/<version>.arrow' and readers open the newest one.
+    '''
+    def __init__(self, root='./data/snapshots', keep=2):
+        '''
+        :param root: Directory of the snapshots
+        :param keep: Versions kept of each dataset, the previous one is still used by processes that did not reload
+        '''
+        self._root = root
+        self._keep = keep
+
+
+    def versions(self, name: str):
+        '''
+        Published versions of a dataset, from the oldest to the newest
+        '''
+        directory = os.path.join(self._root, name)
+        if not os.path.isdir(directory):
+            return list()
+        # Hidden temporary files are not versions
+        return sorted(int(file[:-len('.arrow')]) for file in os.listdir(directory)
+                      if file.endswith('.arrow') and not file.startswith('.'))
+
+
+    def path(self, name: str, version: int):
+        '''
+        Arrow file of a version of a dataset
+        '''
+        return os.path.join(self._root, name, f'{version}.arrow')
+
+
+    def write(self, name: str, data: pd.DataFrame):
+        '''
+        Publish a new version of a dataset atomically and remove the oldest versions
+
+        Parameters: name : String
+                        Dataset name, as 'indicadores' or 'fundos'
+
+                    data : DataFrame
+                        Pandas DataFrame with a default index
+
+        Returns: String
+                    Path of the published file
+        '''
+        directory = os.path.join(self._root, name)
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(name, time.time_ns())
+        table = arrow_table(data)
+        # Hidden temporary file, ignored by readers until it is renamed
+        temp_file = os.path.join(directory, '.' + os.path.basename(path) + '.tmp')
+        with pa.OSFile(temp_file, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_file, path)
+        for version in self.versions(name)[:-self._keep]:
+            # Processes with the file mapped keep reading it until they reload, only the name is removed
+            try:
+                os.remove(self.path(name, version))
+            except OSError as error:
+                logger.info('Snapshot %s %s not removed: %s', name, version, error)
+        return path
+
+
+    def read(self, name: str):
+        '''
+        Newest version of a dataset mapped in memory, numeric columns without nulls are views of the mapped file
+
+        Parameters: name : String
+                        Dataset name
+
+        Returns: DataFrame
+                    Read-only Pandas DataFrame, None when the dataset was not published
+        '''
+        versions = self.versions(name)
+        if not versions:
+            return None
+        source = pa.memory_map(self.path(name, versions[-1]))
+        table = pa.ipc.open_file(source).read_all()
+        # One block per column, a consolidated block would be a private copy of the columns
+        return table.to_pandas(split_blocks=True)
@@ -1,6 +1,26 @@
-from etl.catch_clean import DownloadFilesBrGov
+import logging
+from etl.catch_clean import DownloadFilesBrGov, BrazilianIndicators
+from etl.data_layer import SNAPSHOTS, indicator_series, publish_version, write_index_returns
+from etl.decomposition_store import DecompositionStore
+from etl.snapshot_store import SnapshotStore
 
-# Download data form Brazilian Government services
-download = DownloadFilesBrGov()
-download.series_central_bank()
-download.series_ibge()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+# Download data form Brazilian Government services, only the periods after the stored ones
+download = DownloadFilesBrGov(incremental=True)
+failed = download.series_all()
+if failed:
+    raise SystemExit(f'Series not downloaded: {", ".join(failed)}')
+
+# Compounded and trailing 12 months returns, only the new or revised months are computed
+indicators = BrazilianIndicators().data_frame_indicators()
+write_index_returns(indicators)
+
+# Indicators panel mapped by the app processes without copies
+SnapshotStore(SNAPSHOTS).write('indicadores', indicators)
+
+# Seasonality and trend of every indicator, only the changed series are decomposed again
+DecompositionStore().precompute(indicator_series(indicators))
+
+# Invalidate the cached datasets of the running app
+publish_version()
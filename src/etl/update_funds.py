@@ -0,0 +1,39 @@
+import os
+import logging
+from etl.catch_clean import read_fund_csv, read_fund_data, read_series
+from etl.cvm_funds import ingest_cvm_history
+from etl.data_layer import FLOWS_DIR, RISK_DIR, SNAPSHOTS, benchmark_levels, publish_version
+from etl.flow_store import FlowStore
+from etl.fund_index import FundIndex, index_order
+from etl.fund_store import write_fund_store
+from etl.risk_store import RiskStore
+from etl.snapshot_store import SnapshotStore
+
+# Fund history store read by the funds screen
+FUNDS_STORE = './data/fundos_historico'
+# CVM daily reports (https://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/) and register (cad_fi.csv)
+CVM_DIR = './data/fundos'
+CVM_REFERENCE = './data/fundos/inf_diario/inf_diario_fi_2022/inf_diario_fi_202212.csv'
+FUNDS_CSV = 'https://bitbucket.org/marcos_rmg/largedata/raw/65a1af3d452651c9775ba8538e49d59ce0c1b38b/fundos.csv'
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if os.path.isdir(os.path.join(CVM_DIR, 'inf_diario')):
+        # Only new or changed monthly reports are ingested
+        ingest_cvm_history(inf_diario_dir=os.path.join(CVM_DIR, 'inf_diario'),
+                           cadastro_file=os.path.join(CVM_DIR, 'cad_fi.csv'),
+                           reference_file=CVM_REFERENCE, store_root=FUNDS_STORE)
+    else:
+        # Convert the published CSV when the CVM files are not available
+        write_fund_store(read_fund_csv(FUNDS_CSV), FUNDS_STORE)
+    # Whole history in the order of the lookup index, mapped by the app without copies
+    history = index_order(read_fund_data(FUNDS_STORE))
+    SnapshotStore(SNAPSHOTS).write('fundos', history)
+    # Risk metrics of the quotas of every fund, a block of funds at a time
+    RiskStore(RISK_DIR).write('fundos', FundIndex(history).blocks('vl_quota'), benchmark=benchmark_levels(), 
+                              cdi=read_series('./data/cdi.csv'))
+    # Daily and monthly flow cubes of every fund
+    FlowStore(FLOWS_DIR).write(history)
+    # Invalidate the cached datasets of the running app
+    publish_version()
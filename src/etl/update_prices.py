@@ -0,0 +1,35 @@
+import logging
+from datetime import date, timedelta
+from etl.catch_clean import carteira_ibov, read_series
+from etl.data_layer import BENCHMARK, RISK_DIR, SNAPSHOTS, benchmark_levels, publish_version, ticker_series
+from etl.decomposition_store import DecompositionStore
+from etl.price_store import PriceStore, prewarm, wide_panel
+from etl.risk_store import RiskStore
+from etl.snapshot_store import SnapshotStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+START_DATE = '2015-01-01'
+
+# Prices of the whole IBOVESPA theoretical portfolio, so no user waits for Yahoo Finance
+carteira = carteira_ibov('./data/carteira_ibov.csv', cols=['Código'])
+tickers = carteira['index'].tolist()
+yesterday = date.today() - timedelta(days=1)
+store = PriceStore()
+prewarm(store, tickers + [BENCHMARK], START_DATE, yesterday)
+
+# Wide panel of adjusted close prices for cross-sectional views
+panel = wide_panel(store, tickers, START_DATE, yesterday)
+panel.to_csv('./data/ibov.csv')
+
+# Volatility, VaR, CVaR, beta to the IBOVESPA and Sharpe and Sortino against the CDI of every ticker
+RiskStore(RISK_DIR).write('acoes', [panel], benchmark=benchmark_levels(store), cdi=read_series('./data/cdi.csv'))
+
+# Seasonality and trend of the monthly mean prices, only the changed series are decomposed again
+DecompositionStore().precompute(ticker_series(store, tickers + [BENCHMARK]))
+
+# Portfolio mapped by the app processes without copies
+SnapshotStore(SNAPSHOTS).write('carteira', carteira)
+
+# Invalidate the cached datasets of the running app
+publish_version()
@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 from data_viz.analysis_series import AnalysisSeries
 from screens.view_options import visualizations, view_list, date_interval
+from analytics.returns import NOMINAL_INDICES, INFLATION_INDICES
+from etl.data_layer import load_index_returns
 
 
 def economic_index_screen(data: pd.DataFrame):
@@ -14,6 +16,8 @@ def economic_index_screen(data: pd.DataFrame):
     # variables definition
     indexers = ['Poupança', 'CDI', 'IPCA', 'INPC', 'Selic']
     option_view_indexes = view_list()
+    # Insert extra view
+    option_view_indexes.insert(1, 'Acumulado 12 meses')
     # Indexers description
     description = pd.DataFrame({'Indicador': ['Rentabilidade no 1º dia do mês (BCB-Demab)', 
                                         'Taxa de Juros Acumulada Mensal (BCB-Demab)', 
@@ -35,7 +39,8 @@ def economic_index_screen(data: pd.DataFrame):
         start_date, end_date = date_interval(view=view)
         if indexer == 'Selecionar todos':
             indexer = ['Poupança', 'CDI', 'IPCA', 'INPC', 'Selic']
-        analyze = AnalysisSeries(data=data, start_date=start_date, end_date=end_date, axis_y=indexer)
+        analyze = AnalysisSeries(data=data, start_date=start_date, end_date=end_date, axis_y=indexer, 
+                                 dataset=('indicadores',))
         # This variable avoid unecessary view check inside visualization function
         check_other_options = True
         if view == 'Série Temporal':
@@ -43,6 +48,20 @@ def economic_index_screen(data: pd.DataFrame):
             st.subheader('Série Temporal')
             analyze.time_series()
             analyze.acumulated()
+        elif view == 'Acumulado 12 meses':
+            check_other_options = False
+            series = list(indexer)
+            real = st.sidebar.checkbox('Retorno real')
+            if real:
+                deflator = st.sidebar.selectbox('Deflator', INFLATION_INDICES)
+                series = [f'{index} real {deflator}' for index in indexer if index in NOMINAL_INDICES]
+            if series:
+                st.subheader('Acumulado em 12 meses')
+                analyze_12m = AnalysisSeries(data=load_index_returns(), start_date=start_date, end_date=end_date, 
+                                             axis_y=[f'{serie} 12m' for serie in series])
+                analyze_12m.time_series()
+            else:
+                st.write('Selecione CDI ou Poupança para o retorno real!')
         # Other options
         visualizations(analyzer=analyze, view=view, check=check_other_options)
         if view != 'Correlação Linear':
@@ -1,70 +1,104 @@
 import pandas as pd
 import streamlit as st
+from analytics.flows import FLOW_FREQUENCIES, RANKING_METRICS
 from data_viz.analysis_series import AnalysisSeries
-from screens.view_options import visualizations, view_list, date_interval
+from data_viz.flow_viz import FlowViz
+from etl.data_layer import load_flow_cube, load_fund_pivot, load_risk_metrics
+from etl.fund_index import FundIndex
+from screens.view_options import visualizations, view_list, date_interval, normalization_options, chart_resolution
 
 
-def funds_screen(data: pd.DataFrame()):
+# Funds offered by the search in the selection widget
+SEARCH_LIMIT = 20
+
+
+def funds_screen(index: FundIndex):
     '''
     This function creates the screen of Brazilian Investment Funds with at least 1000 shareholders on average in December 2022 
 
-    Parameters: data : Pandas DataFrame 
-                    DataFrame of Investment Funds historical data
+    Parameters: index : FundIndex 
+                    Lookup index of the fund history with the CNPJ and social denomination of the Investment Funds,
+                    the wide table of the selected funds is read from the data layer
     '''
     indicator_dict = {'Valor Cota': ['vl_quota', 'R$'], 'Patrimônio Líquido': ['vl_patrim_liq', 'R$'], 
                     'Captação Dia': ['captc_dia', 'R$'], 'Resgate Dia': ['resg_dia', 'R$'], 
                     'Cotistas': ['nr_cotst', 'Nº'], 'Valor total da carteira': ['vl_total', 'R$']}
-    # Filters data definition
+    catalog = index.catalog
+    # Filters data definition: only the funds found by the search and the selected ones are sent to the browser
     fund_filter = st.sidebar.selectbox('Buscar por', ['Denominção Social', 'CNPJ'])
+    query = st.sidebar.text_input('Buscar fundo', help='Parte do nome ou do CNPJ')
+    candidates = index.search(query, limit=SEARCH_LIMIT) if query.strip() else catalog.iloc[:SEARCH_LIMIT]
     if fund_filter == 'Denominção Social':
+        selected = st.session_state.setdefault('funds_denominations', [catalog['denom_social'].iloc[0]])
         fund_selected = st.sidebar.multiselect(label='Denominação Social', 
-                                                options=data['denom_social'].unique(), 
-                                                default=data['denom_social'].unique()[0])
+                                                options=list(dict.fromkeys(selected + 
+                                                                           candidates['denom_social'].tolist())), 
+                                                default=selected)
+        st.session_state['funds_denominations'] = fund_selected
+        cnpj_selected = index.cnpjs(fund_selected)
     elif fund_filter == 'CNPJ':
+        selected = st.session_state.setdefault('funds_cnpjs', [catalog['cnpj_fundo'].iloc[0]])
         fund_selected = st.sidebar.multiselect(label='CNPJ', 
-                                                options=data['cnpj_fundo'].unique(), 
-                                                default=data['cnpj_fundo'].unique()[0])
+                                                options=list(dict.fromkeys(selected + 
+                                                                           candidates['cnpj_fundo'].tolist())), 
+                                                default=selected)
+        st.session_state['funds_cnpjs'] = fund_selected
+        cnpj_selected = list(fund_selected)
     # Visualization options
     indicator = st.sidebar.selectbox(label='Indicador', options=indicator_dict.keys())
-    # Data slice and pivot: fund and indicator
-    if fund_filter == 'Denominção Social':
-        # Slice found
-        data_slice = data[data['denom_social'].isin(fund_selected)].copy()
-        # Select indicator
-        data_slice = data_slice[['date', 'denom_social', indicator_dict[indicator][0]]]
-        # Data pivot
-        data_pivot = data_slice.pivot(index='date', columns='denom_social', 
-                                        values=indicator_dict[indicator][0]).reset_index()
-    elif fund_filter == 'CNPJ':
-        # Slice found
-        data_slice = data[data['cnpj_fundo'].isin(fund_selected)].copy()
-        data_slice = data_slice[['date', 'denom_social', indicator_dict[indicator][0]]]  
-        # Data pivot 
-        data_pivot = data_slice.pivot(index='date', columns='denom_social', 
-                                        values=indicator_dict[indicator][0]).reset_index()
     if fund_selected:
         # Data Viz
         # Date definition (One Year before as default)
         view_options_list = view_list()
+        view_options_list.append('Métricas de Risco')
+        view_options_list.append('Fluxo de Captação')
         view = st.sidebar.selectbox('Gráfico', view_options_list)
+        if view == 'Métricas de Risco':
+            # Risk is measured on the quotas
+            indicator = 'Valor Cota'
         # Date interval
         start_date, end_date = date_interval(view=view)
+        # Wide table of the selected funds, indicator and period, built from the slices of the index
+        data_pivot = load_fund_pivot(indicator_dict[indicator][0], cnpjs=cnpj_selected, start_date=start_date, 
+                                     end_date=end_date)
         # View options
         analyze = AnalysisSeries(data=data_pivot, start_date=start_date, end_date=end_date, 
-                                axis_y=data_pivot.columns[1:], y_label=indicator_dict[indicator][1])
+                                axis_y=data_pivot.columns[1:], y_label=indicator_dict[indicator][1],
+                                dataset=('fundos', indicator_dict[indicator][0], tuple(cnpj_selected)), rates=False)
         # This variable avoid unecessary view check inside visualization function
         check_other_options = True
-        if view == 'Série Temporal':
+        if view == 'Métricas de Risco':
+            check_other_options = False
+            metrics = load_risk_metrics('fundos', cnpj_selected)
+            if metrics is not None:
+                denominations = catalog.set_index('cnpj_fundo')['denom_social']
+                metrics = metrics.assign(denom_social=denominations.reindex(metrics.index).to_numpy())
+            st.subheader('Métricas de Risco da Cota')
+            analyze.risk_view(metrics)
+        elif view == 'Fluxo de Captação':
+            check_other_options = False
+            frequency = st.sidebar.radio('Frequência', FLOW_FREQUENCIES.keys())
+            metric = st.sidebar.selectbox('Classificar por', RANKING_METRICS.keys())
+            direction = st.sidebar.radio('Ranking', ['Maiores', 'Menores'])
+            top = st.sidebar.number_input('Fundos no ranking', min_value=5, max_value=100, value=20)
+            flows = FlowViz(load_flow_cube(FLOW_FREQUENCIES[frequency]), catalog, start_date, end_date)
+            st.subheader('Captação Líquida e Cotistas')
+            flows.funds_view(cnpj_selected)
+            st.subheader(f'Ranking de Fundos: {metric}')
+            flows.ranking_view(RANKING_METRICS[metric], top=top, ascending=direction == 'Menores')
+        elif view == 'Série Temporal':
             check_other_options = False
             normalization = st.sidebar.checkbox('Normalizar')
+            chart_points = chart_resolution()
             if normalization:
+                method, base_date = normalization_options(start_date)
                 st.subheader(indicator)
-                analyze.normalize_time_series()
-                analyze.time_series(legend_x_position=0, legend_y_position=1.2)
+                analyze.normalize_time_series(method=method, base_date=base_date)
+                analyze.time_series(legend_x_position=0, legend_y_position=1.2, chart_points=chart_points)
                 analyze.normalized_metric()
             else:
                 st.subheader(indicator)
-                analyze.time_series(legend_x_position=0, legend_y_position=1.2)
+                analyze.time_series(legend_x_position=0, legend_y_position=1.2, chart_points=chart_points)
         # Others options
         visualizations(analyzer=analyze, view=view, check=check_other_options)
 
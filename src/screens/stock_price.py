@@ -1,8 +1,12 @@
 import streamlit as st
 import pandas as pd
 from data_viz.stock_price_viz import StockPriceViz 
+from data_viz.backtest_viz import BacktestViz
 from etl.catch_clean import request_data
-from screens.view_options import visualizations, view_list, date_interval
+from etl.data_layer import load_backtest_data
+from analytics.backtest import REBALANCING_FREQUENCIES, WEIGHTING_SCHEMES
+from analytics.optimization import COVARIANCE_METHODS
+from screens.view_options import visualizations, view_list, date_interval, normalization_options, chart_resolution
 
 
 def stock_price_screen(carteira: pd.DataFrame):
@@ -16,6 +20,9 @@ def stock_price_screen(carteira: pd.DataFrame):
     option_view = view_list()
     # Insert extra view
     option_view.insert(1, 'Candlestick')
+    option_view.append('Métricas de Risco')
+    option_view.append('Otimização de Carteira')
+    option_view.append('Backtest da Carteira')
     # Screen flow
     visualize_stocks = st.sidebar.multiselect('Stocks', carteira['código'].values, default='AMBEV S/A')
     selected_tickers = carteira[carteira['código'].isin(visualize_stocks)]['index'].tolist()
@@ -25,9 +32,21 @@ def stock_price_screen(carteira: pd.DataFrame):
         view = st.sidebar.selectbox('Gráfico', option_view)
         # Define date interval
         start_date, end_date = date_interval(view=view)
+        if view == 'Backtest da Carteira':
+            # Prices of the stored panel, nothing is downloaded
+            universe = st.sidebar.radio('Universo', ['Carteira teórica completa', 'Ações selecionadas'])
+            weighting = st.sidebar.selectbox('Pesos', WEIGHTING_SCHEMES.keys())
+            frequency = st.sidebar.selectbox('Rebalanceamento', REBALANCING_FREQUENCIES.keys())
+            panel, weights, benchmark = load_backtest_data()
+            tickers = weights.index.tolist() if universe == 'Carteira teórica completa' else selected_tickers
+            st.subheader('Backtest da Carteira')
+            BacktestViz(panel, weights, benchmark, start_date, end_date).portfolio_view(tickers, weighting, 
+                                                                                         frequency)
+            return
         # Download data from Yahoo Finance
         stock_data = request_data(selected_tickers, start_date)
-        stock_viz = StockPriceViz(stock_data, start_date, end_date, selected_tickers)
+        stock_viz = StockPriceViz(stock_data, start_date, end_date, selected_tickers, 
+                                  dataset=('precos', tuple(selected_tickers)))
         # This variable avoid unecessary view check inside visualization function
         check_other_options = True
         if view == 'Candlestick': 
@@ -35,17 +54,29 @@ def stock_price_screen(carteira: pd.DataFrame):
             # Show selected visualization
             st.subheader('Cotação de Preço')
             stock_viz.candlestick()
+        elif view == 'Métricas de Risco':
+            check_other_options = False
+            st.subheader('Métricas de Risco')
+            stock_viz.risk_metrics()
+        elif view == 'Otimização de Carteira':
+            check_other_options = False
+            method = st.sidebar.selectbox('Covariância', COVARIANCE_METHODS.keys())
+            max_weight = st.sidebar.number_input('Peso máximo por ação (%)', min_value=1, max_value=100, value=100)
+            st.subheader('Fronteira Eficiente')
+            stock_viz.optimization_view(method=COVARIANCE_METHODS[method], max_weight=max_weight / 100)
         elif view == 'Série Temporal':
             check_other_options = False
             normalization = st.sidebar.checkbox('Normalizar')
+            chart_points = chart_resolution()
             if normalization:
+                method, base_date = normalization_options(start_date)
                 st.subheader('Preço de Fechamento Normalizado')
-                stock_viz.normalize_time_series()
-                stock_viz.time_series()
+                stock_viz.normalize_time_series(method=method, base_date=base_date)
+                stock_viz.time_series(chart_points=chart_points)
                 stock_viz.normalized_metric()
             else:
                 st.subheader('Preço de Fechamento')
-                stock_viz.time_series()
+                stock_viz.time_series(chart_points=chart_points)
         # Other options
         visualizations(analyzer=stock_viz, view=view, check=check_other_options)
     else:
@@ -2,6 +2,12 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import timedelta, datetime
+from analytics.normalization import NORMALIZATION_OPTIONS
+from analytics.statistics import EXTRA_STATS
+from analytics.aggregation import AGGREGATION_PERIODS, AGGREGATION_FUNCTIONS
+from analytics.decomposition import DECOMPOSITION_MODELS, DECOMPOSITION_BACKENDS
+from analytics.correlation import CORRELATION_METHODS
+from analytics.downsampling import CHART_RESOLUTIONS
 
 
 def visualizations(analyzer: object, view: str, check: bool):
@@ -22,8 +28,10 @@ def visualizations(analyzer: object, view: str, check: bool):
     '''
     if check:
         if view == 'Sazonalidade e Tendência':
+            model = st.sidebar.selectbox('Modelo', DECOMPOSITION_MODELS.keys())
+            backend = st.sidebar.selectbox('Método', DECOMPOSITION_BACKENDS.keys())
             st.subheader('Sazonalidade e Tendência')
-            analyzer.serie_decomposition()
+            analyzer.serie_decomposition(model=DECOMPOSITION_MODELS[model], backend=DECOMPOSITION_BACKENDS[backend])
         elif view == 'Histograma':
             st.subheader('Distribuição')
             analyzer.histogram_view()
@@ -32,17 +40,22 @@ def visualizations(analyzer: object, view: str, check: bool):
             analyzer.boxplot_view()
         elif view == 'Barplot':
         # Aggregation options
-            function_dict = {'Soma': np.sum, 'Média': np.mean}
-            agg = st.selectbox('Período', ['Ano', 'Trimestre', 'Mês'])
-            function = st.selectbox('Função', function_dict.keys())
+            agg = st.selectbox('Período', AGGREGATION_PERIODS.keys())
+            function = st.selectbox('Função', AGGREGATION_FUNCTIONS.keys())
             st.subheader('Barplot')
-            analyzer.barplot_view(aggregation=agg, function=function_dict[function])
+            analyzer.barplot_view(aggregation=agg, function=AGGREGATION_FUNCTIONS[function])
         elif view == 'Estatística Descritiva':
+            extras = st.multiselect('Estatísticas adicionais', EXTRA_STATS.keys())
             st.subheader('Estatística Descritiva')
-            analyzer.descriptive_statistics()
+            analyzer.descriptive_statistics(extras=extras)
         elif view == 'Correlação Linear':
+            method = CORRELATION_METHODS[st.sidebar.selectbox('Correlação', CORRELATION_METHODS.keys())]
+            window = 12
+            if method != 'full':
+                window = int(st.sidebar.number_input('Janela (registros)', min_value=3, value=12, step=1))
+            pairs = int(st.sidebar.number_input('Pares', min_value=1, value=10, step=1))
             st.subheader('Correlação Linear')
-            analyzer.correlation()
+            analyzer.correlation(method=method, window=window, pairs=pairs)
 
 def view_list():
     '''
@@ -80,4 +93,34 @@ def date_interval(view: str):
     end_date = pd.to_datetime(st.sidebar.date_input('Data final', datetime.today()))
     
     return initial_date, end_date
-    
\ No newline at end of file
+
+
+def normalization_options(start_date):
+    '''
+    Select the base of the normalized time series
+
+    Parameters: start_date : Pandas datetime
+                    Initial date of the analysis, default of the base date
+
+    Returns: method : String
+                Normalization method of analytics.normalization
+             base_date : Pandas datetime
+                Base date when the method is 'date', otherwise None
+    '''
+    base = st.sidebar.selectbox('Base', NORMALIZATION_OPTIONS.keys())
+    method = NORMALIZATION_OPTIONS[base]
+    base_date = None
+    if method == 'date':
+        base_date = pd.to_datetime(st.sidebar.date_input('Data base', start_date))
+    return method, base_date
+
+
+def chart_resolution():
+    '''
+    Select the resolution of the time series charts
+
+    Returns: Integer
+                Points of the chart shared by its series, None for full resolution
+    '''
+    resolution = st.sidebar.selectbox('Resolução do gráfico', CHART_RESOLUTIONS.keys())
+    return CHART_RESOLUTIONS[resolution]